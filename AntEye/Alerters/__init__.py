@@ -2,15 +2,27 @@
 Alerters for AntEye
 """
 
-from .bulksms import BulkSMSAlerter
-from .execute import ExecuteAlerter
-from .fortysixelks import FortySixElksAlerter
-from .mail import EMailAlerter
-from .nc import NotificationCenterAlerter
-from .pushbullet import PushbulletAlerter
-from .pushover import PushoverAlerter
-from .ses import SESAlerter
-from .slack import SlackAlerter
-from .sns import SNSAlerter
-from .syslogger import SyslogAlerter
-from .telegram import TelegramAlerter
+from ..util import lazy_exports
+from .alerter import get_class
+
+# The individual modules are imported on demand by get_class() in
+# alerter.py; see the lazy type map there. Each name here is mapped to an
+# alerter type defined alongside it.
+_EXPORTS = {
+    "BulkSMSAlerter": "bulksms",
+    "ExecuteAlerter": "execute",
+    "FortySixElksAlerter": "46elks",
+    "EMailAlerter": "email",
+    "NotificationCenterAlerter": "nc",
+    "PushbulletAlerter": "pushbullet",
+    "PushoverAlerter": "pushover",
+    "SESAlerter": "ses",
+    "SlackAlerter": "slack",
+    "SNSAlerter": "sns",
+    "SyslogAlerter": "syslog",
+    "TelegramAlerter": "telegram",
+}
+
+__all__ = sorted(_EXPORTS)
+
+__getattr__ = lazy_exports(__name__, _EXPORTS, get_class)
@@ -59,8 +59,13 @@ class Alerter:
     name = None  # type: Optional[str]
 
     _ooh_failures = None  # type: Optional[List[str]]
+    # attributes which make up the run-time state of an alerter; these are
+    # saved to the state file along with the monitors' state
+    _state_attributes = ("_ooh_failures",)
     # subclasses should set this to true if they support catchup notifications for delays
     support_catchup = False
+    # what should_alert() last decided, so we can tell if an alert was sent
+    last_alert_type = AlertType.NONE
 
     def __init__(self, config_options: dict = None) -> None:
         if config_options is None:
@@ -163,6 +168,16 @@ class Alerter:
         if self._ooh_failures is None:
             self._ooh_failures = []
 
+    def get_state(self) -> dict:
+        """Get the run-time state of the alerter, for saving across restarts."""
+        return {k: getattr(self, k) for k in self._state_attributes}
+
+    def restore_state(self, state: dict) -> None:
+        """Restore run-time state previously returned by get_state()."""
+        for key in self._state_attributes:
+            if key in state:
+                setattr(self, key, state[key])
+
     def get_config_option(
         self, key: str, **kwargs: Any
     ) -> Union[None, str, int, float, bool, List[str], List[int]]:
@@ -206,6 +221,10 @@ class Alerter:
 
     def should_alert(self, monitor: Monitor) -> AlertType:
         """Check if we should bother alerting, and what type."""
+        self.last_alert_type = self._should_alert(monitor)
+        return self.last_alert_type
+
+    def _should_alert(self, monitor: Monitor) -> AlertType:
         out_of_hours = False
 
         if not self.available:
@@ -401,5 +420,21 @@ class Alerter:
 
 
 (register, get_class, all_types) = subclass_dict_handler(
-    "AntEye.Alerters.alerter", Alerter, "alerter_type"
+    "AntEye.Alerters.alerter",
+    Alerter,
+    "alerter_type",
+    lazy={
+        "46elks": "fortysixelks",
+        "bulksms": "bulksms",
+        "email": "mail",
+        "execute": "execute",
+        "nc": "nc",
+        "pushbullet": "pushbullet",
+        "pushover": "pushover",
+        "ses": "ses",
+        "slack": "slack",
+        "sns": "sns",
+        "syslog": "syslogger",
+        "telegram": "telegram",
+    },
 )
@@ -1,10 +1,9 @@
 # coding=utf-8
 import shlex
-import subprocess  # nosec
 from typing import Optional, cast
 
 from ..Monitors.monitor import Monitor
-from ..util import AlerterConfigurationError, format_datetime
+from ..util import AlerterConfigurationError, commands, format_datetime
 from .alerter import Alerter, AlertType, register
 
 
@@ -32,6 +31,15 @@ class ExecuteAlerter(Alerter):
             and self.catchup_command is None
         ):
             raise AlerterConfigurationError("execute alerter has no commands defined")
+        self.timeout = cast(
+            float,
+            self.get_config_option(
+                "timeout",
+                required_type="float",
+                minimum=0,
+                default=commands.DEFAULT_TIMEOUT,
+            ),
+        )
 
     def send_alert(self, name: str, monitor: Monitor) -> None:
         alert_type = self.should_alert(monitor)
@@ -75,7 +83,7 @@ class ExecuteAlerter(Alerter):
         if not self._dry_run:
             self.alerter_logger.debug("About to execute command: %s", command)
             try:
-                subprocess.call(shlex.split(command))  # nosec
+                commands.call(shlex.split(command), timeout=self.timeout)
                 self.alerter_logger.debug("Command has finished.")
             except Exception:
                 self.alerter_logger.exception(
@@ -2,7 +2,22 @@
 Loggers for AntEye
 """
 
-from .db import DBFullLogger, DBStatusLogger
-from .file import FileLogger
-from .mqtt import MQTTLogger
-from .network import Listener, NetworkLogger
+from ..util import lazy_exports
+from .logger import get_class
+
+# The individual modules are imported on demand by get_class() in
+# logger.py; see the lazy type map there. Each name here is mapped to a
+# logger type defined alongside it.
+_EXPORTS = {
+    "DBFullLogger": "db",
+    "DBStatusLogger": "dbstatus",
+    "FileLogger": "logfile",
+    "MQTTLogger": "mqtt",
+    "Listener": "network",
+    "NetworkLogger": "network",
+    "StatusAPILogger": "status_api",
+}
+
+__all__ = sorted(_EXPORTS)
+
+__getattr__ = lazy_exports(__name__, _EXPORTS, get_class)
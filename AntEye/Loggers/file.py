@@ -1,6 +1,11 @@
 # coding=utf-8
+import filecmp
+import gzip
 import json
+import logging
 import os
+import queue
+import re
 import shutil
 import socket
 import stat
@@ -9,25 +14,84 @@ import sys
 import tempfile
 import time
 from io import StringIO
-from typing import Any, List, Optional, TextIO, cast
+from threading import Thread
+from typing import Dict, List, Optional, Tuple, cast
 
 import arrow
 
 from ..Monitors.monitor import Monitor
-from ..util import format_datetime, short_hostname
+from ..util import commands, format_datetime, short_hostname
 from ..version import VERSION
 from .logger import Logger, register
 
+# matches the suffix we give rotated log files
+_ROTATED_SUFFIX = re.compile(r"^\.\d{8}-\d{6}(-\d+)?(\.gz)?$")
+
+
+class _LogRotator(Thread):
+    """Compress and prune rotated log files away from the main loop."""
+
+    def __init__(
+        self, filename: str, keep: int, compress: bool, logger: logging.Logger
+    ) -> None:
+        Thread.__init__(self, name="logfile-rotator")
+        self.daemon = True
+        self.filename = filename
+        self.keep = keep
+        self.compress = compress
+        self.logger = logger
+        self.queue = queue.Queue()  # type: queue.Queue
+
+    def run(self) -> None:
+        while True:
+            rotated = self.queue.get()
+            if rotated is None:
+                self.queue.task_done()
+                return
+            try:
+                if self.compress:
+                    with open(rotated, "rb") as file_input:
+                        with gzip.open(rotated + ".gz", "wb") as file_output:
+                            shutil.copyfileobj(file_input, file_output)
+                    os.unlink(rotated)
+                if self.keep:
+                    self.prune()
+            except OSError:
+                self.logger.exception("Error processing rotated log %s", rotated)
+            finally:
+                self.queue.task_done()
+
+    def prune(self) -> None:
+        """Delete all but the newest self.keep rotated files."""
+        folder, base = os.path.split(os.path.abspath(self.filename))
+        rotated = sorted(
+            x
+            for x in os.listdir(folder)
+            if x.startswith(base) and _ROTATED_SUFFIX.match(x[len(base) :])
+        )
+        for filename in rotated[: -self.keep]:
+            os.unlink(os.path.join(folder, filename))
+
+    def stop(self) -> None:
+        """Finish any rotated files already queued, then exit."""
+        self.queue.put(None)
+        self.join()
+
 
 @register
 class FileLogger(Logger):
-    """Log monitor status to a file."""
+    """Log monitor status to a file.
+
+    Within a batch, lines are collected and written with a single call at the
+    end, using one timestamp for the whole iteration."""
 
     logger_type = "logfile"
+    supports_batch = True
     filename = ""
     only_failures = False
     buffered = True
     dateformat = None
+    _rotator = None  # type: Optional[_LogRotator]
 
     def __init__(self, config_options: dict = None) -> None:
         if config_options is None:
@@ -37,6 +101,7 @@ class FileLogger(Logger):
             "filename", required=True, allow_empty=False
         )
         self.file_handle = open(self.filename, "a+")
+        self._opened_at = time.time()
 
         self.only_failures = self.get_config_option(
             "only_failures", required_type="bool", default=False
@@ -56,14 +121,63 @@ class FileLogger(Logger):
             ),
         )
 
-        self.file_handle.write(
-            "{} AntEye starting\n".format(self._get_datestring())
+        self.fsync_interval = cast(
+            int,
+            self.get_config_option(
+                "fsync_interval", required_type="int", minimum=0, default=0
+            ),
         )
-        if not self.buffered:
-            self.file_handle.flush()
+        self._last_fsync = time.time()
+
+        self.rotate_size = cast(
+            int,
+            self.get_config_option(
+                "rotate_size", required_type="int", minimum=0, default=0
+            ),
+        )
+        self.rotate_interval = cast(
+            int,
+            self.get_config_option(
+                "rotate_interval", required_type="int", minimum=0, default=0
+            ),
+        )
+        self.rotate_keep = cast(
+            int,
+            self.get_config_option(
+                "rotate_keep", required_type="int", minimum=0, default=0
+            ),
+        )
+        self.rotate_compress = cast(
+            bool,
+            self.get_config_option(
+                "rotate_compress", required_type="bool", default=False
+            ),
+        )
+        # we get __init__ called again on a config reload
+        self._stop_rotator()
+        if self.rotate_size or self.rotate_interval:
+            self._rotator = _LogRotator(
+                self.filename,
+                self.rotate_keep,
+                self.rotate_compress,
+                self.logger_logger,
+            )
+            self._rotator.start()
+
+        self._lines = []  # type: List[str]
+        self._datestring = None  # type: Optional[str]
+
+        self._write("{} AntEye starting\n".format(self._get_datestring()))
+
+    def _stop_rotator(self) -> None:
+        if self._rotator is not None:
+            self._rotator.stop()
+            self._rotator = None
 
     def __del__(self) -> None:
         self.file_handle.close()
+        if self._rotator is not None:
+            self._rotator.queue.put(None)
 
     def _get_datestring(self) -> str:
         if self.dateformat == "iso8601":
@@ -74,36 +188,91 @@ class FileLogger(Logger):
         if self.only_failures and monitor.virtual_fail_count() == 0:
             return
 
-        try:
-            if monitor.virtual_fail_count() > 0:
-                self.file_handle.write(
-                    "%s %s: failed since %s; VFC=%d (%s) (%0.3fs)"
-                    % (
-                        self._get_datestring(),
-                        name,
-                        format_datetime(monitor.first_failure_time(), self.tz),
-                        monitor.virtual_fail_count(),
-                        monitor.get_result(),
-                        monitor.last_run_duration,
-                    )
-                )
-            else:
-                self.file_handle.write(
-                    "%s %s: ok (%0.3fs)"
-                    % (self._get_datestring(), name, monitor.last_run_duration)
-                )
-            self.file_handle.write("\n")
+        datestring = self._datestring or self._get_datestring()
+        if monitor.virtual_fail_count() > 0:
+            line = "%s %s: failed since %s; VFC=%d (%s) (%0.3fs)\n" % (
+                datestring,
+                name,
+                format_datetime(monitor.first_failure_time(), self.tz),
+                monitor.virtual_fail_count(),
+                monitor.get_result(),
+                monitor.last_run_duration,
+            )
+        else:
+            line = "%s %s: ok (%0.3fs)\n" % (
+                datestring,
+                name,
+                monitor.last_run_duration,
+            )
+        if self.doing_batch:
+            self._lines.append(line)
+        else:
+            self._write(line)
+
+    def start_batch(self) -> None:
+        super().start_batch()
+        self._lines = []
+        self._datestring = self._get_datestring()
 
+    def process_batch(self) -> None:
+        if self._lines:
+            self._write("".join(self._lines))
+        self._lines = []
+        self._datestring = None
+
+    def _write(self, data: str) -> None:
+        """Write to the log, and flush/sync/rotate it as configured."""
+        try:
+            self.file_handle.write(data)
             if not self.buffered:
                 self.file_handle.flush()
+            if (
+                self.fsync_interval
+                and time.time() - self._last_fsync >= self.fsync_interval
+            ):
+                self.file_handle.flush()
+                os.fsync(self.file_handle.fileno())
+                self._last_fsync = time.time()
         except OSError:
             self.logger_logger.exception("Error writing to logfile %s", self.filename)
+            return
+        if self._rotator is not None:
+            if (self.rotate_size and self.file_handle.tell() >= self.rotate_size) or (
+                self.rotate_interval
+                and time.time() - self._opened_at >= self.rotate_interval
+            ):
+                self._rotate()
+
+    def _rotate(self) -> None:
+        """Move the log aside and start a new one.
+
+        Compressing and pruning old files happens in the rotator thread."""
+        rotated = "{}.{}".format(self.filename, time.strftime("%Y%m%d-%H%M%S"))
+        suffix = 1
+        while os.path.exists(rotated) or os.path.exists(rotated + ".gz"):
+            rotated = "{}.{}-{}".format(
+                self.filename, time.strftime("%Y%m%d-%H%M%S"), suffix
+            )
+            suffix += 1
+        try:
+            self.file_handle.close()
+            os.replace(self.filename, rotated)
+            self.file_handle = open(self.filename, "a+")
+            self._opened_at = time.time()
+        except OSError:
+            self.logger_logger.exception("Couldn't rotate log file %s", self.filename)
+            if self.file_handle.closed:
+                self.file_handle = open(self.filename, "a+")
+            return
+        if self._rotator is not None:
+            self._rotator.queue.put(rotated)
 
     def hup(self) -> None:
         """Close and reopen log file."""
         try:
             self.file_handle.close()
             self.file_handle = open(self.filename, "a+")
+            self._opened_at = time.time()
         except OSError:
             self.logger_logger.exception(
                 "Couldn't reopen log file %s after HUP", self.filename
@@ -113,12 +282,18 @@ class FileLogger(Logger):
         return "Writing log file to {0}".format(self.filename)
 
 
+_TEMPLATE_TOKENS = re.compile(
+    "_(NOW|HOST|COUNTS|TIMESTAMP|STATUS_BORDER|STATUS|VERSION|INTERVAL)_"
+)
+
+
 @register
 class HTMLLogger(Logger):
     """A batching logger which writes a simple HTML page of the current state."""
 
     logger_type = "html"
     supports_batch = True
+    supports_changes = False
     filename = ""
     count_data = ""
 
@@ -165,23 +340,96 @@ class HTMLLogger(Logger):
             str,
             self.get_config_option("upload_command", required=False, allow_empty=False),
         )
+        self.upload_timeout = cast(
+            float,
+            self.get_config_option(
+                "upload_timeout",
+                required_type="float",
+                minimum=0,
+                default=commands.DEFAULT_TIMEOUT,
+            ),
+        )
         self._resource_files = ["style.css"]  # type: List[str]
         self._my_host = short_hostname()
         self.status = ""
         self.header_class = ""
+        # monitor name -> (state key, row before downtime cell, row after it)
+        self._row_cache = {}  # type: Dict[str, Tuple[tuple, str, str]]
+        # template filename -> template split into literal text and token names
+        self._templates = {}  # type: Dict[str, List[str]]
+        self._load_templates()
+
+    def _load_templates(self) -> None:
+        """Read the header and footer templates and split them on their tokens."""
+        self._templates = {}
+        for template in (self.header, self.footer):
+            try:
+                with open(
+                    os.path.join(self.source_folder, template), "r"
+                ) as file_input:
+                    self._templates[template] = _TEMPLATE_TOKENS.split(
+                        file_input.read()
+                    )
+            except OSError:
+                self.logger_logger.exception(
+                    "Couldn't read HTML template %s from %s",
+                    template,
+                    self.source_folder,
+                )
+
+    def hup(self) -> None:
+        """Reload the templates."""
+        self._load_templates()
 
     def _make_html_row(self, name: str, entry: dict) -> str:
-        row = ""
-        row_class = ""
-        cell_class = ""
+        """Render a table row for a monitor.
+
+        Only the downtime and age cells change from one iteration to the next
+        while a monitor's state is steady, so the rest of the row is cached and
+        rebuilt only when the state changes."""
         if entry["age"] > entry["gap"] + 60:
             status = "OLD"
-            cell_class = "table-warning"
         elif entry["status"]:
             status = "OK"
-            cell_class = "table-success"
         else:
             status = "FAIL"
+        key = (
+            status,
+            entry["description"],
+            entry["host"],
+            entry["fail_time"],
+            entry["fail_count"],
+            entry["fail_data"],
+            entry["failures"],
+            entry["last_failure"],
+        )
+        cached = self._row_cache.get(name)
+        if cached is None or cached[0] != key:
+            cached = (key,) + self._make_html_row_parts(name, entry, status)
+            self._row_cache[name] = cached
+        row = (
+            cached[1]
+            + f'<td>{entry["downtime"]} '
+            f'(<span data-toggle="tooltip" data-placement="right" title="{entry["availability"] * 100:0.5f}%">{entry["availability"] * 100:0.2f}%</span>)'
+            "</td>" + cached[2]
+        )
+        if entry["host"] == self._my_host:
+            row = row + "<td></td>"
+        else:
+            row = row + f'<td>{entry["age"]}</td>'
+        return row + "</tr>\n"
+
+    def _make_html_row_parts(
+        self, name: str, entry: dict, status: str
+    ) -> Tuple[str, str]:
+        """Render the parts of a row either side of the downtime cell."""
+        row_class = ""
+        cell_class = ""
+        if status == "OLD":
+            cell_class = "table-warning"
+        elif status == "OK":
+            cell_class = "table-success"
+        else:
             row_class = "table-danger"
         try:
             monitor_name = name.split("/")[1]
@@ -207,26 +455,16 @@ class HTMLLogger(Logger):
             row = row + "<td></td>"
         else:
             row = row + f'<td>{entry["fail_count"]}</td>'
-        row = row + (
-            f'<td>{entry["downtime"]} '
-            f'(<span data-toggle="tooltip" data-placement="right" title="{entry["availability"] * 100:0.5f}%">{entry["availability"] * 100:0.2f}%</span>)'
-            "</td>"
-        )
-        row = row + f'<td>{entry["fail_data"]}</td>'
 
+        tail = f'<td>{entry["fail_data"]}</td>'
         if entry["failures"] == 0:
-            row = row + "<td></td><td></td>"
+            tail = tail + "<td></td><td></td>"
         else:
-            row = row + (
+            tail = tail + (
                 f'<td>{entry["failures"]}</td>'
                 f'<td>{format_datetime(entry["last_failure"], self.tz)}</td>'
             )
-        if entry["host"] == self._my_host:
-            row = row + "<td></td>"
-        else:
-            row = row + f'<td>{entry["age"]}</td>'
-        row = row + "</tr>\n"
-        return row
+        return (row, tail)
 
     def save_result2(self, name: str, monitor: Monitor) -> None:
         if not self.doing_batch:
@@ -292,6 +530,11 @@ class HTMLLogger(Logger):
         old_count = 0
         remote_count = 0
 
+        if len(self._templates) < 2:
+            self._load_templates()
+            if len(self._templates) < 2:
+                return
+
         try:
             temp_file = tempfile.mkstemp()
             file_handle = os.fdopen(temp_file[0], "w")
@@ -307,9 +550,7 @@ class HTMLLogger(Logger):
 
         if self.batch_data is None:
             return
-        keys = list(self.batch_data.keys())
-        keys.sort()
-        for entry in keys:
+        for entry in sorted(self.batch_data):
             this_entry = self.batch_data[entry]
             output = output_ok
             if this_entry["age"] > this_entry["gap"] + 60:
@@ -349,14 +590,15 @@ class HTMLLogger(Logger):
             ]
         )
 
-        with open(os.path.join(self.source_folder, self.header), "r") as file_input:
-            file_handle.writelines(self.parse_file(file_input))
+        if len(self._row_cache) > len(self.batch_data):
+            for name in [x for x in self._row_cache if x not in self.batch_data]:
+                del self._row_cache[name]
 
+        template_values = self._template_values()
+        file_handle.write(self._render_template(self.header, template_values))
         file_handle.write(output_fail.getvalue())
         file_handle.write(output_ok.getvalue())
-
-        with open(os.path.join(self.source_folder, self.footer), "r") as file_input:
-            file_handle.writelines(self.parse_file(file_input))
+        file_handle.write(self._render_template(self.footer, template_values))
 
         try:
             file_handle.flush()
@@ -371,82 +613,75 @@ class HTMLLogger(Logger):
                 return
             shutil.move(file_name, os.path.join(self.folder, self.filename))
             if self.copy_resources:
-                for filename in self._resource_files:
-                    shutil.copy(os.path.join(self.source_folder, filename), self.folder)
+                self._copy_resources()
         except OSError:
             self.logger_logger.exception(
                 "problem closing/moving temporary file for HTML output"
             )
         if self.upload_command:
             try:
-                subprocess.run(self.upload_command.split(" "), check=True)  # nosec
-            except subprocess.SubprocessError:
+                returncode = commands.call(
+                    self.upload_command.split(" "), timeout=self.upload_timeout
+                )
+                if returncode:
+                    raise subprocess.CalledProcessError(returncode, self.upload_command)
+            except (subprocess.SubprocessError, OSError):
                 self.logger_logger.exception(
                     "Failed to run upload command for HTML files"
                 )
 
-    def parse_file(self, file_handle: TextIO) -> List[str]:
-        """Process a file an substitute in template values."""
-        lines = []  # type: List[str]
-        for line in file_handle:
-            line = line.replace("_NOW_", format_datetime(arrow.now(), self.tz))
-            line = line.replace("_HOST_", socket.gethostname())
-            line = line.replace("_COUNTS_", self.count_data)
-            line = line.replace("_TIMESTAMP_", str(arrow.now().timestamp))
-            line = line.replace("_STATUS_BORDER_", self.header_class)
-            line = line.replace("_STATUS_", self.status)
-            line = line.replace("_VERSION_", VERSION)
-            if self._global_info:
-                line = line.replace(
-                    "_INTERVAL_", str(max(30, self._global_info["interval"]))
-                )
-            else:
-                line = line.replace("_INTERVAL_", "30")
-            lines.append(line)
-        return lines
+    def _copy_resources(self) -> None:
+        """Copy the supporting files to the output folder if they changed.
+
+        copy2() keeps the modification time, so the usual case is settled by
+        comparing the stat() results."""
+        for filename in self._resource_files:
+            source = os.path.join(self.source_folder, filename)
+            destination = os.path.join(self.folder, filename)
+            if os.path.exists(destination) and filecmp.cmp(source, destination):
+                continue
+            shutil.copy2(source, destination)
+
+    def _template_values(self) -> Dict[str, str]:
+        """Get the values to substitute into the templates."""
+        if self._global_info:
+            interval = str(max(30, self._global_info["interval"]))
+        else:
+            interval = "30"
+        return {
+            "NOW": format_datetime(arrow.now(), self.tz),
+            "HOST": socket.gethostname(),
+            "COUNTS": self.count_data,
+            "TIMESTAMP": str(arrow.now().timestamp),
+            "STATUS_BORDER": self.header_class,
+            "STATUS": self.status,
+            "VERSION": VERSION,
+            "INTERVAL": interval,
+        }
+
+    def _render_template(self, template: str, values: Dict[str, str]) -> str:
+        """Substitute values into a loaded template."""
+        parts = list(self._templates[template])
+        # the split leaves the token names at the odd indices
+        parts[1::2] = [values[token] for token in parts[1::2]]
+        return "".join(parts)
 
     def describe(self) -> str:
         return "Writing HTML page to {0}".format(self.filename)
 
 
-class MonitorResult(object):
-    """Represent the current status of a Monitor."""
-
-    def __init__(self) -> None:
-        self.virtual_fail_count = 0
-        self.result = None  # type: Optional[str]
-        self.first_failure_time = None  # type: Optional[str]
-        self.last_run_duration = None  # type: Optional[int]
-        self.status = "Fail"
-        self.dependencies = []  # type: List[str]
-
-    def json_representation(self) -> dict:
-        return self.__dict__
-
-
-class MonitorJsonPayload(object):
-    def __init__(self) -> None:
-        self.generated = None  # type: Optional[str]
-        self.monitors = {}  # type: dict
-
-    def json_representation(self) -> dict:
-        return self.__dict__
-
-
-class PayloadEncoder(json.JSONEncoder):
-    def default(self, o: Any) -> Any:
-        if hasattr(o, "json_representation"):
-            return o.json_representation()
-        return json.JSONEncoder.default(self, o.__dict__)
-
-
 @register
 class JsonLogger(Logger):
-    """Write monitor status to a JSON file."""
+    """Write monitor status to a JSON file.
+
+    The file is written to a temporary file alongside it and renamed into place,
+    so readers never see a partial file. Optionally, every result is also
+    appended to a newline-delimited JSON history file."""
 
     logger_type = "json"
     filename = ""  # type: str
     supports_batch = True
+    supports_changes = False
 
     def __init__(self, config_options: dict = None) -> None:
         if config_options is None:
@@ -455,39 +690,113 @@ class JsonLogger(Logger):
         self.filename = self.get_config_option(
             "filename", required=True, allow_empty=False
         )
+        self.compact = cast(
+            bool, self.get_config_option("compact", required_type="bool", default=False)
+        )
+        self.history_file = cast(
+            Optional[str], self.get_config_option("history_file", allow_empty=False)
+        )
+        self.history_max_size = cast(
+            int,
+            self.get_config_option(
+                "history_max_size", required_type="int", minimum=0, default=0
+            ),
+        )
+        self.history_keep = cast(
+            int,
+            self.get_config_option(
+                "history_keep", required_type="int", minimum=1, default=5
+            ),
+        )
 
     def save_result2(self, name: str, monitor: Monitor) -> None:
         if self.batch_data is None:
             self.batch_data = {}
-        result = MonitorResult()
-        result.first_failure_time = format_datetime(monitor.first_failure_time())
-        result.virtual_fail_count = monitor.virtual_fail_count()
-        result.last_run_duration = monitor.last_run_duration
-        result.result = monitor.get_result()
-        if hasattr(monitor, "was_skipped") and monitor.was_skipped:
-            result.status = "Skipped"
+        if monitor.was_skipped:
+            status = "Skipped"
         elif monitor.virtual_fail_count() <= 0:
-            result.status = "OK"
-        result.dependencies = monitor.dependencies
-
-        self.batch_data[name] = result
+            status = "OK"
+        else:
+            status = "Fail"
+        self.batch_data[name] = {
+            "virtual_fail_count": monitor.virtual_fail_count(),
+            "result": monitor.get_result(),
+            "first_failure_time": format_datetime(monitor.first_failure_time()),
+            "last_run_duration": monitor.last_run_duration,
+            "status": status,
+            "dependencies": monitor.dependencies,
+        }
 
     def process_batch(self) -> None:
-        payload = MonitorJsonPayload()
-        payload.generated = format_datetime(arrow.now())
         if self.batch_data is not None:
-            payload.monitors = self.batch_data
-
-            with open(self.filename, "w") as outfile:
-                json.dump(
-                    payload,
-                    outfile,
-                    indent=4,
-                    separators=(",", ":"),
-                    ensure_ascii=False,
-                    cls=PayloadEncoder,
-                )
+            generated = format_datetime(arrow.now())
+            self._write_status(generated)
+            if self.history_file:
+                self._write_history(generated)
         self.batch_data = {}
 
+    def _write_status(self, generated: str) -> None:
+        """Atomically replace the JSON file with the current state."""
+        payload = {"generated": generated, "monitors": self.batch_data}
+        if self.compact:
+            data = json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+        else:
+            data = json.dumps(
+                payload, indent=4, separators=(",", ":"), ensure_ascii=False
+            )
+        temp_name = None
+        try:
+            (temp_fd, temp_name) = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(self.filename)),
+                prefix=".",
+                suffix=".tmp",
+            )
+            with os.fdopen(temp_fd, "w", encoding="utf-8") as file_handle:
+                file_handle.write(data)
+            os.chmod(
+                temp_name, stat.S_IREAD | stat.S_IWRITE | stat.S_IRGRP | stat.S_IROTH
+            )
+            os.replace(temp_name, self.filename)
+        except OSError:
+            self.logger_logger.exception("Couldn't write JSON file %s", self.filename)
+            if temp_name is not None and os.path.exists(temp_name):
+                os.unlink(temp_name)
+
+    def _write_history(self, generated: str) -> None:
+        """Append one JSON line per monitor to the history file."""
+        if self.batch_data is None or self.history_file is None:
+            return
+        lines = [
+            json.dumps(
+                dict(data, name=name, generated=generated),
+                separators=(",", ":"),
+                ensure_ascii=False,
+            )
+            for name, data in self.batch_data.items()
+        ]
+        try:
+            self._rotate_history()
+            with open(self.history_file, "a", encoding="utf-8") as file_handle:
+                file_handle.write("\n".join(lines) + "\n")
+        except OSError:
+            self.logger_logger.exception(
+                "Couldn't write JSON history file %s", self.history_file
+            )
+
+    def _rotate_history(self) -> None:
+        """Rotate the history file to .1, .2 etc if it has grown too large."""
+        if not self.history_max_size or self.history_file is None:
+            return
+        try:
+            if os.path.getsize(self.history_file) < self.history_max_size:
+                return
+        except FileNotFoundError:
+            return
+        for index in range(self.history_keep - 1, 0, -1):
+            older = "{}.{}".format(self.history_file, index)
+            if os.path.exists(older):
+                os.replace(older, "{}.{}".format(self.history_file, index + 1))
+        os.replace(self.history_file, self.history_file + ".1")
+
     def describe(self) -> str:
         return "Writing JSON file to {0}".format(self.filename)
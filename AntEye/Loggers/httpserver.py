@@ -0,0 +1,87 @@
+# coding=utf-8
+
+"""
+The HTTP server shared by the loggers which answer requests themselves
+"""
+
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Any, Callable, Optional, Tuple, cast
+
+from .logger import Logger
+
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    """Answers each request in a thread of its own."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self, address: Tuple[str, int], handler: Any, logger: logging.Logger
+    ) -> None:
+        self.logger = logger
+        HTTPServer.__init__(self, address, handler)
+
+
+class LoggingHandler(BaseHTTPRequestHandler):
+    """A request handler which logs requests to its server's logger."""
+
+    server_version = "AntEye"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        cast(ThreadedHTTPServer, self.server).logger.debug(
+            "%s: %s", self.address_string(), format % args
+        )
+
+
+class HTTPServerLogger(Logger):
+    """Base for loggers which serve HTTP from a thread of their own, on their
+    bind_host and port options."""
+
+    _server = None  # type: Optional[ThreadedHTTPServer]
+
+    def __init__(self, config_options: dict) -> None:
+        super().__init__(config_options)
+        self.port = cast(
+            int,
+            self.get_config_option(
+                "port", required_type="int", required=True, minimum=0, maximum=65535
+            ),
+        )
+        self.bind_host = cast(
+            str, self.get_config_option("bind_host", default="127.0.0.1")
+        )
+        # we get __init__ called again on a config reload
+        self._stop_server()
+
+    def _start_server(
+        self, make_server: Callable[[Tuple[str, int]], ThreadedHTTPServer]
+    ) -> None:
+        """Listen, with the server make_server returns for our address."""
+        try:
+            self._server = make_server((self.bind_host, self.port))
+        except OSError:
+            self.logger_logger.exception(
+                "Unable to listen on %s:%d", self.bind_host, self.port
+            )
+            return
+        self.port = self._server.server_address[1]
+        thread = threading.Thread(
+            target=self._server.serve_forever,
+            name="{}-{}".format(self.logger_type, self.name),
+        )
+        thread.daemon = True
+        thread.start()
+
+    def _stop_server(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __del__(self) -> None:
+        self._stop_server()
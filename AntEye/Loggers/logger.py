@@ -7,10 +7,12 @@ Loggers process every monitor, every iteration, to record their state in some fa
 
 
 import logging
+import time
 from typing import Any, Dict, List, Optional, cast
 
 from ..Monitors.monitor import Monitor
 from ..util import LoggerConfigurationError, get_config_option, subclass_dict_handler
+from ..util.metrics import REGISTRY
 
 
 class Logger:
@@ -19,6 +21,12 @@ class Logger:
     logger_type = "unknown"
 
     supports_batch = False
+    # set to False for loggers which need every monitor every time (e.g. because
+    # they write a complete snapshot), so cannot use mode = changes
+    supports_changes = True
+    # set to True for loggers which expose the internal metrics, which are only
+    # collected when such a logger is configured
+    uses_metrics = False
     doing_batch = False
     batch_data = None  # type: Optional[Dict[str, Any]]
     connected = True
@@ -41,9 +49,30 @@ class Logger:
         self.tz = cast(Optional[str], self.get_config_option("tz", default="UTC"))
         if self._global_info is None:
             self._global_info = {}
+        self._mode = cast(
+            str,
+            self.get_config_option(
+                "mode", allowed_values=["all", "changes"], default="all"
+            ),
+        )
+        if self._mode == "changes" and not self.supports_changes:
+            raise LoggerConfigurationError(
+                "{} loggers do not support mode = changes".format(self.logger_type)
+            )
+        # how often (in seconds) to log every monitor anyway in changes mode
+        self._changes_refresh = cast(
+            int,
+            self.get_config_option(
+                "changes_refresh", required_type="int", minimum=0, default=3600
+            ),
+        )
+        self._fingerprints = {}  # type: Dict[str, int]
+        self._last_refresh = 0.0
+        self._full_refresh = True
 
     def __enter__(self) -> None:
         """Context manager entry."""
+        self._check_refresh()
         self.start_batch()
 
     def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
@@ -69,6 +98,48 @@ class Logger:
         This should be overridden where needed."""
         return  # pragma: no cover
 
+    def _check_refresh(self) -> None:
+        """Decide if this pass should log every monitor regardless of changes."""
+        if self._mode != "changes":
+            return
+        now = time.time()
+        if self._last_refresh == 0:
+            self._full_refresh = True
+        elif self._changes_refresh:
+            self._full_refresh = now - self._last_refresh >= self._changes_refresh
+        else:
+            self._full_refresh = False
+        if self._full_refresh:
+            # also forgets monitors which have since gone away
+            self._fingerprints = {}
+            self._last_refresh = now
+
+    @staticmethod
+    def state_fingerprint(monitor: Monitor) -> int:
+        """Hash the parts of a monitor's state which count as a change."""
+        return hash(
+            (
+                monitor.state(),
+                monitor.test_success(),
+                monitor.was_skipped,
+                monitor.running_on,
+            )
+        )
+
+    def should_log(self, name: str, monitor: Monitor) -> bool:
+        """Check if a monitor should be passed to save_result2() this time.
+
+        In the default mode this is always True. With mode = changes, it is only
+        True if the monitor's state changed since we last logged it, or if a full
+        refresh is due."""
+        if self._mode != "changes":
+            return True
+        fingerprint = self.state_fingerprint(monitor)
+        if not self._full_refresh and self._fingerprints.get(name) == fingerprint:
+            return False
+        self._fingerprints[name] = fingerprint
+        return True
+
     def save_result2(self, name: str, monitor: Monitor) -> None:
         """Record a result.
 
@@ -117,7 +188,14 @@ class Logger:
             return
         if not self.doing_batch:
             self.logger_logger.error("ending a batch when one wasn't in progress")
+        start = time.perf_counter()
         self.process_batch()
+        REGISTRY.observe(
+            "anteye_logger_batch_seconds",
+            time.perf_counter() - start,
+            logger=self.name,
+            type=self.logger_type,
+        )
         self.doing_batch = False
 
     def process_batch(self) -> None:
@@ -136,5 +214,18 @@ class Logger:
 
 
 (register, get_class, all_types) = subclass_dict_handler(
-    "AntEye.Loggers.logger", Logger, "logger_type"
+    "AntEye.Loggers.logger",
+    Logger,
+    "logger_type",
+    lazy={
+        "db": "db",
+        "dbstatus": "db",
+        "html": "file",
+        "json": "file",
+        "logfile": "file",
+        "mqtt": "mqtt",
+        "network": "network",
+        "prometheus": "prometheus",
+        "status_api": "status",
+    },
 )
@@ -8,24 +8,40 @@
 # contact: dev@swtk.info
 
 try:
-    import paho.mqtt.publish
+    import paho.mqtt.client
 
     mqtt_available = True
 except ImportError:
     mqtt_available = False
 import json
-from typing import List, cast
+from typing import Any, Dict, Set, cast
 
 from ..Monitors.monitor import Monitor
 from .logger import Logger, register
 
 
+def _make_client(client_id: str) -> Any:
+    """Create a paho client, coping with the callback API change in paho 2.0."""
+    callback_api = getattr(paho.mqtt.client, "CallbackAPIVersion", None)
+    if callback_api is not None:
+        return paho.mqtt.client.Client(callback_api.VERSION2, client_id=client_id)
+    return paho.mqtt.client.Client(client_id=client_id)
+
+
 @register
 class MQTTLogger(Logger):
+    """Send monitor state to an MQTT broker.
+
+    A single client connection is kept open for the lifetime of the logger;
+    paho's network thread takes care of reconnecting if the broker goes away.
+    States are collected during the batch and only published when they change."""
+
     logger_type = "mqtt"
+    supports_batch = True
     only_failures = False
     buffered = False
     dateformat = None
+    client = None  # type: Any
 
     def __init__(self, config_options: dict = None) -> None:
         if config_options is None:
@@ -81,76 +97,139 @@ class MQTTLogger(Logger):
         self.password = cast(
             str, self.get_config_option("password", required=False, allow_empty=True,),
         )
-
-        if self.username and self.password:
-            self.auth = {"username": self.username, "password": self.password}
-        else:
-            self.auth = {}
+        self.keepalive = cast(
+            int,
+            self.get_config_option(
+                "keepalive", required_type="int", minimum=5, default=60
+            ),
+        )
 
         # registry of monitors which registered with HA
         # not used if not Home Assistant context
         # also see
         # https://github.com/jamesoff/AntEye/issues/236#issuecomment-462481900
         # for rationale
-        self.registered = []  # type: List[str]
+        self.registered = set()  # type: Set[str]
+        # last state successfully published for each monitor, so we only send
+        # retained messages when something actually changed
+        self._published = {}  # type: Dict[str, str]
 
-    def save_result2(self, name: str, monitor: Monitor) -> None:
-        # check if monitor registred with HA
-        if self.hass:
-            if monitor.name not in self.registered:
-                try:
-                    paho.mqtt.publish.single(
-                        "{root}/AntEye_{monitor}/config".format(
-                            root=self.topic, monitor=monitor.name
-                        ),
-                        payload=json.dumps({"name": monitor.name}),
-                        retain=True,
-                        hostname=self.host,
-                        auth=self.auth,
-                        client_id="AntEye_{monitor}".format(
-                            monitor=monitor.name
-                        ),
-                    )
-                except Exception as e:
-                    self.logger_logger.error(
-                        "cannot send %s to MQTT: %s", monitor.name, e
-                    )
-                else:
-                    self.registered.append(monitor.name)
-                    self.logger_logger.debug(
-                        "registered %s in MQTT", device=monitor.name
-                    )
+        self._connect()
 
-        if self.only_failures and monitor.virtual_fail_count() == 0:
+    def _connect(self) -> None:
+        """(Re)create our client and start its network thread.
+
+        This is also called when the config is reloaded, so tear down any
+        existing client first."""
+        self._disconnect()
+        self._forget_published()
+        self.client = _make_client("AntEye_{}".format(self.name))
+        self.client.on_connect = self._on_connect
+        if self.username and self.password:
+            self.client.username_pw_set(self.username, self.password)
+        self.client.reconnect_delay_set(min_delay=1, max_delay=60)
+        try:
+            self.client.connect_async(self.host, self.port, self.keepalive)
+        except Exception as e:
+            self.logger_logger.error(
+                "cannot connect to MQTT broker %s:%d: %s", self.host, self.port, e
+            )
+        self.client.loop_start()
+
+    def _forget_published(self) -> None:
+        """Forget what we've sent, so it's all sent again; the broker may not
+        have kept it."""
+        self.registered = set()
+        self._published = {}
+
+    def _on_connect(self, *_args: Any) -> None:
+        # called from paho's network thread on every (re)connection, e.g.
+        # after the broker restarts
+        self._forget_published()
+
+    def _disconnect(self) -> None:
+        if self.client is None:
             return
+        try:
+            self.client.disconnect()
+            self.client.loop_stop()
+        except Exception:
+            self.logger_logger.exception("error disconnecting from MQTT broker")
+        self.client = None
+
+    def __del__(self) -> None:
+        self._disconnect()
 
+    def _publish(self, topic: str, payload: str) -> bool:
+        """Publish a retained message, returning True if paho accepted it."""
+        if self.client is None:
+            return False
+        try:
+            info = self.client.publish(topic, payload=payload, retain=True)
+        except Exception as e:
+            self.logger_logger.error("cannot send %s to %s: %s", payload, topic, e)
+            return False
+        if info.rc != paho.mqtt.client.MQTT_ERR_SUCCESS:
+            self.logger_logger.error(
+                "cannot send %s to %s: %s",
+                payload,
+                topic,
+                paho.mqtt.client.error_string(info.rc),
+            )
+            return False
+        return True
+
+    def _state_topic(self, name: str) -> str:
         if self.hass:
-            topic = "{root}/AntEye_{monitor}/state".format(
-                root=self.topic, monitor=monitor.name
+            return "{root}/AntEye_{monitor}/state".format(
+                root=self.topic, monitor=name
             )
-        else:
-            topic = "{root}/{monitor}".format(root=self.topic, monitor=monitor.name)
+        return "{root}/{monitor}".format(root=self.topic, monitor=name)
+
+    def save_result2(self, name: str, monitor: Monitor) -> None:
+        if not self.doing_batch:  # pragma: no cover
+            self.logger_logger.error(
+                "MQTTLogger.save_result2() called while not doing batch."
+            )
+            return
+        if self.batch_data is None:
+            self.batch_data = {}
+        if self.only_failures and monitor.virtual_fail_count() == 0:
+            return
         self.logger_logger.debug(
             "%s failed %d times", monitor.name, monitor.virtual_fail_count()
         )
-        payload = (
+        self.batch_data[monitor.name] = (
             "ON"
             if monitor.virtual_fail_count() == 0 and not monitor.was_skipped
             else "OFF"
         )
-        try:
-            paho.mqtt.publish.single(
-                topic,
-                payload=payload,
-                retain=True,
-                hostname=self.host,
-                auth=self.auth,
-                client_id="AntEye_{monitor}".format(monitor=monitor.name),
-            )
-        except Exception as e:
-            self.logger_logger.error("cannot send state %s to %s %s", payload, topic, e)
-        else:
-            self.logger_logger.debug("state %s sent to %s", payload, topic)
+
+    def process_batch(self) -> None:
+        """Publish any changed states over our persistent connection."""
+        if self.batch_data is None or self.client is None:
+            return
+        sent = 0
+        for name, payload in self.batch_data.items():
+            # check if monitor registred with HA
+            if self.hass and name not in self.registered:
+                if self._publish(
+                    "{root}/AntEye_{monitor}/config".format(
+                        root=self.topic, monitor=name
+                    ),
+                    json.dumps({"name": name}),
+                ):
+                    self.registered.add(name)
+                    self.logger_logger.debug("registered %s in MQTT", name)
+            if self._published.get(name) == payload:
+                continue
+            if self._publish(self._state_topic(name), payload):
+                self._published[name] = payload
+                sent += 1
+        self.logger_logger.debug(
+            "sent %d of %d states to MQTT", sent, len(self.batch_data)
+        )
+        self.batch_data = {}
 
     def describe(self) -> str:
         return "Sends monitoring status to a MQTT broker"
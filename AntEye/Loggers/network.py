@@ -9,6 +9,7 @@ import logging
 import pickle  # nosec
 import socket
 import struct
+import time
 from json import JSONDecodeError
 from threading import Thread
 from typing import Any, cast
@@ -16,6 +17,7 @@ from typing import Any, cast
 from ..Monitors.monitor import Monitor
 from ..util import LoggerConfigurationError
 from ..util.json_encoding import json_dumps, json_loads
+from ..util.metrics import REGISTRY
 from .logger import Logger, register
 
 # From the docs:
@@ -32,6 +34,7 @@ class NetworkLogger(Logger):
 
     logger_type = "network"
     supports_batch = True
+    supports_changes = False
 
     def __init__(self, config_options: dict) -> None:
         super().__init__(config_options)
@@ -156,6 +159,7 @@ class Listener(Thread):
                     serialized += data
                 conn.close()
                 self.logger.debug("Finished receiving from %s", addr[0])
+                REGISTRY.inc("anteye_listener_bytes_total", len(serialized))
                 try:
                     # first byte is the size of the MAC
                     mac_size = serialized[0]
@@ -190,7 +194,13 @@ class Listener(Thread):
                     result = json_loads(serialized)
                 except JSONDecodeError:
                     result = pickle.loads(serialized)  # nosec
+                start = time.perf_counter()
                 self.AntEye.update_remote_monitor(result, addr[0])
+                REGISTRY.observe(
+                    "anteye_listener_ingest_seconds", time.perf_counter() - start
+                )
+                REGISTRY.inc("anteye_listener_batches_total")
+                REGISTRY.inc("anteye_listener_monitors_total", len(result))
             except socket.error as exception:
                 if exception.errno == 4:
                     # Interrupted system call
@@ -202,4 +212,5 @@ class Listener(Thread):
                 if self.running:
                     self.logger.exception("Socket error caught in thread")
             except Exception:  # pylint: disable=broad-except
+                REGISTRY.inc("anteye_listener_errors_total")
                 self.logger.exception("Listener thread caught exception")
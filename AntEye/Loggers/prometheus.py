@@ -0,0 +1,132 @@
+# coding=utf-8
+
+"""
+An HTTP endpoint serving monitor state and AntEye's internal timings for
+Prometheus to scrape
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple, cast
+
+from ..Monitors.monitor import Monitor
+from ..util.metrics import REGISTRY, Labels, render_metric
+from .httpserver import HTTPServerLogger, LoggingHandler, ThreadedHTTPServer
+from .logger import register
+
+_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# (name, help, function giving the value for a monitor)
+_GAUGES = [
+    (
+        "anteye_monitor_ok",
+        "1 if the monitor passed (or failed within its tolerance), else 0.",
+        lambda m: int(m.virtual_fail_count() == 0 and not m.was_skipped),
+    ),
+    (
+        "anteye_monitor_skipped",
+        "1 if the monitor was skipped, else 0.",
+        lambda m: int(bool(m.was_skipped)),
+    ),
+    (
+        "anteye_monitor_virtual_fail_count",
+        "Failures past the monitor's tolerance.",
+        lambda m: m.virtual_fail_count(),
+    ),
+    (
+        "anteye_monitor_last_run_duration_seconds",
+        "Time taken by the monitor's last test.",
+        lambda m: m.last_run_duration,
+    ),
+]
+
+
+_VALUE_METRIC = "anteye_monitor_value"
+_VALUE_DESCRIPTION = "The figures behind a monitor's result, e.g. bytes free, by name."
+
+# monitor name -> (labels, gauge values, the monitor's own values)
+Snapshot = Dict[str, Tuple[Labels, List[float], Dict[str, float]]]
+
+
+def render_gauges(snapshot: Snapshot) -> List[str]:
+    lines = []  # type: List[str]
+    for (index, (metric, description, _)) in enumerate(_GAUGES):
+        samples = {labels: gauges[index] for (labels, gauges, _) in snapshot.values()}
+        lines.extend(render_metric(metric, "gauge", description, samples))
+    samples = {
+        labels + (("name", key),): value
+        for (labels, _, values) in snapshot.values()
+        for (key, value) in values.items()
+    }
+    if samples:
+        lines.extend(render_metric(_VALUE_METRIC, "gauge", _VALUE_DESCRIPTION, samples))
+    return lines
+
+
+class _MetricsHandler(LoggingHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] not in ["/", "/metrics"]:
+            self.send_error(404)
+            return
+        lines = render_gauges(cast(_MetricsServer, self.server).snapshot)
+        lines.extend(REGISTRY.render())
+        body = ("\n".join(lines) + "\n").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", _CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _MetricsServer(ThreadedHTTPServer):
+    def __init__(self, address: Tuple[str, int], logger: logging.Logger) -> None:
+        # as of the last batch
+        self.snapshot = {}  # type: Snapshot
+        ThreadedHTTPServer.__init__(self, address, _MetricsHandler, logger)
+
+
+@register
+class PrometheusLogger(HTTPServerLogger):
+    """Serve monitor state and internal timings for Prometheus.
+
+    Configuring one of these also turns on the collection of the timings (see
+    AntEye.util.metrics), which is otherwise skipped."""
+
+    logger_type = "prometheus"
+    supports_batch = True
+    supports_changes = False
+    uses_metrics = True
+    _server = None  # type: Optional[_MetricsServer]
+
+    def __init__(self, config_options: dict) -> None:
+        super().__init__(config_options)
+        self._start_server(lambda address: _MetricsServer(address, self.logger_logger))
+
+    def save_result2(self, name: str, monitor: Monitor) -> None:
+        if not self.doing_batch:  # pragma: no cover
+            self.logger_logger.error(
+                "PrometheusLogger.save_result2() called while not doing batch."
+            )
+            return
+        if self.batch_data is None:
+            self.batch_data = {}
+        labels = (
+            ("group", str(monitor.group)),
+            ("host", str(monitor.running_on)),
+            ("monitor", name),
+        )
+        self.batch_data[name] = (
+            labels,
+            [value(monitor) for (_, _, value) in _GAUGES],
+            dict(monitor.values),
+        )
+
+    def process_batch(self) -> None:
+        # rendering is left to the server thread, when someone asks
+        if self._server is not None and self.batch_data is not None:
+            self._server.snapshot = self.batch_data
+        self.batch_data = {}
+
+    def describe(self) -> str:
+        return "Serving metrics on http://{0}:{1}/metrics".format(
+            self.bind_host, self.port
+        )
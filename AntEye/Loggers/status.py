@@ -0,0 +1,288 @@
+# coding=utf-8
+
+"""
+A read-only HTTP endpoint serving the live state of all monitors
+"""
+
+import json
+import logging
+import secrets
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple, cast
+from urllib.parse import parse_qs, urlsplit
+
+import arrow
+
+from ..Monitors.monitor import Monitor
+from ..util import format_datetime
+from .httpserver import HTTPServerLogger, LoggingHandler, ThreadedHTTPServer
+from .logger import register
+
+# The fields which make up a monitor's state; the rest (its result text, when
+# it ran, its values) may differ on every run without anything having changed
+_STATE_FIELDS = (
+    "host",
+    "group",
+    "status",
+    "virtual_fail_count",
+    "first_failure_time",
+    "dependencies",
+    "failure_doc",
+)
+
+# query parameter -> field of the monitor data it filters on
+_FILTERS = {"group": "group", "host": "host", "state": "status"}
+
+_KEEPALIVE_SECONDS = 15
+
+
+def _state_of(data: dict) -> dict:
+    return {k: data.get(k) for k in _STATE_FIELDS}
+
+
+class _StatusStore:
+    """The latest snapshot, shared between the logger and the server threads."""
+
+    def __init__(self, history: int) -> None:
+        self.condition = threading.Condition()
+        self.generated = ""
+        self.monitors = {}  # type: Dict[str, dict]
+        self.body = b'{"generated":"","monitors":{}}'
+        # bumped on every update, as the body changes each time; used for the
+        # ETag
+        self.generation = 0
+        # bumped only when some monitor's state changes; used for SSE ids
+        self.version = 0
+        # both start again from 0 when we restart, so are given out along with
+        # the nonce
+        self.nonce = secrets.token_hex(8)
+        self.changes = deque(maxlen=history)  # type: Deque[Tuple[int, List[dict]]]
+        self.closed = False
+
+    def update(self, generated: str, monitors: Dict[str, dict]) -> None:
+        changed = [
+            data
+            for name, data in monitors.items()
+            if name not in self.monitors
+            or _state_of(self.monitors[name]) != _state_of(data)
+        ]
+        changed.extend(
+            dict(data, removed=True)
+            for name, data in self.monitors.items()
+            if name not in monitors
+        )
+        body = _encode(generated, monitors)
+        with self.condition:
+            self.generated = generated
+            self.monitors = monitors
+            self.body = body
+            self.generation += 1
+            if changed:
+                self.version += 1
+                self.changes.append((self.version, changed))
+                self.condition.notify_all()
+
+    def close(self) -> None:
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    @property
+    def etag(self) -> str:
+        return '"{}-{}"'.format(self.nonce, self.generation)
+
+    def event_id(self, version: int) -> str:
+        return "{}-{}".format(self.nonce, version)
+
+    def parse_event_id(self, event_id: str) -> Optional[int]:
+        """The version an event id we gave out is for, or None if it isn't
+        one of ours (e.g. from before a restart)."""
+        nonce, _, version = event_id.partition("-")
+        if nonce != self.nonce or not version.isdigit():
+            return None
+        return int(version)
+
+
+def _encode(generated: str, monitors: Dict[str, dict]) -> bytes:
+    return json.dumps(
+        {"generated": generated, "monitors": monitors},
+        separators=(",", ":"),
+        sort_keys=True,
+    ).encode("utf-8")
+
+
+def _matches(data: dict, filters: Dict[str, List[str]]) -> bool:
+    for key, values in filters.items():
+        if str(data.get(_FILTERS[key], "")).lower() not in values:
+            return False
+    return True
+
+
+class _StatusHandler(LoggingHandler):
+    @property
+    def store(self) -> _StatusStore:
+        return cast(_StatusServer, self.server).store
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        filters = {}  # type: Dict[str, List[str]]
+        for key, values in parse_qs(url.query).items():
+            if key not in _FILTERS:
+                self.send_error(400, "Unknown filter {}".format(key))
+                return
+            filters[key] = [
+                v.strip().lower() for value in values for v in value.split(",")
+            ]
+        if url.path in ["/", "/status"]:
+            self._send_status(filters)
+        elif url.path == "/events":
+            self._send_events(filters)
+        else:
+            self.send_error(404)
+
+    def _send_status(self, filters: Dict[str, List[str]]) -> None:
+        with self.store.condition:
+            etag = self.store.etag
+            body = self.store.body
+            generated = self.store.generated
+            monitors = self.store.monitors
+        if_none_match = self.headers.get("If-None-Match", "")
+        if etag in [x.strip() for x in if_none_match.split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        if filters:
+            body = _encode(
+                generated,
+                {
+                    name: data
+                    for name, data in monitors.items()
+                    if _matches(data, filters)
+                },
+            )
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_events(self, filters: Dict[str, List[str]]) -> None:
+        """Stream state changes as Server-Sent Events until the client goes away."""
+        store = self.store
+        parsed = store.parse_event_id(self.headers.get("Last-Event-ID", ""))
+        last = store.version if parsed is None else parsed  # type: int
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            while True:
+                with store.condition:
+                    store.condition.wait_for(
+                        lambda: store.closed or store.version > last,
+                        timeout=_KEEPALIVE_SECONDS,
+                    )
+                    if store.closed:
+                        return
+                    pending = [x for x in store.changes if x[0] > last]
+                    last = store.version
+                if not pending:
+                    self.wfile.write(b": keepalive\n\n")
+                for version, changed in pending:
+                    matching = [x for x in changed if _matches(x, filters)]
+                    if matching:
+                        self.wfile.write(
+                            "id: {}\nevent: change\ndata: {}\n\n".format(
+                                store.event_id(version),
+                                json.dumps(matching, separators=(",", ":")),
+                            ).encode("utf-8")
+                        )
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+
+class _StatusServer(ThreadedHTTPServer):
+    def __init__(
+        self, address: Tuple[str, int], store: _StatusStore, logger: logging.Logger
+    ) -> None:
+        self.store = store
+        ThreadedHTTPServer.__init__(self, address, _StatusHandler, logger)
+
+
+@register
+class StatusAPILogger(HTTPServerLogger):
+    """Serve the current state of all monitors over HTTP.
+
+    The snapshot is kept in memory and swapped in at the end of each batch, so
+    requests never wait for the main loop or touch the disk."""
+
+    logger_type = "status_api"
+    supports_batch = True
+    supports_changes = False
+    _server = None  # type: Optional[_StatusServer]
+    _store = None  # type: Optional[_StatusStore]
+
+    def __init__(self, config_options: dict) -> None:
+        super().__init__(config_options)
+        history = cast(
+            int,
+            self.get_config_option(
+                "history", required_type="int", minimum=1, default=100
+            ),
+        )
+        store = self._store = _StatusStore(history)
+        self._start_server(
+            lambda address: _StatusServer(address, store, self.logger_logger)
+        )
+
+    def _stop_server(self) -> None:
+        # let the event streams finish, or shutdown() would wait for them
+        if self._store is not None:
+            self._store.close()
+        super()._stop_server()
+
+    def save_result2(self, name: str, monitor: Monitor) -> None:
+        if not self.doing_batch:  # pragma: no cover
+            self.logger_logger.error(
+                "StatusAPILogger.save_result2() called while not doing batch."
+            )
+            return
+        if self.batch_data is None:
+            self.batch_data = {}
+        if monitor.was_skipped:
+            status = "skipped"
+        elif monitor.virtual_fail_count() == 0:
+            status = "ok"
+        else:
+            status = "fail"
+        self.batch_data[name] = {
+            "name": name,
+            "host": monitor.running_on,
+            "group": monitor.group,
+            "status": status,
+            "virtual_fail_count": monitor.virtual_fail_count(),
+            "result": monitor.get_result(),
+            "first_failure_time": format_datetime(monitor.first_failure_time()),
+            "dependencies": monitor.dependencies,
+            "failure_doc": monitor.failure_doc,
+            "last_update": format_datetime(monitor.last_update),
+            "last_run_duration": monitor.last_run_duration,
+            "values": monitor.values,
+        }
+
+    def process_batch(self) -> None:
+        if self._store is not None and self.batch_data is not None:
+            self._store.update(format_datetime(arrow.now()), self.batch_data)
+        self.batch_data = {}
+
+    def describe(self) -> str:
+        return "Serving monitor status on http://{0}:{1}/".format(
+            self.bind_host, self.port
+        )
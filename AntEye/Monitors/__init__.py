@@ -2,31 +2,42 @@
 Monitors for AntEye
 """
 
-from .arlo import MonitorArloCamera
-from .compound import CompoundMonitor
-from .file import MonitorBackup
-from .hass import MonitorSensor
-from .host import (
-    MonitorApcupsd,
-    MonitorCommand,
-    MonitorDiskSpace,
-    MonitorFileStat,
-    MonitorLoadAvg,
-    MonitorMemory,
-    MonitorPkgAudit,
-    MonitorPortAudit,
-    MonitorSwap,
-    MonitorZap,
-)
-from .network import MonitorDNS, MonitorHost, MonitorHTTP, MonitorTCP
-from .ring import MonitorRingDoorbell
-from .service import (
-    MonitorEximQueue,
-    MonitorProcess,
-    MonitorRC,
-    MonitorService,
-    MonitorSvc,
-    MonitorSystemdUnit,
-    MonitorUnixService,
-    MonitorWindowsDHCPScope,
-)
+from ..util import lazy_exports
+from .monitor import get_class
+
+# The individual modules are imported on demand by get_class() in
+# monitor.py; see the lazy type map there. Each name here is mapped to a
+# monitor type defined alongside it.
+_EXPORTS = {
+    "MonitorArloCamera": "arlo_camera",
+    "CompoundMonitor": "compound",
+    "MonitorBackup": "backup",
+    "MonitorSensor": "hass_sensor",
+    "MonitorApcupsd": "apcupsd",
+    "MonitorCommand": "command",
+    "MonitorDiskSpace": "diskspace",
+    "MonitorFileStat": "filestat",
+    "MonitorLoadAvg": "loadavg",
+    "MonitorMemory": "memory",
+    "MonitorPkgAudit": "pkgaudit",
+    "MonitorPortAudit": "portaudit",
+    "MonitorSwap": "swap",
+    "MonitorZap": "zap",
+    "MonitorDNS": "dns",
+    "MonitorHost": "host",
+    "MonitorHTTP": "http",
+    "MonitorTCP": "tcp",
+    "MonitorRingDoorbell": "ring_doorbell",
+    "MonitorEximQueue": "eximqueue",
+    "MonitorProcess": "process",
+    "MonitorRC": "rc",
+    "MonitorService": "service",
+    "MonitorSvc": "svc",
+    "MonitorSystemdUnit": "systemd-unit",
+    "MonitorUnixService": "unix_service",
+    "MonitorWindowsDHCPScope": "dhcpscope",
+}
+
+__all__ = sorted(_EXPORTS)
+
+__getattr__ = lazy_exports(__name__, _EXPORTS, get_class)
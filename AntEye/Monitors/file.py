@@ -3,8 +3,12 @@
 
 import os
 import os.path
+import re
 import time
+from array import array
+from typing import BinaryIO, Dict, List, Optional, Pattern, Tuple, cast
 
+from ..util import MonitorConfigurationError
 from .monitor import Monitor, register
 
 
@@ -54,3 +58,282 @@ class MonitorBackup(Monitor):
 
     def describe(self) -> str:
         "Checking Backup Exec runs daily, and doesn't run for too long."
+
+
+# how much of a log file to read at a time
+_CHUNK_SIZE = 1024 * 1024
+
+# backreferences, which mean something else once patterns are combined
+_BACKREFERENCE = re.compile(rb"\\[1-9]|\(\?P=")
+
+
+class _WindowCounter:
+    """A count of events over the last window seconds, kept in a fixed ring of
+    slots each covering window / slots seconds."""
+
+    def __init__(self, window: int, slots: int = 60) -> None:
+        self.width = window / slots
+        self._counts = array("q", [0] * slots)
+        self._slots = array("q", [-slots] * slots)
+
+    def add(self, when: float, count: int = 1) -> None:
+        slot = int(when // self.width)
+        index = slot % len(self._counts)
+        if self._slots[index] != slot:
+            self._slots[index] = slot
+            self._counts[index] = 0
+        self._counts[index] += count
+
+    def total(self, when: float) -> int:
+        oldest = int(when // self.width) - len(self._counts)
+        return sum(
+            count for (slot, count) in zip(self._slots, self._counts) if slot > oldest
+        )
+
+
+@register
+class MonitorLogTail(Monitor):
+    """Follow a log file, counting the lines which match each of a set of
+    patterns, and fail if too many have matched in the last window seconds.
+
+    The file is kept open and read onwards from where the last run stopped,
+    in large chunks; where that was (the file's device, inode and offset) is
+    saved with the rest of the monitor's state, so a restart carries on from
+    the same place. Rotation (a new file at the path) and truncation are
+    noticed: what's left of the old file is read first, then the new one from
+    its start. Lines are counted as of when they are read, so a backlog read
+    all at once (from the start, or after a restart) counts as new; unless
+    the file was last written to before the window, when it is skipped.
+
+    The patterns are combined into one alternation, so each chunk is searched
+    once however many there are; only the lines it finds are tested against
+    each pattern. Patterns match the raw bytes of each line."""
+
+    monitor_type = "logtail"
+    _state_attributes = Monitor._state_attributes + (
+        "_position",
+    )  # type: Tuple[str, ...]
+    _volatile_state_attributes = Monitor._volatile_state_attributes + (
+        "_position",
+    )  # type: Tuple[str, ...]
+    _local_attributes = ("_file", "_partial", "_patterns", "_combined", "_counters")
+
+    def __init__(self, name: str, config_options: dict) -> None:
+        super().__init__(name, config_options)
+        self.path = cast(str, self.get_config_option("path", required=True))
+        self.window = cast(
+            int,
+            self.get_config_option(
+                "window", required_type="int", minimum=1, default=60
+            ),
+        )
+        self.from_start = cast(
+            bool,
+            self.get_config_option("from_start", required_type="bool", default=False),
+        )
+        self.pattern_names = cast(
+            List[str],
+            self.get_config_option("patterns", required_type="[str]", required=True),
+        )
+        self.regexes = {}  # type: Dict[str, str]
+        self.limits = {}  # type: Dict[str, int]
+        for pattern in self.pattern_names:
+            self.regexes[pattern] = cast(
+                str,
+                self.get_config_option(
+                    "%s_regex" % pattern, required=True, allow_empty=False
+                ),
+            )
+            self.limits[pattern] = cast(
+                int,
+                self.get_config_option(
+                    "%s_max" % pattern, required_type="int", minimum=0, required=True
+                ),
+            )
+        self._patterns = []  # type: List[Tuple[str, Pattern[bytes]]]
+        for pattern in self.pattern_names:
+            try:
+                compiled = re.compile(self.regexes[pattern].encode("utf-8"))
+            except re.error as error:
+                raise MonitorConfigurationError(
+                    "Invalid regex for pattern %s: %s" % (pattern, error)
+                )
+            self._patterns.append((pattern, compiled))
+        self._combined = self._combine()
+        self._counters = {
+            pattern: _WindowCounter(self.window) for pattern in self.pattern_names
+        }
+        self._file = None  # type: Optional[BinaryIO]
+        self._partial = b""
+        # [device, inode, offset] of the first byte not yet looked at
+        self._position = None  # type: Optional[List[int]]
+
+    def _combine(self) -> Optional[Pattern[bytes]]:
+        """One regex matching wherever any of the patterns does, or None if
+        they can't be combined."""
+        sources = [compiled.pattern for (_, compiled) in self._patterns]
+        if len(sources) == 1:
+            # nothing to combine, but the chunks are still searched whole
+            return re.compile(sources[0], re.MULTILINE)
+        if any(_BACKREFERENCE.search(source) for source in sources):
+            return None
+        try:
+            return re.compile(
+                b"|".join(b"(?:" + source + b")" for source in sources), re.MULTILINE
+            )
+        except re.error:
+            # e.g. inline flags, which must come first
+            return None
+
+    def _match_lines(self, data: bytes, when: float) -> None:
+        """Count the matches in data, which is whole lines."""
+        counts = dict.fromkeys(self.pattern_names, 0)
+        if self._combined is None:
+            for line in data.splitlines():
+                for (pattern, compiled) in self._patterns:
+                    if compiled.search(line):
+                        counts[pattern] += 1
+        else:
+            position = 0
+            while True:
+                found = self._combined.search(data, position)
+                if found is None:
+                    break
+                start = data.rfind(b"\n", 0, found.start()) + 1
+                end = data.find(b"\n", found.start())
+                if end < 0:
+                    end = len(data)
+                line = data[start:end]
+                for (pattern, compiled) in self._patterns:
+                    if compiled.search(line):
+                        counts[pattern] += 1
+                position = end + 1
+        for (pattern, count) in counts.items():
+            if count:
+                self._counters[pattern].add(when, count)
+
+    def _read(self, file_handle: BinaryIO, when: float) -> None:
+        """Read file_handle to its end, counting the matches in each whole
+        line. An unfinished last line is kept for next time."""
+        while True:
+            data = file_handle.read(_CHUNK_SIZE)
+            if not data:
+                break
+            data = self._partial + data
+            end = data.rfind(b"\n") + 1
+            if end == 0 and len(data) < _CHUNK_SIZE:
+                self._partial = data
+                continue
+            if end == 0:
+                # a very long line; take it in pieces
+                end = len(data)
+            self._partial = data[end:]
+            self._match_lines(data[:end], when)
+        info = os.fstat(file_handle.fileno())
+        self._position = [
+            info.st_dev,
+            info.st_ino,
+            file_handle.tell() - len(self._partial),
+        ]
+
+    def _open(self, when: float) -> None:
+        """Open the file, and find where to start reading it."""
+        file_handle = open(self.path, "rb")
+        opened = os.fstat(file_handle.fileno())
+        if self._position is not None:
+            (device, inode, offset) = self._position
+            if [opened.st_dev, opened.st_ino] != [device, inode]:
+                # rotated while we weren't looking
+                offset = 0
+        elif self.from_start:
+            offset = 0
+        else:
+            offset = opened.st_size
+        if offset > opened.st_size:
+            # truncated while we weren't looking
+            offset = 0
+        if offset < opened.st_size and opened.st_mtime < when - self.window:
+            # what we've yet to read was all written before the window, so
+            # none of it counts
+            offset = opened.st_size
+        file_handle.seek(offset)
+        self._file = file_handle
+        self._partial = b""
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._partial = b""
+
+    def _follow(self, when: float) -> None:
+        """Read whatever has been added to the file since last time."""
+        try:
+            info = os.stat(self.path)  # type: Optional[os.stat_result]
+        except FileNotFoundError:
+            info = None
+        if self._file is not None:
+            opened = os.fstat(self._file.fileno())
+            if info is None or (info.st_dev, info.st_ino) != (
+                opened.st_dev,
+                opened.st_ino,
+            ):
+                # rotated: finish off the old file before starting the new one
+                self._read(self._file, when)
+                if self._partial:
+                    self._match_lines(self._partial, when)
+                    self._partial = b""
+                if info is None:
+                    # the new one hasn't appeared yet
+                    return
+                self._close()
+                self._position = [info.st_dev, info.st_ino, 0]
+            elif info.st_size < self._file.tell():
+                # truncated
+                self._file.seek(0)
+                self._partial = b""
+        if info is None:
+            raise FileNotFoundError(self.path)
+        if self._file is None:
+            self._open(when)
+        self._read(cast(BinaryIO, self._file), when)
+
+    def run_test(self) -> bool:
+        when = time.time()
+        try:
+            self._follow(when)
+        except FileNotFoundError:
+            self._close()
+            return self.record_fail("File %s does not exist" % self.path)
+        except OSError as error:
+            self._close()
+            return self.record_fail("Unable to read %s: %s" % (self.path, error))
+
+        self.values = {}
+        problems = []
+        for pattern in self.pattern_names:
+            count = self._counters[pattern].total(when)
+            self.values[pattern] = count
+            if count > self.limits[pattern]:
+                problems.append("%s: %d > %d" % (pattern, count, self.limits[pattern]))
+        if problems:
+            return self.record_fail(
+                "%s in the last %ds" % (", ".join(problems), self.window)
+            )
+        return self.record_success(
+            "%s in the last %ds"
+            % (
+                ", ".join("%s: %d" % (x, self.values[x]) for x in self.pattern_names),
+                self.window,
+            )
+        )
+
+    def describe(self) -> str:
+        return "Checking %s has at most %s matching lines in any %ds" % (
+            self.path,
+            ", ".join("%d %s" % (self.limits[x], x) for x in self.pattern_names),
+            self.window,
+        )
+
+    def get_params(self) -> Tuple:
+        return (self.path, self.window, self.regexes, self.limits)
@@ -1,10 +1,16 @@
+import datetime
 import os
 import re
 import shlex
 import subprocess  # nosec
 import time
-from typing import Optional, Tuple, cast
+from typing import List, Optional, Tuple, cast
 
+from ..util import UpDownTime
+from ..util.commands import check_output
+from ..util.filetree import FileTree, compile_glob, inotify_available
+from ..util.forecast import MIN_SAMPLES, TrendEstimator
+from ..util.hostmetrics import host_metrics
 from .monitor import Monitor, register
 
 try:
@@ -59,9 +65,14 @@ def _bytes_to_size_string(b: int) -> str:
 
 @register
 class MonitorDiskSpace(Monitor):
-    """Make sure we have enough disk space."""
+    """Make sure we have enough disk space.
+
+    With forecast_horizon set, also fail when the trend of the last
+    forecast_samples runs says the space (or the inodes) will run out within
+    that many seconds."""
 
     monitor_type = "diskspace"
+    _local_attributes = ("_space_trend", "_inode_trend")
 
     def __init__(self, name: str, config_options: dict) -> None:
         super().__init__(name, config_options)
@@ -77,27 +88,77 @@ class MonitorDiskSpace(Monitor):
         self.limit = _size_string_to_bytes(
             self.get_config_option("limit", required=True)
         )
+        self.forecast_horizon = cast(
+            Optional[int],
+            self.get_config_option("forecast_horizon", required_type="int", minimum=0),
+        )
+        self.forecast_samples = cast(
+            int,
+            self.get_config_option(
+                "forecast_samples", required_type="int", default=30, minimum=MIN_SAMPLES
+            ),
+        )
+        self._space_trend = TrendEstimator(self.forecast_samples)
+        self._inode_trend = TrendEstimator(self.forecast_samples)
+
+    def _forecast(
+        self, trend: TrendEstimator, when: float, current: int, what: str
+    ) -> Tuple[bool, str]:
+        """Add a sample to trend, and say whether it runs out too soon."""
+        trend.add(when, current)
+        seconds = trend.time_to_zero(current)
+        if seconds is None:
+            return (False, "")
+        self.values["seconds_to_{}full".format(what.replace(" ", "_"))] = seconds
+        message = "; {}full in {}".format(
+            what, UpDownTime.from_timedelta(datetime.timedelta(seconds=seconds))
+        )
+        return (seconds < cast(int, self.forecast_horizon), message)
 
     def run_test(self) -> bool:
+        inodes = None
         try:
             if self.use_statvfs:
-                result = os.statvfs(self.partition)
+                metrics = host_metrics()
+                when = metrics.when
+                result = metrics.statvfs(self.partition)
                 space = result.f_bavail * result.f_frsize
+                total = result.f_blocks * result.f_frsize
                 percent = float(result.f_bavail) / float(result.f_blocks) * 100
+                # some filesystems (e.g. btrfs) don't have a fixed number of inodes
+                if result.f_files:
+                    inodes = result.f_favail
             else:
+                when = time.time()
                 win_result = win32api.GetDiskFreeSpaceEx(self.partition)
                 space = win_result[2]
+                total = win_result[1]
                 percent = float(win_result[2]) / float(win_result[1]) * 100
         except Exception as e:
             return self.record_fail("Couldn't get free disk space: %s" % e)
-
-        if self.limit and space <= self.limit:
-            return self.record_fail(
-                "%s free (%d%%)" % (_bytes_to_size_string(space), percent)
-            )
-        return self.record_success(
-            "%s free (%d%%)" % (_bytes_to_size_string(space), percent)
-        )
+        self.values = {
+            "free_bytes": space,
+            "total_bytes": total,
+            "percent_free": percent,
+        }
+        if inodes is not None:
+            self.values["free_inodes"] = inodes
+
+        message = "%s free (%d%%)" % (_bytes_to_size_string(space), percent)
+        failed = bool(self.limit and space <= self.limit)
+        if self.forecast_horizon is not None:
+            (too_soon, forecast) = self._forecast(self._space_trend, when, space, "")
+            failed = failed or too_soon
+            message += forecast
+            if inodes is not None:
+                (too_soon, forecast) = self._forecast(
+                    self._inode_trend, when, inodes, "inodes "
+                )
+                failed = failed or too_soon
+                message += forecast
+        if failed:
+            return self.record_fail(message)
+        return self.record_success(message)
 
     def describe(self) -> str:
         """Explains what we do."""
@@ -106,7 +167,10 @@ class MonitorDiskSpace(Monitor):
         else:
             limit = _bytes_to_size_string(self.limit)
 
-        return "Checking for at least %s free space on %s" % (limit, self.partition)
+        desc = "Checking for at least %s free space on %s" % (limit, self.partition)
+        if self.forecast_horizon is not None:
+            desc += ", and that it won't run out within %ds" % self.forecast_horizon
+        return desc
 
     def get_params(self) -> Tuple:
         return (self.limit, self.partition)
@@ -114,9 +178,16 @@ class MonitorDiskSpace(Monitor):
 
 @register
 class MonitorFileStat(Monitor):
-    """Make sure a file exists, isn't too old and/or isn't too small."""
+    """Make sure a file exists, isn't too old and/or isn't too small.
+
+    In glob mode, filename is a glob (which may use **), and in directory
+    mode a directory to look under. The limits then apply to the files found:
+    maxage to the newest, max_oldest_age to the oldest, and minsize and
+    maxsize to their total size."""
 
     monitor_type = "filestat"
+    _local_attributes = ("_tree",)
+    _tree = None  # type: Optional[FileTree]
 
     def __init__(self, name: str, config_options: dict) -> None:
         super().__init__(name, config_options)
@@ -136,8 +207,114 @@ class MonitorFileStat(Monitor):
         else:
             self.maxsize = None
         self.filename = self.get_config_option("filename", required=True)
+        self.mode = cast(
+            str,
+            self.get_config_option(
+                "mode", default="file", allowed_values=["file", "glob", "directory"]
+            ),
+        )
+        self.max_oldest_age = cast(
+            Optional[int],
+            self.get_config_option("max_oldest_age", required_type="int", minimum=0),
+        )
+        self.min_count = cast(
+            int,
+            self.get_config_option(
+                "min_count",
+                required_type="int",
+                minimum=0,
+                default=1 if self.mode == "glob" else 0,
+            ),
+        )
+        self.max_count = cast(
+            Optional[int],
+            self.get_config_option("max_count", required_type="int", minimum=0),
+        )
+        recursive = cast(
+            bool,
+            self.get_config_option("recursive", required_type="bool", default=True),
+        )
+        use_inotify = cast(
+            bool, self.get_config_option("inotify", required_type="bool", default=False)
+        )
+        if use_inotify and not inotify_available():
+            raise RuntimeError("inotify is only available on Linux")
+        if self.mode == "glob":
+            (base, max_depth, match) = compile_glob(self.filename)
+            self._tree = FileTree(base, max_depth, match, use_inotify=use_inotify)
+        elif self.mode == "directory":
+            self._tree = FileTree(
+                self.filename, None if recursive else 0, use_inotify=use_inotify
+            )
+
+    def _test_files(self, tree: FileTree) -> bool:
+        try:
+            files = list(tree.scan().values())
+        except FileNotFoundError:
+            return self.record_fail("Directory %s does not exist" % tree.root)
+        except Exception as e:
+            return self.record_fail("Unable to check files: %s" % e)
+        now = time.time()
+        count = len(files)
+        total = sum(size for (size, _) in files)
+        self.values = {"count": count, "total_bytes": total}
+        message = "%d files, %d bytes" % (count, total)
+        if files:
+            newest = now - max(mtime for (_, mtime) in files)
+            oldest = now - min(mtime for (_, mtime) in files)
+            self.values["newest_age"] = newest
+            self.values["oldest_age"] = oldest
+            message += ", newest %d seconds old, oldest %d" % (newest, oldest)
+
+        if count < self.min_count:
+            return self.record_fail(
+                "Found %d files, should be >= %d" % (count, self.min_count)
+            )
+        if self.max_count is not None and count > self.max_count:
+            return self.record_fail(
+                "Found %d files, should be <= %d" % (count, self.max_count)
+            )
+        if self.minsize and total < self.minsize:
+            return self.record_fail(
+                "Total size is %d, should be >= %d bytes" % (total, self.minsize)
+            )
+        if self.maxsize and total > self.maxsize:
+            return self.record_fail(
+                "Total size is %d, should be <= %d bytes" % (total, self.maxsize)
+            )
+        if files and self.maxage and newest > self.maxage:
+            return self.record_fail(
+                "Newest file's age is %d, should be < %d seconds"
+                % (newest, self.maxage)
+            )
+        if files and self.max_oldest_age and oldest > self.max_oldest_age:
+            return self.record_fail(
+                "Oldest file's age is %d, should be < %d seconds"
+                % (oldest, self.max_oldest_age)
+            )
+        return self.record_success(message)
+
+    def _describe_files(self) -> str:
+        if self.mode == "glob":
+            desc = "Checking files matching %s" % self.filename
+        else:
+            desc = "Checking files under %s" % self.filename
+        limits = ["at least %d of them" % self.min_count]
+        if self.max_count is not None:
+            limits.append("at most %d" % self.max_count)
+        if self.maxage:
+            limits.append("the newest under %d seconds old" % self.maxage)
+        if self.max_oldest_age:
+            limits.append("the oldest under %d seconds old" % self.max_oldest_age)
+        if self.minsize:
+            limits.append("at least %d bytes in total" % self.minsize)
+        if self.maxsize:
+            limits.append("at most %d bytes in total" % self.maxsize)
+        return "%s: %s" % (desc, ", ".join(limits))
 
     def run_test(self) -> bool:
+        if self._tree is not None:
+            return self._test_files(self._tree)
         try:
             statinfo = os.stat(self.filename)
         except FileNotFoundError:
@@ -175,6 +352,8 @@ class MonitorFileStat(Monitor):
 
     def describe(self) -> str:
         """Explains what we do"""
+        if self.mode != "file":
+            return self._describe_files()
         desc = "Checking %s exists" % self.filename
         if self.maxage:
             desc = desc + " and is not older than %d seconds" % self.maxage
@@ -210,7 +389,7 @@ class MonitorApcupsd(Monitor):
             else:
                 executable = "apcaccess"
         try:
-            _output = subprocess.check_output(executable)  # nosec
+            _output = check_output([executable], timeout=self.command_timeout)
             output = _output.decode("utf-8")  # type: str
         except subprocess.CalledProcessError as e:
             output = e.output
@@ -252,16 +431,85 @@ class MonitorApcupsd(Monitor):
         return (self.path,)
 
 
+class _AuditCache:
+    """The outcome of an audit, kept until the files it depends on change or
+    it is max_age seconds old."""
+
+    def __init__(self, paths: List[str], max_age: int) -> None:
+        self.paths = paths
+        self.max_age = max_age
+        self._key = None  # type: Optional[List[Optional[Tuple[int, int, int]]]]
+        self._count = None  # type: Optional[int]
+        self._when = 0.0
+
+    def _inputs(self) -> List[Optional[Tuple[int, int, int]]]:
+        key = []  # type: List[Optional[Tuple[int, int, int]]]
+        for path in self.paths:
+            try:
+                info = os.stat(path)
+            except OSError:
+                key.append(None)
+                continue
+            key.append((info.st_ino, info.st_size, info.st_mtime_ns))
+        return key
+
+    def get(self) -> Optional[int]:
+        """The number of problems found last time, if it still holds."""
+        if self._count is None or time.time() - self._when >= self.max_age:
+            return None
+        if self._inputs() != self._key:
+            return None
+        return self._count
+
+    def put(self, count: int) -> None:
+        if self.max_age:
+            # after the audit, which may have updated its database itself
+            # (portaudit -X)
+            self._key = self._inputs()
+            self._count = count
+            self._when = time.time()
+
+
+def _record_problems(monitor: Monitor, count: int) -> bool:
+    if count == 0:
+        return monitor.record_success()
+    if count == 1:
+        return monitor.record_fail("1 problem")
+    return monitor.record_fail("%d problems" % count)
+
+
 @register
 class MonitorPortAudit(Monitor):
-    """Check a host doesn't have outstanding security issues."""
+    """Check a host doesn't have outstanding security issues.
+
+    The result is reused until the audit or package database changes, or
+    cache_max_age seconds have passed."""
 
     monitor_type = "portaudit"
     regexp = re.compile(r"(\d+) problem\(s\) in your installed packages found")
+    _local_attributes = ("_cache",)
 
     def __init__(self, name: str, config_options: dict) -> None:
         super().__init__(name, config_options)
         self.path = self.get_config_option("path", default="")
+        self.cache_max_age = cast(
+            int,
+            self.get_config_option(
+                "cache_max_age", required_type="int", minimum=0, default=3600
+            ),
+        )
+        self._cache = _AuditCache(
+            [
+                cast(
+                    str,
+                    self.get_config_option(
+                        "audit_db", default="/var/db/portaudit/auditfile.tbz"
+                    ),
+                ),
+                cast(str, self.get_config_option("package_db", default="/var/db/pkg")),
+            ],
+            self.cache_max_age,
+        )
 
     def describe(self) -> str:
         return "Checking for insecure ports."
@@ -270,47 +518,74 @@ class MonitorPortAudit(Monitor):
         return (self.path,)
 
     def run_test(self) -> bool:
+        count = self._cache.get()
+        if count is not None:
+            return _record_problems(self, count)
         try:
             # -X 1 tells portaudit to re-download db if one day out of date
             if self.path == "":
                 self.path = "/usr/local/sbin/portaudit"
             try:
-                # nosec
-                _output = subprocess.check_output([self.path, "-a", "-X", "1"])  # nosec
+                _output = check_output(
+                    [self.path, "-a", "-X", "1"], timeout=self.command_timeout
+                )
                 output = _output.decode("utf-8")
             except subprocess.CalledProcessError as e:
-                output = e.output
+                output = e.output.decode("utf-8")
             except OSError as e:
                 return self.record_fail("Error running %s: %s" % (self.path, e))
             except Exception as e:
                 return self.record_fail("Error running portaudit: %s" % e)
 
+            count = 0
             for line in output.splitlines():
                 matches = self.regexp.match(line)
                 if matches:
                     count = int(matches.group(1))
-                    # sanity check
-                    if count == 0:
-                        return self.record_success()
-                    if count == 1:
-                        return self.record_fail("1 problem")
-                    return self.record_fail("%d problems" % count)
-            return self.record_success()
+                    break
+            self._cache.put(count)
+            return _record_problems(self, count)
         except Exception as e:
             return self.record_fail("Could not run portaudit: %s" % e)
 
 
 @register
 class MonitorPkgAudit(Monitor):
-    """Check a host doesn't have outstanding security issues."""
+    """Check a host doesn't have outstanding security issues.
+
+    The result is reused until the vulnerability or package database
+    changes, or cache_max_age seconds have passed."""
 
     monitor_type = "pkgaudit"
     regexp = re.compile(r"(\d+) problem\(s\) in \w+ installed package(s|\(s\)) found")
     path = ""
+    _local_attributes = ("_cache",)
 
     def __init__(self, name: str, config_options: dict) -> None:
         super().__init__(name, config_options)
         self.path = self.get_config_option("path", default="")
+        self.cache_max_age = cast(
+            int,
+            self.get_config_option(
+                "cache_max_age", required_type="int", minimum=0, default=3600
+            ),
+        )
+        package_db = cast(
+            str,
+            self.get_config_option("package_db", default="/var/db/pkg/local.sqlite"),
+        )
+        self._cache = _AuditCache(
+            [
+                cast(
+                    str,
+                    self.get_config_option("vuln_db", default="/var/db/pkg/vuln.xml"),
+                ),
+                package_db,
+                # sqlite may only have written to its journal so far
+                package_db + "-wal",
+            ],
+            self.cache_max_age,
+        )
 
     def describe(self) -> str:
         return "Checking for insecure packages."
@@ -319,11 +594,16 @@ class MonitorPkgAudit(Monitor):
         return (self.path,)
 
     def run_test(self) -> bool:
+        count = self._cache.get()
+        if count is not None:
+            return _record_problems(self, count)
         try:
             if self.path == "":
                 self.path = "/usr/local/sbin/pkg"
             try:
-                _output = subprocess.check_output([self.path, "audit"])  # nosec
+                _output = check_output(
+                    [self.path, "audit"], timeout=self.command_timeout
+                )
                 output = _output.decode("utf-8")
             except subprocess.CalledProcessError as e:
                 output = e.output.decode("utf-8")
@@ -334,17 +614,14 @@ class MonitorPkgAudit(Monitor):
             except Exception as e:
                 return self.record_fail("Error running pkg audit: {0}".format(e))
 
+            count = 0
             for line in output.splitlines():
                 matches = self.regexp.match(line)
                 if matches:
                     count = int(matches.group(1))
-                    # sanity check
-                    if count == 0:
-                        return self.record_success()
-                    if count == 1:
-                        return self.record_fail("1 problem")
-                    return self.record_fail("%d problems" % count)
-            return self.record_success()
+                    break
+            self._cache.put(count)
+            return _record_problems(self, count)
         except Exception as e:
             return self.record_fail("Could not run pkg: %s" % e)
 
@@ -376,10 +653,14 @@ class MonitorLoadAvg(Monitor):
             return "Checking 15min loadavg is <= %0.2f" % self.max
 
     def run_test(self) -> bool:
+        metrics = host_metrics()
         try:
-            loadavg = os.getloadavg()
+            loadavg = metrics.loadavg()
         except Exception as e:
             return self.record_fail("Exception getting loadavg: %s" % e)
+        self.values = {"load1": loadavg[0], "load5": loadavg[1], "load15": loadavg[2]}
+        for (key, value) in metrics.pressure("cpu").items():
+            self.values["cpu_pressure_" + key] = value
 
         if loadavg[self.which] > self.max:
             return self.record_fail("%0.2f" % loadavg[self.which])
@@ -397,7 +678,7 @@ class MonitorMemory(Monitor):
 
     def __init__(self, name: str, config_options: dict) -> None:
         super().__init__(name, config_options)
-        if psutil is None:
+        if psutil is None and not host_metrics().use_proc:
             self.monitor_logger.critical("psutil is not installed.")
             self.monitor_logger.critical("Try: pip install -r requirements.txt")
         self.percent_free = cast(
@@ -406,10 +687,19 @@ class MonitorMemory(Monitor):
         )
 
     def run_test(self) -> bool:
-        if psutil is None:
-            return self.record_fail("psutil is not installed")
-        stats = psutil.virtual_memory()
-        percent = int(stats.available / stats.total * 100)
+        metrics = host_metrics()
+        try:
+            (total, available) = metrics.memory()
+        except (OSError, RuntimeError, KeyError) as e:
+            return self.record_fail("Couldn't get memory usage: {}".format(e))
+        percent = int(available / total * 100)
+        self.values = {
+            "total_bytes": total,
+            "available_bytes": available,
+            "percent_free": percent,
+        }
+        for (key, value) in metrics.pressure("memory").items():
+            self.values["memory_pressure_" + key] = value
         message = "{}% free".format(percent)
         if percent < self.percent_free:
             return self.record_fail(message)
@@ -431,7 +721,7 @@ class MonitorSwap(Monitor):
 
     def __init__(self, name: str, config_options: dict) -> None:
         super().__init__(name, config_options)
-        if psutil is None:
+        if psutil is None and not host_metrics().use_proc:
             self.monitor_logger.critical("psutil is not installed.")
             self.monitor_logger.critical("Try: pip install -r requirements.txt")
         self.percent_free = cast(
@@ -440,10 +730,17 @@ class MonitorSwap(Monitor):
         )
 
     def run_test(self) -> bool:
-        if psutil is None:
-            return self.record_fail("psutil is not installed")
-        stats = psutil.swap_memory()
-        percent = 100 - stats.percent
+        try:
+            (total, free) = host_metrics().swap()
+        except (OSError, RuntimeError, KeyError) as e:
+            return self.record_fail("Couldn't get swap usage: {}".format(e))
+        # as psutil reports it
+        percent = 100 - (round((total - free) / total * 100, 1) if total else 0.0)
+        self.values = {
+            "total_bytes": total,
+            "free_bytes": free,
+            "percent_free": percent,
+        }
         message = "{}% free".format(percent)
         if percent < self.percent_free:
             return self.record_fail(message)
@@ -472,7 +769,9 @@ class MonitorZap(Monitor):
 
     def run_test(self) -> bool:
         try:
-            _output = subprocess.check_output(["ztscan", str(self.span)])  # nosec
+            _output = check_output(
+                ["ztscan", str(self.span)], timeout=self.command_timeout
+            )
             output = _output.decode("utf-8")
             for line in output:
                 matches = self.r.match(line)
@@ -523,7 +822,7 @@ class MonitorCommand(Monitor):
         if not self.available:
             return self.record_skip(None)
         try:
-            _out = subprocess.check_output(self.command)  # nosec
+            _out = check_output(self.command, timeout=self.command_timeout)
             if self.result_regexp is not None:
                 out = _out.decode("utf-8")
                 matches = self.result_regexp.search(out)
@@ -13,9 +13,8 @@ functions.
 import copy
 import logging
 import platform
-import subprocess  # nosec
 import time
-from typing import Any, List, NoReturn, Optional, Tuple, Union, cast
+from typing import Any, Dict, List, NoReturn, Optional, Tuple, Union, cast
 
 import arrow
 
@@ -28,6 +27,7 @@ from ..util import (
     short_hostname,
     subclass_dict_handler,
 )
+from ..util import commands
 
 
 class Monitor:
@@ -41,7 +41,7 @@ class Monitor:
     success_count = 0
     tests_run = 0
     last_error_count = 0
-    last_run_duration = 0
+    last_run_duration = 0.0
     skip_dep = None  # type: Optional[str]
 
     failures = 0
@@ -54,6 +54,39 @@ class Monitor:
     _first_load = None  # type: Optional[arrow.Arrow]
     unavailable_seconds = 0  # type: int
 
+    # attributes which make up the run-time state of a monitor, as opposed to its
+    # configuration; these are what gets saved to the state file
+    _state_attributes = (
+        "error_count",
+        "_failed_at",
+        "success_count",
+        "tests_run",
+        "last_error_count",
+        "last_result",
+        "skip_dep",
+        "failures",
+        "last_failure",
+        "uptime_start",
+        "last_update",
+        "_first_load",
+        "unavailable_seconds",
+        "_state",
+    )  # type: Tuple[str, ...]
+
+    # state attributes which change on every run (counters, timestamps and the
+    # result text); changes to just these are saved only now and then
+    _volatile_state_attributes = (
+        "success_count",
+        "tests_run",
+        "last_result",
+        "last_update",
+        "unavailable_seconds",
+    )  # type: Tuple[str, ...]
+
+    # attributes which only mean something in this process (caches, samples
+    # and the like), left out when the monitor is serialized
+    _local_attributes = ()  # type: Tuple[str, ...]
+
     def __init__(
         self, name: str = "unnamed", config_options: Optional[dict] = None
     ) -> None:
@@ -83,6 +116,15 @@ class Monitor:
         )
         self._recover_command = self.get_config_option("recover_command")
         self._recovered_command = self.get_config_option("recovered_command")
+        self.command_timeout = cast(
+            float,
+            self.get_config_option(
+                "command_timeout",
+                required_type="float",
+                minimum=0,
+                default=commands.DEFAULT_TIMEOUT,
+            ),
+        )
         self.recover_info = ""
         self.recovered_info = ""
         self.minimum_gap = self.get_config_option(
@@ -91,6 +133,8 @@ class Monitor:
         self.failure_doc = cast(
             Optional[str], self.get_config_option("failure_doc", default=None)
         )
+        # the figures behind the last result (e.g. bytes free), for loggers
+        self.values = {}  # type: Dict[str, float]
 
         self.running_on = short_hostname()
         self._state = MonitorState.UNKNOWN
@@ -332,31 +376,31 @@ class Monitor:
     def was_skipped(self) -> bool:
         return self._state == MonitorState.SKIPPED
 
-    def should_run(self) -> bool:
-        """Check if we should run our tests.
+    def is_due(self) -> bool:
+        """Check if we should run our tests, without counting this as a run.
 
         We always run if the minimum gap is 0, or if we're currently failing.
         Otherwise, we run if the last time we ran was more than minimum_gap seconds ago.
         """
-        now = int(time.time())
         if self._force_run:
-            self._force_run = False
-            self._last_run = now
             return True
         if self.minimum_gap == 0:
-            self._last_run = now
             return True
         if self.error_count > 0:
-            self._last_run = now
             return True
         if self._last_run == 0:
-            self._last_run = now
             return True
-        gap = now - self._last_run
-        if gap >= self.minimum_gap:
-            self._last_run = now
-            return True
-        return False
+        gap = int(time.time()) - self._last_run
+        return gap >= self.minimum_gap
+
+    def should_run(self) -> bool:
+        """Check if we should run our tests (see is_due()), and if so, note
+        that we're about to."""
+        if not self.is_due():
+            return False
+        self._force_run = False
+        self._last_run = int(time.time())
+        return True
 
     def last_virtual_fail_count(self) -> int:
         value = self.last_error_count - self._tolerance
@@ -371,9 +415,10 @@ class Monitor:
 
         try:
             self.monitor_logger.info("Attempting recovery command")
-            p = subprocess.Popen(self._recover_command.split(" "))  # nosec
-            p.wait()
-            self.recover_info = "Command executed and returned %d" % p.returncode
+            returncode = commands.call(
+                self._recover_command.split(" "), timeout=self.command_timeout
+            )
+            self.recover_info = "Command executed and returned %d" % returncode
         except Exception as e:
             self.recover_info = "Unable to run command: %s" % e
 
@@ -384,9 +429,10 @@ class Monitor:
         if self.all_better_now():
             self.monitor_logger.info("Attempting recovered command")
             try:
-                p = subprocess.Popen(self._recovered_command.split(" "))  # nosec
-                p.wait()
-                self.recovered_info = "Command executed and returned %d" % p.returncode
+                returncode = commands.call(
+                    self._recovered_command.split(" "), timeout=self.command_timeout
+                )
+                self.recovered_info = "Command executed and returned %d" % returncode
             except Exception as e:
                 self.recovered_info = "Unable to run command: %s" % e
 
@@ -401,6 +447,8 @@ class Monitor:
         """
         serialize_dict = dict(self.__dict__)
         del serialize_dict["monitor_logger"]
+        for key in self._local_attributes:
+            serialize_dict.pop(key, None)
         return serialize_dict
 
     def __setstate__(self, state: dict) -> None:
@@ -422,6 +470,17 @@ class Monitor:
         monitor.__setstate__(d)
         return monitor
 
+    def get_state(self) -> dict:
+        """Get the run-time state of the monitor, for saving across restarts."""
+        data = self.to_python_dict()
+        return {k: data[k] for k in self._state_attributes if k in data}
+
+    def restore_state(self, state: dict) -> None:
+        """Restore run-time state previously returned by get_state()."""
+        for key in self._state_attributes:
+            if key in state:
+                setattr(self, key, state[key])
+
     def get_downtime(self) -> UpDownTime:
         """Get monitor downtime"""
         first_failure_time = self.first_failure_time()
@@ -461,7 +520,40 @@ class Monitor:
 
 
 (register, get_class, all_types) = subclass_dict_handler(
-    "AntEye.Monitors.monitor", Monitor, "monitor_type"
+    "AntEye.Monitors.monitor",
+    Monitor,
+    "monitor_type",
+    lazy={
+        "apcupsd": "host",
+        "arlo_camera": "arlo",
+        "backup": "file",
+        "command": "host",
+        "compound": "compound",
+        "dhcpscope": "service",
+        "diskspace": "host",
+        "dns": "network",
+        "eximqueue": "service",
+        "filestat": "host",
+        "hass_sensor": "hass",
+        "host": "network",
+        "http": "network",
+        "loadavg": "host",
+        "logtail": "file",
+        "memory": "host",
+        "ping": "network",
+        "pkgaudit": "host",
+        "portaudit": "host",
+        "process": "service",
+        "rc": "service",
+        "ring_doorbell": "ring",
+        "service": "service",
+        "svc": "service",
+        "swap": "host",
+        "systemd-unit": "service",
+        "tcp": "network",
+        "unix_service": "service",
+        "zap": "host",
+    },
 )
 
 
@@ -12,6 +12,7 @@ import arrow
 import requests
 from requests.auth import HTTPBasicAuth
 
+from ..util.commands import check_output
 from .monitor import Monitor, register
 
 try:
@@ -249,7 +250,7 @@ class MonitorHost(Monitor):
 
         try:
             cmd = (self.ping_command % self.host).split(" ")
-            output = subprocess.check_output(cmd)
+            output = check_output(cmd, timeout=self.command_timeout)
             for line in str(output).split("\n"):
                 matches = re.search(self.ping_regexp, line)
                 if matches:
@@ -258,7 +259,7 @@ class MonitorHost(Monitor):
                     matches = re.search(self.time_regexp, line)
                     if matches:
                         pingtime = float(matches.group("ms"))
-        except subprocess.CalledProcessError as exception:
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as exception:
             return self.record_fail(str(exception))
         if success:
             if pingtime > 0:
@@ -305,7 +306,9 @@ class MonitorDNS(Monitor):
 
     def run_test(self) -> bool:
         try:
-            result = subprocess.check_output(self.params).decode("utf-8")
+            result = check_output(self.params, timeout=self.command_timeout).decode(
+                "utf-8"
+            )
             result = result.strip()
             if result is None or result == "":
                 if self.desired_val != "nxdomain":
@@ -324,6 +327,8 @@ class MonitorDNS(Monitor):
                 "Command '%s' exited non-zero (%d)"
                 % (" ".join(self.params), exception.returncode)
             )
+        except subprocess.TimeoutExpired as exception:
+            return self.record_fail(str(exception))
 
     def describe(self) -> str:
         if self.desired_val:
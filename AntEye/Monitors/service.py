@@ -1,12 +1,30 @@
 # coding=utf-8
-import fnmatch
 import os
 import platform
 import re
-import subprocess
-import time
-from typing import Any, List, Optional, Tuple, cast
-
+from collections import deque
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    cast,
+)
+
+from ..util.commands import check_output
+from ..util.processes import READERS as PROCESS_READERS
+from ..util.processes import SNAPSHOTS as PROCESS_SNAPSHOTS
+from ..util.processes import ProcessInfo, proc_available
+from ..util.serviceprobe import PROBE as STATUS_PROBE
+from ..util.serviceprobe import supervise_running, systemd_available, systemd_status
+from ..util.systemd import SNAPSHOT as UNIT_SNAPSHOT
+from ..util.systemd import UnitInfo, UnitMatcher
+from .host import _bytes_to_size_string, _size_string_to_bytes
 from .monitor import Monitor, register
 
 try:
@@ -30,20 +48,16 @@ class MonitorSvc(Monitor):
     def __init__(self, name: str, config_options: dict) -> None:
         super().__init__(name, config_options)
         self.path = cast(str, self.get_config_option("path", required=True))
-        self.params = ("svok %s" % self.path).split(" ")
 
     def run_test(self) -> bool:
         if self.path == "":
             return self.record_fail("Path is not configured")
         try:
-            result = subprocess.call(self.params)
-            if result is None:
-                result = 0
-            if result > 0:
-                return self.record_fail("svok returned %d" % int(result))
+            if not supervise_running(self.path):
+                return self.record_fail("supervise is not running in %s" % self.path)
             return self.record_success()
         except Exception as e:
-            return self.record_fail("Exception while executing svok: %s" % e)
+            return self.record_fail("Exception while checking supervise: %s" % e)
 
     def describe(self) -> str:
         return (
@@ -150,23 +164,33 @@ class MonitorRC(Monitor):
                 self.script_path = self.script_path + ".sh"
             else:
                 raise RuntimeError("Script %s(.sh) does not exist" % self.script_path)
+        self.timeout = cast(
+            float,
+            self.get_config_option(
+                "timeout", required_type="float", minimum=0, default=30
+            ),
+        )
+        self._command = ((self.script_path, "status"), self.timeout)
+        STATUS_PROBE.register(self, self._command)
+
+    def wants_status(self) -> bool:
+        """Whether we'll ask STATUS_PROBE for our command's result this loop."""
+        return self.is_due() and not self.remaining_dependencies
 
     def run_test(self) -> bool:
         """Check the service is in the desired state."""
         if platform.system() in ["Microsoft", "CYGWIN_NT-6.0"]:
             return self.record_fail("Cannot run this monitor on a non-UNIX host.")
-        try:
-            returncode = subprocess.check_call([self.script_path, "status"])
-            if returncode == self.want_return_code:
-                return self.record_success()
-        except subprocess.CalledProcessError as e:
-            if e.returncode == self.want_return_code:
-                return self.record_success()
-            returncode = -1
-        except Exception as e:
-            return self.record_fail("Exception while executing script: %s" % e)
+        result = STATUS_PROBE.result(self._command)
+        if result.returncode is None:
+            return self.record_fail(
+                "Exception while executing script: %s" % result.error
+            )
+        if result.returncode == self.want_return_code:
+            return self.record_success()
         return self.record_fail(
-            "Return code: %d (wanted %d)" % (returncode, int(self.want_return_code))
+            "Return code: %d (wanted %d)"
+            % (result.returncode, int(self.want_return_code))
         )
 
     def get_params(self) -> Tuple:
@@ -200,25 +224,47 @@ class MonitorUnixService(Monitor):
             self._want_return_code = 0
         else:
             self._want_return_code = 1
+        self.timeout = cast(
+            float,
+            self.get_config_option(
+                "timeout", required_type="float", minimum=0, default=30
+            ),
+        )
+        self._use_systemd = cast(
+            bool,
+            self.get_config_option(
+                "systemd", required_type="bool", default=systemd_available()
+            ),
+        )
+        self._command = (("service", self.service_name, "status"), self.timeout)
+        # whether we need to run our command, rather than asking systemd; we
+        # find out on the first run whether systemd lists our service
+        self._needs_command = not self._use_systemd
+        if self._needs_command:
+            STATUS_PROBE.register(self, self._command)
+
+    def wants_status(self) -> bool:
+        """Whether we'll ask STATUS_PROBE for our command's result this loop."""
+        return self._needs_command and self.is_due() and not self.remaining_dependencies
 
     def run_test(self) -> bool:
-        try:
-            result = subprocess.run(
-                ["service", self.service_name, "status"],
-                check=True,
-                stderr=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-            )  # nosec
-            returncode = result.returncode
-        except subprocess.CalledProcessError as exception:
-            returncode = exception.returncode
-            if returncode == self._want_return_code:
-                return self.record_success()
-            self.record_fail(
-                "Failed to run 'service {} status: {}".format(
-                    self.service_name, exception.output
+        returncode = None
+        if self._use_systemd:
+            try:
+                returncode = systemd_status(self.service_name)
+            except Exception as e:
+                return self.record_fail("Failed to list systemd services: %s" % e)
+            self._needs_command = returncode is None
+        if returncode is None:
+            STATUS_PROBE.register(self, self._command)
+            result = STATUS_PROBE.result(self._command)
+            if result.returncode is None:
+                return self.record_fail(
+                    "Failed to run 'service {} status': {}".format(
+                        self.service_name, result.error
+                    )
                 )
-            )
+            returncode = result.returncode
         if returncode == self._want_return_code:
             return self.record_success()
         return self.record_fail(
@@ -234,28 +280,18 @@ class MonitorUnixService(Monitor):
 
 @register
 class MonitorSystemdUnit(Monitor):
-    """Monitor a systemd unit.
+    """Monitor a systemd unit, or all the units matching a glob.
 
-    This monitor checks the state of the unit as given by
+    This monitor checks the state of the units as given by
     /org/freedesktop/systemd1/ListUnits
-    and reports failure if it is not one of the expected states.
+    and reports failure if any is not in one of the expected states.
     """
 
     monitor_type = "systemd-unit"
-
-    # A cached shared by all instances of MonitorSystemdUnit, so a single
-    # call is done for all monitors at once.
-    _listunit_cache = []  # type: List[Any]
-    _listunit_cache_expiry = 0
-    CACHE_LIFETIME = 1  # in seconds
+    _local_attributes = ("_snapshot", "_matcher")
 
     def __init__(self, name: str, config_options: dict) -> None:
         super().__init__(name, config_options)
-        if not pydbus:
-            self.monitor_logger.critical(
-                "pydbus package is not available, cannot use MonitorSystemdUnit."
-            )
-            return
         self.unit_name = cast(str, self.get_config_option("name", required=True))
         self.want_load_states = cast(
             List[str],
@@ -273,62 +309,63 @@ class MonitorSystemdUnit(Monitor):
             List[str],
             self.get_config_option("sub_states", required_type="[str]", default=[]),
         )
-
-    @classmethod
-    def _list_units(cls) -> List[Any]:
-        if cls._listunit_cache_expiry < time.time():
-            bus = pydbus.SystemBus()
-            systemd = bus.get(".systemd1")
-            cls._listunit_cache_expiry = int(time.time()) + cls.CACHE_LIFETIME
-            cls._listunit_cache = list(systemd.ListUnits())
-        return cls._listunit_cache
+        watch = cast(
+            bool, self.get_config_option("watch", required_type="bool", default=False)
+        )
+        self._matcher = UnitMatcher(self.unit_name)
+        self._snapshot = UNIT_SNAPSHOT
+        if not pydbus:
+            self.monitor_logger.critical(
+                "pydbus package is not available, cannot use MonitorSystemdUnit."
+            )
+            return
+        if watch:
+            self._snapshot.watch()
 
     def run_test(self) -> bool:
-        """Check the service is in the desired state."""
-        nb_matches = 0
-        for unit in self._list_units():
-            (
-                name,
-                desc,
-                load_state,
-                active_state,
-                sub_state,
-                follower,
-                unit_path,
-                job_id,
-                job_type,
-                job_path,
-            ) = unit
-            if fnmatch.fnmatch(name, self.unit_name):
-                result = self._check_unit(name, load_state, active_state, sub_state)
-                nb_matches += 1
-                # TODO: is this right?
-                return result
-        return self.record_fail("No unit %s" % self.unit_name)
-
-    def _check_unit(
-        self, name: str, load_state: str, active_state: str, sub_state: str
-    ) -> bool:
-        if self.want_load_states and load_state not in self.want_load_states:
-            return self.record_fail(
-                "Unit {0} has load state: {1} (wanted {2})".format(
-                    name, load_state, self.want_load_states
+        """Check the units are in the desired state."""
+        if not pydbus:
+            return self.record_fail("pydbus package is not available")
+        try:
+            units = self._snapshot.table().find(self._matcher)
+        except Exception as e:
+            return self.record_fail("Unable to list units: {}".format(e))
+        if not units:
+            return self.record_fail("No unit %s" % self.unit_name)
+        problems = [x for x in (self._check_unit(unit) for unit in units) if x]
+        if len(units) == 1:
+            if problems:
+                return self.record_fail(problems[0])
+            return self.record_success(
+                "Unit {0} is {1} ({2})".format(
+                    units[0].name, units[0].active_state, units[0].sub_state
                 )
             )
-        if self.want_active_states and active_state not in self.want_active_states:
+        if problems:
             return self.record_fail(
-                "Unit {0} has active state: {1} (wanted {2})".format(
-                    name, active_state, self.want_active_states
+                "{0} of {1} units matching {2} failed: {3}".format(
+                    len(problems), len(units), self.unit_name, "; ".join(problems)
                 )
             )
-        if self.want_sub_states and sub_state not in self.want_sub_states:
-            return self.record_fail(
-                "Unit {0} has sub state: {1} (wanted {2})".format(
-                    name, sub_state, self.want_sub_states
-                )
+        return self.record_success(
+            "All {0} units matching {1} are ok".format(len(units), self.unit_name)
+        )
+
+    def _check_unit(self, unit: UnitInfo) -> Optional[str]:
+        """What's wrong with the unit, if anything."""
+        if self.want_load_states and unit.load_state not in self.want_load_states:
+            return "Unit {0} has load state: {1} (wanted {2})".format(
+                unit.name, unit.load_state, self.want_load_states
             )
-        # TODO: added since there's no other apparent path to success
-        return self.record_success("Implicit success for unit {0}".format(name))
+        if self.want_active_states and unit.active_state not in self.want_active_states:
+            return "Unit {0} has active state: {1} (wanted {2})".format(
+                unit.name, unit.active_state, self.want_active_states
+            )
+        if self.want_sub_states and unit.sub_state not in self.want_sub_states:
+            return "Unit {0} has sub state: {1} (wanted {2})".format(
+                unit.name, unit.sub_state, self.want_sub_states
+            )
+        return None
 
     def get_params(self) -> Tuple:
         return (
@@ -339,14 +376,33 @@ class MonitorSystemdUnit(Monitor):
         )
 
     def describe(self) -> str:
-        return "Checks unit %s is running" % self.name
+        return "Checks unit %s is running" % self.unit_name
+
+
+# how to show each of MonitorProcess's resource figures
+_USAGE_FORMATS = {
+    "rss": _bytes_to_size_string,
+    "cpu": "{:.1f}%".format,
+    "fds": str,
+    "threads": str,
+    "oldest": "{:.0f}s".format,
+    "youngest": "{:.0f}s".format,
+}  # type: Dict[str, Callable[[Any], str]]
+
+# (when, (pid, start time) -> CPU seconds) for each of a process monitor's runs
+_CPUSample = Tuple[float, Dict[Tuple[int, Optional[float]], float]]
 
 
 @register
 class MonitorProcess(Monitor):
-    """Check for a running process."""
+    """Check for a running process, and optionally its resource usage.
+
+    The usage limits apply to the sum or the max (per aggregate) of the
+    matching processes' figures. CPU use is measured over cpu_window seconds,
+    from the process times seen by earlier runs."""
 
     monitor_type = "process"
+    _local_attributes = ("_snapshot", "_cpu_samples")
 
     def __init__(
         self, name: str = "unnamed", config_options: Optional[dict] = None
@@ -354,7 +410,15 @@ class MonitorProcess(Monitor):
         if config_options is None:
             config_options = {}
         super().__init__(name=name, config_options=config_options)
-        if psutil is None:
+        self.reader = cast(
+            str,
+            self.get_config_option(
+                "reader", default="psutil", allowed_values=PROCESS_READERS
+            ),
+        )
+        if self.reader == "proc" and not proc_available():
+            raise RuntimeError("process reader proc needs /proc, which is not here")
+        if psutil is None and self.reader == "psutil":
             self.monitor_logger.critical("psutil is not installed.")
             self.monitor_logger.critical("Try: pip install -r requirements.txt")
         self.process_name = cast(
@@ -369,38 +433,170 @@ class MonitorProcess(Monitor):
         self.username = cast(
             Optional[str], self.get_config_option("username", required_type="str")
         )
-
-    @staticmethod
-    def _find_process_by_name(
-        name: str, username: Optional[str] = None
-    ) -> List[psutil.Process]:
-        processes = []
-        for process in psutil.process_iter(["name", "exe", "cmdline", "username"]):
-            if (
-                name == process.info["name"]
-                or (
-                    process.info["exe"]
-                    and os.path.basename(process.info["exe"]) == name
+        _max_rss = cast(Optional[str], self.get_config_option("max_rss"))
+        self.max_rss = _size_string_to_bytes(_max_rss) if _max_rss else None
+        self.max_cpu_percent = cast(
+            Optional[float],
+            self.get_config_option("max_cpu_percent", required_type="float", minimum=0),
+        )
+        self.cpu_window = cast(
+            int,
+            self.get_config_option(
+                "cpu_window", required_type="int", minimum=0, default=0
+            ),
+        )
+        self.max_fds = cast(
+            Optional[int],
+            self.get_config_option("max_fds", required_type="int", minimum=0),
+        )
+        self.max_threads = cast(
+            Optional[int],
+            self.get_config_option("max_threads", required_type="int", minimum=0),
+        )
+        self.max_age = cast(
+            Optional[int],
+            self.get_config_option("max_age", required_type="int", minimum=0),
+        )
+        self.min_age = cast(
+            Optional[int],
+            self.get_config_option("min_age", required_type="int", minimum=0),
+        )
+        self.aggregate = cast(
+            str,
+            self.get_config_option(
+                "aggregate", default="max", allowed_values=["max", "sum"]
+            ),
+        )
+        self._cpu_samples = deque()  # type: Deque[_CPUSample]
+        # monitors using the same reader share one copy of the process table
+        self._snapshot = PROCESS_SNAPSHOTS[self.reader]
+        fields = set()  # type: Set[str]
+        if self.username is not None:
+            fields.add("username")
+        if self.max_rss is not None:
+            fields.add("rss")
+        if self.max_cpu_percent is not None:
+            fields.update(["cpu_time", "create_time"])
+        if self.max_fds is not None:
+            fields.add("num_fds")
+        if self.max_threads is not None:
+            fields.add("num_threads")
+        if self.max_age is not None or self.min_age is not None:
+            fields.add("create_time")
+        self._snapshot.require(self, *sorted(fields))
+
+    def _aggregate(self, values: Iterable[Optional[float]]) -> Optional[float]:
+        known = [x for x in values if x is not None]
+        if not known:
+            return None
+        if self.aggregate == "sum":
+            return sum(known)
+        return max(known)
+
+    def _cpu_percents(self, when: float, processes: List[ProcessInfo]) -> List[float]:
+        """Each process's CPU use since the newest earlier sample at least
+        cpu_window seconds old (or the oldest, if none is yet), or since it
+        started if it was not running then."""
+        samples = self._cpu_samples
+        while len(samples) > 1 and when - samples[1][0] >= self.cpu_window:
+            samples.popleft()
+        (then, previous) = samples[0] if samples else (when, {})
+        current = {}  # type: Dict[Tuple[int, Optional[float]], float]
+        percents = []
+        for process in processes:
+            if process.cpu_time is None:
+                continue
+            key = (process.pid, process.create_time)
+            current[key] = process.cpu_time
+            if key in previous:
+                used = process.cpu_time - previous[key]
+                elapsed = when - then
+            elif process.create_time is not None:
+                used = process.cpu_time
+                elapsed = when - process.create_time
+            else:
+                continue
+            if elapsed > 0:
+                percents.append(used * 100 / elapsed)
+        samples.append((when, current))
+        return percents
+
+    def _check_usage(
+        self, when: float, processes: List[ProcessInfo]
+    ) -> Tuple[List[str], List[str]]:
+        """The matching processes' usage, and the limits it breaks."""
+        # (label, value, limit, whether the limit is a maximum)
+        checks = []  # type: List[Tuple[str, Optional[float], float, bool]]
+        if self.max_rss is not None:
+            checks.append(
+                ("rss", self._aggregate(p.rss for p in processes), self.max_rss, True)
+            )
+        if self.max_cpu_percent is not None:
+            checks.append(
+                (
+                    "cpu",
+                    self._aggregate(self._cpu_percents(when, processes)),
+                    self.max_cpu_percent,
+                    True,
                 )
-                or (process.info["cmdline"] and process.info["cmdline"][0] == name)
-            ):
-                if username is None or username == process.info["username"]:
-                    processes.append(process)
-        return processes
+            )
+        if self.max_fds is not None:
+            checks.append(
+                (
+                    "fds",
+                    self._aggregate(p.num_fds for p in processes),
+                    self.max_fds,
+                    True,
+                )
+            )
+        if self.max_threads is not None:
+            checks.append(
+                (
+                    "threads",
+                    self._aggregate(p.num_threads for p in processes),
+                    self.max_threads,
+                    True,
+                )
+            )
+        ages = [when - p.create_time for p in processes if p.create_time is not None]
+        if self.max_age is not None and ages:
+            checks.append(("oldest", max(ages), self.max_age, True))
+        if self.min_age is not None and ages:
+            checks.append(("youngest", min(ages), self.min_age, False))
+        usage = []
+        problems = []
+        for (label, value, limit, is_maximum) in checks:
+            if value is None:
+                continue
+            text = "{} {}".format(label, _USAGE_FORMATS[label](value))
+            if (is_maximum and value > limit) or (not is_maximum and value < limit):
+                problems.append(
+                    "{} {} {}".format(
+                        text, ">" if is_maximum else "<", _USAGE_FORMATS[label](limit)
+                    )
+                )
+            usage.append(text)
+        return (usage, problems)
 
     def run_test(self) -> bool:
-        if psutil is None:
+        if psutil is None and self.reader == "psutil":
             return self.record_fail("psutil is not installed")
-        processes = self._find_process_by_name(self.process_name, self.username)
+        table = self._snapshot.table()
+        processes = table.find(self.process_name, self.username)
         count = len(processes)
         if count == 1:
             message = "1 matching process running"
         else:
             message = "{} matching processes running".format(count)
+        (usage, problems) = self._check_usage(table.when, processes)
         if count < self.min_count:
             return self.record_fail(message)
         if self.max_count > -1 and count > self.max_count:
             return self.record_fail(message)
+        if problems:
+            return self.record_fail("{}; {}".format(message, ", ".join(problems)))
+        if usage:
+            message = "{}; {}".format(message, ", ".join(usage))
         return self.record_success(message)
 
     def get_params(self) -> Tuple:
@@ -414,6 +610,20 @@ class MonitorProcess(Monitor):
         )
         if self.username:
             desc = desc + " owned by {}".format(self.username)
+        limits = [
+            "{} {}".format(label, _USAGE_FORMATS[key](value))
+            for (label, key, value) in [
+                ("rss <=", "rss", self.max_rss),
+                ("cpu <=", "cpu", self.max_cpu_percent),
+                ("fds <=", "fds", self.max_fds),
+                ("threads <=", "threads", self.max_threads),
+                ("age <=", "oldest", self.max_age),
+                ("age >=", "youngest", self.min_age),
+            ]
+            if value is not None
+        ]
+        if limits:
+            desc = desc + " with {} {}".format(self.aggregate, ", ".join(limits))
         return desc
 
 
@@ -436,7 +646,7 @@ class MonitorEximQueue(Monitor):
 
     def run_test(self) -> bool:
         try:
-            _output = subprocess.check_output([self.path, "-xc"])
+            _output = check_output([self.path, "-xc"], timeout=self.command_timeout)
             output = _output.decode("utf-8")
             for line in output.splitlines():
                 matches = self.r.match(line)
@@ -487,8 +697,9 @@ class MonitorWindowsDHCPScope(Monitor):
     def run_test(self) -> bool:
         try:
             output = str(
-                subprocess.check_output(
-                    ["netsh", "dhcp", "server", "scope", self.scope, "show", "clients"]
+                check_output(
+                    ["netsh", "dhcp", "server", "scope", self.scope, "show", "clients"],
+                    timeout=self.command_timeout,
                 )
             )
             matches = self.r.search(output)
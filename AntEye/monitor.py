@@ -126,6 +126,16 @@ def main() -> None:
         default=False,
         help="Do not prefix log output with timestamps",
     )
+    testing_group.add_argument(
+        "--profile",
+        action="store_true",
+        dest="profile",
+        default=False,
+        help=(
+            "Profile each loop, writing reports to profile_dir. "
+            "SIGUSR1 also turns this on and off"
+        ),
+    )
     testing_group.add_argument(
         "--dump-known-resources",
         action="store_true",
@@ -201,6 +211,7 @@ def main() -> None:
         max_loops=options.loops,
         heartbeat=not options.no_heartbeat,
         one_shot=options.one_shot,
+        profile=options.profile,
     )
 
     if options.test:
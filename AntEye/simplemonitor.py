@@ -8,11 +8,12 @@ import pickle  # nosec
 import signal
 import sys
 import time
+from configparser import NoOptionError
 from pathlib import Path
 from socket import gethostname
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 
-from .Alerters.alerter import Alerter
+from .Alerters.alerter import Alerter, AlertType
 from .Alerters.alerter import all_types as all_alerter_types
 from .Alerters.alerter import get_class as get_alerter_class
 from .Loggers.logger import Logger
@@ -22,11 +23,20 @@ from .Loggers.network import Listener
 from .Monitors.monitor import Monitor
 from .Monitors.monitor import all_types as all_monitor_types
 from .Monitors.monitor import get_class as get_monitor_class
-from .util import get_config_dict
-from .util.envconfig import EnvironmentAwareConfigParser
+from .util import commands, config_fingerprint, get_config_dict
+from .util.envconfig import ConfigCache, EnvironmentAwareConfigParser
+from .util.loopcache import new_loop
+from .util.metrics import REGISTRY
+from .util.monitorconfig import load_monitor_sections
+from .util.profiler import LoopProfiler
+from .util.statestore import StateStore
 
 module_logger = logging.getLogger("AntEye")
 
+# alerters' states are saved under their name with this prefix, next to the
+# monitors'
+_ALERTER_STATE_PREFIX = "alerter:"
+
 
 class AntEye:
     """A fairly simple monitor."""
@@ -39,7 +49,8 @@ class AntEye:
         no_network: bool = False,
         max_loops: int = -1,
         heartbeat: bool = True,
-        one_shot: bool = False
+        one_shot: bool = False,
+        profile: bool = False
     ) -> None:
         """Main class turn on."""
         if isinstance(config_file, str):
@@ -58,6 +69,8 @@ class AntEye:
 
         self.loggers = {}  # type: Dict[str, Logger]
         self.alerters = {}  # type: Dict[str, Alerter]
+        # (kind, name) -> fingerprint of the config section it was loaded from
+        self._fingerprints = {}  # type: Dict[Tuple[str, str], str]
 
         self._hup_file = hup_file
         self._need_hup = False
@@ -68,9 +81,18 @@ class AntEye:
         self.heartbeat = heartbeat
         self.one_shot = one_shot
         self.pidfile = None  # type: Optional[str]
+        self._state_store = None  # type: Optional[StateStore]
+        self._config_cache = None  # type: Optional[ConfigCache]
+        self._monitors_include = []  # type: List[str]
+        self._profiling = profile
+        self._profiler = None  # type: Optional[LoopProfiler]
+        # the profiler for the loop in progress, if we're profiling it
+        self._loop_profiler = None  # type: Optional[LoopProfiler]
 
         self._setup_signals()
         self._load_config()
+        if self._state_store is not None and not self.one_shot:
+            self._load_state()
 
     def _load_config(self) -> None:
         """Load config, monitors, alerters and loggers."""
@@ -85,6 +107,30 @@ class AntEye:
         self._allow_pickle = config.getboolean("monitor", "allow_pickle", fallback=True)
         self.interval = config.getint("monitor", "interval")
         self.pidfile = config.get("monitor", "pidfile", fallback=None)
+        state_file = config.get("monitor", "state_file", fallback=None)
+        if state_file is None:
+            self._state_store = None
+        elif self._state_store is None or self._state_store.filename != Path(
+            state_file
+        ):
+            self._state_store = StateStore(Path(state_file))
+        if self._state_store is not None:
+            self._state_store.checkpoint_interval = config.getint(
+                "monitor", "state_checkpoint", fallback=300
+            )
+        config_cache = config.get("monitor", "config_cache", fallback=None)
+        if not config_cache:
+            self._config_cache = None
+        elif self._config_cache is None or self._config_cache.filename != Path(
+            config_cache
+        ):
+            self._config_cache = ConfigCache(Path(config_cache))
+        self._load_profiler(config)
+        max_commands = config.getint(
+            "monitor", "max_commands", fallback=commands.DEFAULT_MAX_RUNNING
+        )
+        if max_commands != commands.max_running():
+            commands.set_max_running(max_commands)
         hup_file = config.get("monitor", "hup_file", fallback=None)
         if hup_file is not None:
             self._hup_file = Path(hup_file)
@@ -106,19 +152,96 @@ class AntEye:
             self._network = False
 
         monitors_file = Path(config.get("monitor", "monitors", fallback="monitors.ini"))
-        self._load_monitors(monitors_file)
+        self._monitors_include = [
+            x.strip()
+            for x in config.get("monitor", "include", fallback="").split(",")
+            if x.strip()
+        ]
+        changed = self._load_monitors(monitors_file)
         count = self.count_monitors()
         if count == 0:
             module_logger.critical("No monitors loaded :(")
         self._load_loggers(config)
         self._load_alerters(config)
-        if not self._verify_dependencies():
+        if not self._verify_dependencies(changed):
             raise RuntimeError("Broken dependency configuration")
         if not self.verify_alerting():
             module_logger.critical("No alerters defined and no remote logger found")
         if self._network:
             self._start_network_thread()
 
+    def _load_profiler(self, config: EnvironmentAwareConfigParser) -> None:
+        directory = config.get("monitor", "profile_dir", fallback=None)
+        if directory:
+            path = Path(directory)  # type: Optional[Path]
+        elif self._state_store is not None:
+            path = self._state_store.filename.parent / "anteye-profile"
+        elif self._profiler is not None and self._profiler.temporary:
+            # keep using the private directory it made
+            path = self._profiler.directory
+        else:
+            # the profiler makes a private one when it first needs it; never a
+            # fixed path in the shared temporary directory
+            path = None
+        try:
+            self._profiler = LoopProfiler(
+                path,
+                mode=config.get("monitor", "profile_mode", fallback="sample"),
+                interval=config.getfloat("monitor", "profile_interval", fallback=0.01),
+                top=config.getint("monitor", "profile_top", fallback=10),
+                keep=config.getint("monitor", "profile_keep", fallback=20),
+                threshold=config.getfloat("monitor", "profile_threshold", fallback=0.0),
+            )
+        except ValueError as error:
+            raise RuntimeError("Invalid profile configuration: {}".format(error))
+
+    def _load_state(self) -> None:
+        """Restore monitor state saved by a previous run."""
+        if self._state_store is None:
+            return
+        states = self._state_store.load()
+        restored = 0
+        for name, monitor in self.monitors.items():
+            if name not in states:
+                continue
+            (monitor_type, state) = states[name]
+            if monitor_type != monitor.monitor_type:
+                module_logger.warning(
+                    "Not restoring state of monitor %s as it changed type", name
+                )
+                continue
+            monitor.restore_state(state)
+            restored += 1
+        for name, alerter in self.alerters.items():
+            saved = states.get(_ALERTER_STATE_PREFIX + name)
+            if saved is not None and saved[0] == alerter.alerter_type:
+                alerter.restore_state(saved[1])
+        module_logger.info(
+            "Restored state for %d monitors from %s",
+            restored,
+            self._state_store.filename,
+        )
+        # drops any monitors which no longer exist from the file
+        self._save_state(compact=True)
+
+    def _save_state(self, compact: bool = False, checkpoint: bool = False) -> None:
+        """Save the current state of the monitors and alerters."""
+        if self._state_store is None or self.one_shot:
+            return
+        states = {}  # type: Dict[str, Tuple[str, dict]]
+        volatile = set()  # type: Set[str]
+        for (name, monitor) in self.monitors.items():
+            states[name] = (monitor.monitor_type, monitor.get_state())
+            volatile.update(monitor._volatile_state_attributes)
+        for (name, alerter) in self.alerters.items():
+            states[_ALERTER_STATE_PREFIX + name] = (
+                alerter.alerter_type,
+                alerter.get_state(),
+            )
+        self._state_store.save(
+            states, compact=compact, volatile=volatile, checkpoint=checkpoint
+        )
+
     def _start_network_thread(self) -> None:
         if self._network:
             if not self._allow_pickle:
@@ -148,8 +271,10 @@ class AntEye:
             module_logger.info("Waiting for listener thread to exit")
             self._remote_listening_thread.join(0)
 
-    def _load_monitors(self, filename: Union[Path, str]) -> None:
-        """Load all the monitors from the config file."""
+    def _load_monitors(self, filename: Union[Path, str]) -> Set[str]:
+        """Load all the monitors from the config file.
+
+        Returns the names of the monitors which were added or reconfigured."""
         if isinstance(filename, str):
             filename = Path(filename)
         elif not isinstance(filename, Path):
@@ -159,38 +284,34 @@ class AntEye:
                 "Monitors config file {} does not exist".format(filename)
             )
         module_logger.info("Loading monitor config from %s", filename)
-        config = EnvironmentAwareConfigParser()
-        config.read(filename)
-        monitors = config.sections()
-        if "defaults" in monitors:
-            default_config = get_config_dict(config, "defaults")
-            monitors.remove("defaults")
-        else:
-            default_config = {}
+        sections = load_monitor_sections(
+            filename, self._monitors_include, self._config_cache
+        )
+        if self._config_cache is not None:
+            self._config_cache.save()
+        monitors = list(sections.keys())
 
         myhostname = gethostname().lower()
+        changed = set()  # type: Set[str]
 
         module_logger.info("=== Loading monitors")
-        for this_monitor in monitors:
-            if config.has_option(this_monitor, "runon"):
-                if myhostname != config.get(this_monitor, "runon").lower():
+        for (this_monitor, options) in sections.items():
+            if "runon" in options:
+                if myhostname != options["runon"].lower():
                     module_logger.warning(
                         "Ignoring monitor %s because it's only for host %s",
                         this_monitor,
-                        config.get(this_monitor, "runon"),
+                        options["runon"],
                     )
                     continue
-            monitor_type = config.get(this_monitor, "type")
+            if "type" not in options:
+                raise NoOptionError("type", this_monitor)
+            monitor_type = options["type"]
             new_monitor = None
-            config_options = default_config.copy()
-            config_options.update(get_config_dict(config, this_monitor))
+            # already a copy, with the defaults applied
+            config_options = options
             if self.has_monitor(this_monitor):
-                if self.monitors[this_monitor].monitor_type == config_options["type"]:
-                    module_logger.info(
-                        "Updating configuration for monitor %s", this_monitor
-                    )
-                    self.update_monitor_config(this_monitor, config_options)
-                else:
+                if self.monitors[this_monitor].monitor_type != config_options["type"]:
                     module_logger.error(
                         "Cannot update monitor %s from type %s to type %s. "
                         "Keeping original config for this monitor.",
@@ -198,6 +319,12 @@ class AntEye:
                         self.monitors[this_monitor].monitor_type,
                         config_options["type"],
                     )
+                elif self._config_changed("monitor", this_monitor, config_options):
+                    module_logger.info(
+                        "Updating configuration for monitor %s", this_monitor
+                    )
+                    self.update_monitor_config(this_monitor, config_options)
+                    changed.add(this_monitor)
                 continue
 
             try:
@@ -216,12 +343,19 @@ class AntEye:
                 "Adding %s monitor %s: %s", monitor_type, this_monitor, new_monitor
             )
             self.add_monitor(this_monitor, new_monitor)
+            self._config_changed("monitor", this_monitor, config_options)
+            changed.add(this_monitor)
 
         for monitor in self.monitors.values():
             monitor.set_mon_refs(self.monitors)
             monitor.post_config_setup()
         self.prune_monitors(monitors)
-        module_logger.info("--- Loaded %d monitors", self.count_monitors())
+        module_logger.info(
+            "--- Loaded %d monitors (%d new or changed)",
+            self.count_monitors(),
+            len(changed),
+        )
+        return changed
 
     def _load_loggers(self, config: EnvironmentAwareConfigParser) -> None:
         """Load the loggers listed in the config object."""
@@ -237,12 +371,7 @@ class AntEye:
             config_options = get_config_dict(config, config_logger)
             config_options["_name"] = config_logger
             if self.has_logger(config_logger):
-                if self.loggers[config_logger].logger_type == config_options["type"]:
-                    module_logger.info(
-                        "Updating configuration for logger %s", config_logger
-                    )
-                    self.update_logger_config(config_logger, config_options)
-                else:
+                if self.loggers[config_logger].logger_type != config_options["type"]:
                     module_logger.error(
                         "Cannot update logger %s from type %s to type %s. "
                         "Keeping original config for this logger.",
@@ -250,6 +379,11 @@ class AntEye:
                         self.loggers[config_logger].logger_type,
                         config_options["type"],
                     )
+                elif self._config_changed("logger", config_logger, config_options):
+                    module_logger.info(
+                        "Updating configuration for logger %s", config_logger
+                    )
+                    self.update_logger_config(config_logger, config_options)
                 continue
             try:
                 logger_cls = get_logger_class(logger_type)
@@ -268,8 +402,11 @@ class AntEye:
                 "Adding %s logger %s: %s", logger_type, config_logger, new_logger
             )
             self.add_logger(config_logger, new_logger)
+            self._config_changed("logger", config_logger, config_options)
             del new_logger
         self.prune_loggers(loggers)
+        # only pay for instrumentation if a logger is going to expose it
+        REGISTRY.enabled = any(x.uses_metrics for x in self.loggers.values())
         module_logger.info("--- Loaded %d loggers", len(self.loggers))
 
     def _load_alerters(self, config: EnvironmentAwareConfigParser) -> None:
@@ -284,12 +421,7 @@ class AntEye:
             alerter_type = config.get(this_alerter, "type")
             config_options = get_config_dict(config, this_alerter)
             if self.has_alerter(this_alerter):
-                if self.alerters[this_alerter].alerter_type == config_options["type"]:
-                    module_logger.info(
-                        "Updating configuration for alerter %s", this_alerter
-                    )
-                    self.update_alerter_config(this_alerter, config_options)
-                else:
+                if self.alerters[this_alerter].alerter_type != config_options["type"]:
                     module_logger.error(
                         "Cannot update alerter %s from type %s to type %s. "
                         "Keeping original config for this alerter.",
@@ -297,6 +429,11 @@ class AntEye:
                         self.alerters[this_alerter].alerter_type,
                         config_options["type"],
                     )
+                elif self._config_changed("alerter", this_alerter, config_options):
+                    module_logger.info(
+                        "Updating configuration for alerter %s", this_alerter
+                    )
+                    self.update_alerter_config(this_alerter, config_options)
                 continue
             try:
                 alerter_cls = get_alerter_class(alerter_type)
@@ -311,10 +448,23 @@ class AntEye:
             module_logger.info("Adding %s alerter %s", alerter_type, this_alerter)
             new_alerter.name = this_alerter
             self.add_alerter(this_alerter, new_alerter)
+            self._config_changed("alerter", this_alerter, config_options)
             del new_alerter
         self.prune_alerters(alerters)
         module_logger.info("--- Loaded %d alerters", len(self.alerters))
 
+    def _config_changed(self, kind: str, name: str, config_options: dict) -> bool:
+        """Check if a config section differs from when we last loaded it.
+
+        Also records the section as loaded, so only the first call for a given
+        change returns True."""
+        fingerprint = config_fingerprint(config_options)
+        if self._fingerprints.get((kind, name)) == fingerprint:
+            module_logger.debug("Configuration for %s %s is unchanged", kind, name)
+            return False
+        self._fingerprints[(kind, name)] = fingerprint
+        return True
+
     def _setup_signals(self) -> None:
         """Set up the SIGHUP handler."""
         _message = (
@@ -327,12 +477,23 @@ class AntEye:
             module_logger.warning(_message)
         except AttributeError:  # pragma: no cover
             module_logger.warning(_message)
+        try:
+            signal.signal(signal.SIGUSR1, self._handle_sigusr1)
+        except (ValueError, AttributeError):  # pragma: no cover
+            module_logger.debug("Unable to trap SIGUSR1; use --profile instead")
 
     def _handle_sighup(self, *_: Any) -> None:
         """Receive SIGHUP and process it."""
         module_logger.warning("Received SIGHUP")
         self._need_hup = True
 
+    def _handle_sigusr1(self, *_: Any) -> None:
+        """Receive SIGUSR1 and toggle profiling from the next loop."""
+        self._profiling = not self._profiling
+        module_logger.warning(
+            "Received SIGUSR1, turning profiling %s", "on" if self._profiling else "off"
+        )
+
     def _check_hup_file(self) -> bool:
         """Check a file's timestamp, and if it's newer than last time, treat it
         the same as receiving SIGHUP so that a reload is triggered. This allows
@@ -406,11 +567,18 @@ class AntEye:
         for key in list(self.monitors.keys()):
             self.monitors[key].reset_dependencies()
 
-    def _verify_dependencies(self) -> bool:
-        """Check if all monitors have valid dependencies."""
+    def _verify_dependencies(self, names: Optional[Iterable[str]] = None) -> bool:
+        """Check if monitors have valid dependencies.
+
+        If names is given, only check those monitors."""
         ok = True
         monitors = self.monitors.keys()
-        for key, monitor in self.monitors.items():
+        if names is None:
+            names = monitors
+        for key in names:
+            monitor = self.monitors.get(key)
+            if monitor is None:
+                continue
             for dependency in monitor.dependencies:
                 if dependency not in monitors:
                     module_logger.critical(
@@ -448,10 +616,17 @@ class AntEye:
     def run_tests(self) -> None:
         """Run the tests for all the monitors."""
         self.reset_monitors()
+        # anything the monitors share (e.g. the process table) is out of date
+        new_loop()
 
         joblist = list(self.monitors.keys())
         joblist = self.sort_joblist(joblist)
         failed = []  # type: List[str]
+        # the monitors to tell when each monitor succeeds
+        dependents = {}  # type: Dict[str, List[str]]
+        for monitor in joblist:
+            for dep in self.monitors[monitor].remaining_dependencies:
+                dependents.setdefault(dep, []).append(monitor)
 
         not_run = False
 
@@ -497,11 +672,16 @@ class AntEye:
                 try:
                     if self.monitors[monitor].should_run():
                         not_run = False
-                        start_time = time.time()
+                        start_time = time.perf_counter()
                         self.monitors[monitor].run_test()
-                        end_time = time.time()
-                        self.monitors[monitor].last_run_duration = int(
-                            end_time - start_time
+                        duration = time.perf_counter() - start_time
+                        self.monitors[monitor].last_run_duration = duration
+                        self._record_time("monitor", monitor, duration)
+                        REGISTRY.observe(
+                            "anteye_monitor_run_seconds",
+                            duration,
+                            monitor=monitor,
+                            type=self.monitors[monitor].monitor_type,
                         )
                     else:
                         not_run = True
@@ -529,7 +709,7 @@ class AntEye:
                 else:
                     if not not_run:
                         module_logger.info("monitor passed: %s", monitor)
-                    for monitor2 in joblist:
+                    for monitor2 in dependents.get(monitor, []):
                         self.monitors[monitor2].dependency_succeeded(monitor)
             joblist = copy.copy(new_joblist)
 
@@ -539,7 +719,8 @@ class AntEye:
         with logger:
             for key, monitor in self.monitors.items():
                 if monitor.group in logger.groups:
-                    logger.save_result2(key, monitor)
+                    if logger.should_log(key, monitor):
+                        self._save_result(logger, key, monitor)
                 else:
                     module_logger.debug(
                         "not logging for %s due to group mismatch (monitor in group %s, "
@@ -551,10 +732,40 @@ class AntEye:
             try:
                 for host_monitors in self.remote_monitors.values():
                     for (name, monitor) in host_monitors.items():
-                        logger.save_result2(name, monitor)
+                        if logger.should_log(name, monitor):
+                            self._save_result(logger, name, monitor)
             except Exception:  # pragma: no cover
                 module_logger.exception("exception while logging remote monitors")
 
+    @staticmethod
+    def _save_result(logger: Logger, name: str, monitor: Monitor) -> None:
+        start = time.perf_counter()
+        logger.save_result2(name, monitor)
+        REGISTRY.observe(
+            "anteye_logger_save_seconds",
+            time.perf_counter() - start,
+            logger=logger.name,
+            type=logger.logger_type,
+        )
+
+    @staticmethod
+    def _send_alert(alerter: Alerter, name: str, monitor: Monitor) -> None:
+        """Have the alerter send an alert, timing it if it decided to send one."""
+        alerter.last_alert_type = AlertType.NONE
+        start = time.perf_counter()
+        alerter.send_alert(name, monitor)
+        if alerter.last_alert_type != AlertType.NONE:
+            labels = {"alerter": str(alerter.name), "type": alerter.alerter_type}
+            REGISTRY.observe(
+                "anteye_alerter_send_seconds", time.perf_counter() - start, **labels
+            )
+            REGISTRY.inc(
+                "anteye_alerts_total",
+                1,
+                alert_type=alerter.last_alert_type.value,
+                **labels
+            )
+
     def do_alert(self, alerter: Alerter) -> None:
         """Use the given alerter object to send an alert, if needed."""
         alerter.check_dependencies(self.failed + self.still_failing + self.skipped)
@@ -571,7 +782,7 @@ class AntEye:
                     # Only notifications for services that have it enabled
                     if this_monitor.notify:
                         module_logger.debug("notifying alerter %s", alerter.name)
-                        alerter.send_alert(key, self.monitors[key])
+                        self._send_alert(alerter, key, self.monitors[key])
                     else:
                         module_logger.warning(
                             "monitor %s has notifications disabled", key
@@ -589,7 +800,7 @@ class AntEye:
             for (name, monitor) in host_monitors.items():
                 try:
                     if monitor.remote_alerting:
-                        alerter.send_alert(name, monitor)
+                        self._send_alert(alerter, name, monitor)
                     else:
                         module_logger.debug(
                             "not alerting for monitor %s as it doesn't want remote alerts",
@@ -626,14 +837,25 @@ class AntEye:
         """Remove monitors which are in our list but not in the list passed to us.
 
         Used to tidy up after a config reload (which may have removed monitors)"""
+        keep = set(retain)
         delete_list = []
         for monitor in self.monitors:
-            if monitor not in retain:
+            if monitor not in keep:
                 module_logger.info("Removing monitor %s", monitor)
                 delete_list.append(monitor)
+        if not delete_list:
+            return
         for monitor in delete_list:
             del self.monitors[monitor]
-        if not self._verify_dependencies():
+            self._fingerprints.pop(("monitor", monitor), None)
+            REGISTRY.forget("monitor", monitor)
+        removed = set(delete_list)
+        dependents = [
+            name
+            for (name, monitor) in self.monitors.items()
+            if removed.intersection(monitor.dependencies)
+        ]
+        if not self._verify_dependencies(dependents):
             module_logger.critical(
                 "Broken dependencies after pruning monitors, aborting!"
             )
@@ -650,6 +872,8 @@ class AntEye:
                 delete_list.append(alerter)
         for alerter in delete_list:
             del self.alerters[alerter]
+            self._fingerprints.pop(("alerter", alerter), None)
+            REGISTRY.forget("alerter", alerter)
 
     def prune_loggers(self, retain: List[str]) -> None:
         """Remove loggers which are in our list but not in the list passed to us.
@@ -662,11 +886,15 @@ class AntEye:
                 delete_list.append(logger)
         for logger in delete_list:
             del self.loggers[logger]
+            self._fingerprints.pop(("logger", logger), None)
+            REGISTRY.forget("logger", logger)
 
     def do_alerts(self) -> None:
         """Run the alert process for each alerter."""
         for alerter in self.alerters.values():
+            start = time.perf_counter()
             self.do_alert(alerter)
+            self._record_time("alerter", str(alerter.name), time.perf_counter() - start)
 
     def do_recovery(self) -> None:
         """Attempt recovery for each monitor."""
@@ -686,7 +914,9 @@ class AntEye:
     def do_logs(self) -> None:
         """Log result for each logger."""
         for logger in self.loggers.values():
+            start = time.perf_counter()
             self.log_result(logger)
+            self._record_time("logger", logger.name, time.perf_counter() - start)
 
     def update_remote_monitor(self, data: Any, hostname: str) -> None:
         """Process a list of monitors received from a remote host."""
@@ -742,17 +972,60 @@ class AntEye:
 
     def run_loop(self) -> None:
         """Run the complete monitor loop once."""
-        module_logger.debug("Running tests")
-        self.run_tests()
-        module_logger.debug("Running recovery")
-        self.do_recovery()
-        self.do_recovered()
-        module_logger.debug("Running alerts")
-        self.do_alerts()
-        module_logger.debug("Running logs")
-        self.do_logs()
+        if self._profiling and self._profiler is not None:
+            self._loop_profiler = self._profiler
+            self._loop_profiler.start()
+        start = time.perf_counter()
+        try:
+            module_logger.debug("Running tests")
+            self._run_phase("run_tests", self.run_tests)
+            module_logger.debug("Running recovery")
+            self._run_phase("do_recovery", self.do_recovery)
+            self._run_phase("do_recovered", self.do_recovered)
+            module_logger.debug("Running alerts")
+            self._run_phase("do_alerts", self.do_alerts)
+            module_logger.debug("Running logs")
+            self._run_phase("do_logs", self.do_logs)
+            self._save_state()
+        finally:
+            duration = time.perf_counter() - start
+            self._finish_profile(duration)
+        REGISTRY.observe("anteye_loop_seconds", duration)
+        if duration > self.interval:
+            REGISTRY.inc("anteye_loop_overruns_total")
         module_logger.debug("Loop complete")
 
+    def _record_time(self, kind: str, name: str, seconds: float) -> None:
+        """Tell the profiler, if any, how long a monitor/logger/alerter took."""
+        if self._loop_profiler is not None:
+            self._loop_profiler.record(kind, name, seconds)
+
+    def _finish_profile(self, duration: float) -> None:
+        if self._loop_profiler is None:
+            return
+        profiler = self._loop_profiler
+        self._loop_profiler = None
+        report = profiler.stop(duration, self.interval)
+        if report is None:
+            return
+        if duration > self.interval:
+            module_logger.warning(
+                "Loop took %.1fs, longer than the interval of %ds; see %s",
+                duration,
+                self.interval,
+                report,
+            )
+        else:
+            module_logger.info("Loop profile written to %s", report)
+
+    @staticmethod
+    def _run_phase(phase: str, function: Callable[[], None]) -> None:
+        start = time.perf_counter()
+        function()
+        REGISTRY.observe(
+            "anteye_loop_phase_seconds", time.perf_counter() - start, phase=phase
+        )
+
     def run(self) -> None:
         self._create_pid_file()
         module_logger.info(
@@ -811,5 +1084,7 @@ class AntEye:
                 module_logger.info("Quitting")
                 loop = False
 
+        # the counters and such may not have been saved for a while
+        self._save_state(checkpoint=True)
         self._stop_network_thread()
         self._remove_pid_file()
@@ -1,7 +1,10 @@
 """Utilities for AntEye."""
 
 import datetime
+import hashlib
+import importlib
 import socket
+import sys
 from enum import Enum
 from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
@@ -195,9 +198,24 @@ def get_config_dict(
     return ret
 
 
+def config_fingerprint(config_options: Dict[str, str]) -> str:
+    """Summarise a config section, so we can tell if it changed on a reload."""
+    digest = hashlib.blake2b(digest_size=16)
+    for (key, value) in sorted(config_options.items()):
+        digest.update(key.encode("utf-8") + b"\0" + value.encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
 def subclass_dict_handler(
-    mod: str, base_cls: type, type_attr: str
+    mod: str, base_cls: type, type_attr: str, lazy: Optional[Dict[str, str]] = None
 ) -> Tuple[Callable, Callable, Callable]:
+    """Create the register, get_class and all_types functions for a kind of plugin.
+
+    lazy maps type names to the module (relative to mod's package) which
+    defines them; that module is only imported the first time get_class() is
+    asked for one of its types, so we don't pay for importing every plugin and
+    its dependencies at startup."""
+
     def _check_is_subclass(cls: Any) -> None:
         if not issubclass(cls, base_cls):
             raise TypeError(
@@ -206,6 +224,8 @@ def subclass_dict_handler(
             )
 
     _subclasses = {}
+    _lazy = dict(lazy or {})
+    package = mod.rpartition(".")[0]
 
     def register(cls: Any) -> Any:
         """Decorator for monitor classes."""
@@ -216,9 +236,32 @@ def subclass_dict_handler(
         return cls
 
     def get_class(type_: Any) -> Any:
+        if type_ not in _subclasses and type_ in _lazy:
+            # registers the class as a side effect
+            importlib.import_module("." + _lazy[type_], package)
         return _subclasses[type_]
 
     def all_types() -> list:
-        return list(_subclasses)
+        return sorted(set(_subclasses).union(_lazy))
 
     return (register, get_class, all_types)
+
+
+def lazy_exports(
+    package: str, exports: Dict[str, str], get_class: Callable
+) -> Callable[[str], Any]:
+    """Create a module __getattr__ for a plugin package, so its classes can
+    still be imported from it without every plugin being imported up front.
+
+    exports maps each name to a plugin type defined in the same module as it;
+    get_class() imports that module (see subclass_dict_handler) the first time
+    the name is asked for."""
+
+    def __getattr__(name: str) -> Any:
+        if name not in exports:
+            raise AttributeError(
+                "module {!r} has no attribute {!r}".format(package, name)
+            )
+        return getattr(sys.modules[get_class(exports[name]).__module__], name)
+
+    return __getattr__
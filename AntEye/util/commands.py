@@ -0,0 +1,164 @@
+"""Run external commands for the monitors, loggers and alerters, within limits.
+
+Each command gets a time limit. It runs in its own session (on POSIX), so
+when the limit is up the command and anything it has started are killed
+together, and a hung command can't hold up the loop for longer than that.
+Captured output is capped at OUTPUT_LIMIT bytes; beyond that it is read and
+thrown away, so the command isn't left blocked writing it. No more than
+max_running() commands run at once, across all threads.
+
+Commands are started by subprocess, which uses vfork() or posix_spawn()
+where the platform allows, so starting one stays cheap however large the
+daemon grows."""
+
+import os
+import signal
+import subprocess  # nosec
+import threading
+from typing import List, Optional, Sequence
+
+# seconds a command may run for, unless its caller says otherwise
+DEFAULT_TIMEOUT = 60.0
+
+# the most output kept from a command
+OUTPUT_LIMIT = 1024 * 1024
+
+# how long to wait for the rest of a command's output once it has exited; any
+# longer, and something it started (and left running) has the pipe
+_GRACE = 1.0
+
+# how many commands may run at once, unless configured otherwise
+DEFAULT_MAX_RUNNING = 8
+
+_max_running = DEFAULT_MAX_RUNNING
+_slots = threading.BoundedSemaphore(_max_running)
+
+
+def set_max_running(count: int) -> None:
+    """Allow at most count commands to run at once."""
+    global _max_running, _slots
+    if count < 1:
+        raise ValueError("need to be able to run at least 1 command")
+    _max_running = count
+    _slots = threading.BoundedSemaphore(count)
+
+
+def max_running() -> int:
+    return _max_running
+
+
+class CommandResult:
+    """A finished command's exit code and (up to the limit) output."""
+
+    __slots__ = ("returncode", "output", "truncated")
+
+    def __init__(self, returncode: int, output: bytes, truncated: bool) -> None:
+        self.returncode = returncode
+        self.output = output
+        self.truncated = truncated
+
+
+class _Output:
+    """What a command writes to a pipe, kept up to a limit."""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.chunks = []  # type: List[bytes]
+        self.size = 0
+        self.truncated = False
+
+    def read(self, descriptor: int) -> None:
+        try:
+            while True:
+                data = os.read(descriptor, 65536)
+                if not data:
+                    return
+                room = self.limit - self.size
+                if len(data) > room:
+                    self.truncated = True
+                    data = data[:room]
+                if data:
+                    self.chunks.append(data)
+                    self.size += len(data)
+        except OSError:
+            return
+
+    def data(self) -> bytes:
+        return b"".join(self.chunks)
+
+
+def _kill(process: subprocess.Popen) -> None:
+    if os.name == "posix":
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+            return
+        except OSError:
+            pass
+    process.kill()
+
+
+def run(
+    args: Sequence[str],
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
+    capture: bool = True,
+    stderr: Optional[int] = None,
+    limit: int = OUTPUT_LIMIT,
+) -> CommandResult:
+    """Run args, and return its exit code and output (stdout, and stderr too
+    if stderr is subprocess.STDOUT).
+
+    Raises subprocess.TimeoutExpired (with the output so far) if it runs for
+    longer than timeout seconds, having killed it; OSError if it can't be
+    started. A timeout of 0, like None, means no limit."""
+    with _slots:
+        process = subprocess.Popen(  # nosec
+            list(args),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE if capture else None,
+            stderr=stderr if capture else None,
+            start_new_session=os.name == "posix",
+        )
+        output = _Output(limit)
+        reader = None
+        if process.stdout is not None:
+            reader = threading.Thread(
+                target=output.read, args=(process.stdout.fileno(),), daemon=True
+            )
+            reader.start()
+        expired = None  # type: Optional[subprocess.TimeoutExpired]
+        try:
+            process.wait(timeout or None)
+        except subprocess.TimeoutExpired as error:
+            expired = error
+            _kill(process)
+            process.wait()
+        if reader is not None:
+            reader.join(_GRACE)
+            if not reader.is_alive():
+                process.stdout.close()  # type: ignore
+    if expired is not None:
+        raise subprocess.TimeoutExpired(
+            list(args), expired.timeout, output=output.data()
+        )
+    return CommandResult(process.returncode, output.data(), output.truncated)
+
+
+def check_output(
+    args: Sequence[str],
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
+    stderr: Optional[int] = None,
+    limit: int = OUTPUT_LIMIT,
+) -> bytes:
+    """As subprocess.check_output(), within the limits."""
+    result = run(args, timeout=timeout, stderr=stderr, limit=limit)
+    if result.returncode:
+        raise subprocess.CalledProcessError(
+            result.returncode, list(args), output=result.output
+        )
+    return result.output
+
+
+def call(args: Sequence[str], timeout: Optional[float] = DEFAULT_TIMEOUT) -> int:
+    """As subprocess.call(), within the limits; the command's output goes
+    where ours does."""
+    return run(args, timeout=timeout, capture=False).returncode
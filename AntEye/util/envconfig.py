@@ -1,16 +1,56 @@
 """A version of ConfigParser which supports subsitutions from environment variables."""
 
+import hashlib
+import logging
+import marshal
 import os
 import re
-from configparser import BasicInterpolation, ConfigParser
-from typing import Any, List, Optional
+import tempfile
+import time
+from configparser import BasicInterpolation, ConfigParser, DuplicateSectionError
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Match,
+    Optional,
+    Tuple,
+)
+
+module_logger = logging.getLogger("AntEye.envconfig")
+
+_ENV_PATTERN = re.compile("%env:([a-zA-Z0-9_]+)%")
+
+
+def interpolate_env(value: str, environ: Optional[Mapping[str, str]] = None) -> str:
+    """Replace %env:VAR% in a string with the value of VAR from the environment."""
+    if "%env:" not in value:
+        return value
+    if environ is None:
+        environ = os.environ
+
+    def _env_value(match: Match[str]) -> str:
+        try:
+            return environ[match.group(1)]  # type: ignore
+        except KeyError:
+            raise ValueError(
+                "Cannot find {0} in environment for config interpolation".format(
+                    match.group(1)
+                )
+            )
+
+    return _ENV_PATTERN.sub(_env_value, value)
 
 
 class EnvironmentAwareConfigParser(ConfigParser):
     """A subclass of ConfigParser which allows %env:VAR% interpolation via the
     get method."""
 
-    r = re.compile("%env:([a-zA-Z0-9_]+)%")
+    r = _ENV_PATTERN
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         """Init with our specific interpolation class (for Python 3)"""
@@ -21,24 +61,11 @@ class EnvironmentAwareConfigParser(ConfigParser):
     def read(self, filenames: Any, encoding: Optional[str] = None) -> List[str]:
         """Load a config file and do environment variable interpolation on the section names."""
         result = ConfigParser.read(self, filenames)
-        for section in self.sections():
-            original_section = section
-            matches = self.r.search(section)
-            while matches:
-                env_key = matches.group(1)
-                if env_key in os.environ:
-                    section = section.replace(matches.group(0), os.environ[env_key])
-                else:
-                    raise ValueError(
-                        "Cannot find {0} in environment for config interpolation".format(
-                            env_key
-                        )
-                    )
-
-                matches = self.r.search(section)
+        for original_section in self.sections():
+            section = interpolate_env(original_section)
             if section != original_section:
                 self.add_section(section)
-                for (option, value) in self.items(original_section):
+                for (option, value) in self.items(original_section, raw=True):
                     self.set(section, option, value)
                 self.remove_section(original_section)
         return result
@@ -47,26 +74,228 @@ class EnvironmentAwareConfigParser(ConfigParser):
 class EnvironmentAwareInterpolation(BasicInterpolation):
     """An interpolation which substitutes values from the environment."""
 
-    r = re.compile("%env:([a-zA-Z0-9_]+)%")
+    r = _ENV_PATTERN
 
     def before_get(
         self, parser: Any, section: str, option: str, value: Any, defaults: Any
     ) -> Any:
-        parser.get(section, option, raw=True, fallback=value)
-        matches = self.r.search(value)
-        old_value = value
-        while matches:
-            env_key = matches.group(1)
-            if env_key in os.environ:
-                value = value.replace(matches.group(0), os.environ[env_key])
-            else:
-                raise ValueError(
-                    "Cannot find {0} in environment for config interpolation".format(
-                        env_key
-                    )
-                )
-            matches = self.r.search(value)
-            if value == old_value:
+        return interpolate_env(value)
+
+
+# Bump this if the format of the compiled cache changes
+_CACHE_FORMAT = 2
+
+# A file modified this recently might be modified again without its mtime
+# changing, so we check its contents rather than trusting the mtime
+_MTIME_GRANULARITY = 2
+
+# (filename, kind) -> (mtime_ns, size, digest, parsed, mtime_is_safe)
+_compiled = {}  # type: Dict[Tuple[str, str], tuple]
+
+
+def _parse_simple(data: str) -> Optional[List[Tuple[str, Dict[str, str]]]]:
+    """Parse a config file made only of headers, "key = value" lines and comments.
+
+    This is much quicker than ConfigParser for large files. It gives up,
+    returning None, on anything else (continuation lines, DEFAULT, duplicates,
+    or syntax errors) so ConfigParser can deal with those."""
+    sections = []  # type: List[Tuple[str, Dict[str, str]]]
+    seen = set()
+    options = None  # type: Optional[Dict[str, str]]
+    for line in data.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped[0] in "#;":
+            continue
+        if line[0] in " \t":
+            return None
+        if stripped[0] == "[":
+            name = stripped[1:-1]
+            if (
+                stripped[-1] != "]"
+                or not name
+                or "]" in name
+                or name == "DEFAULT"
+                or name in seen
+            ):
+                return None
+            seen.add(name)
+            options = {}
+            sections.append((name, options))
+            continue
+        equals = line.find("=")
+        colon = line.find(":")
+        if equals == -1 or (colon != -1 and colon < equals):
+            equals = colon
+        key = line[:equals].strip().lower()
+        if options is None or equals == -1 or not key or key in options:
+            return None
+        options[key] = line[equals + 1 :].strip()
+    return sections
+
+
+def _parse_sections(data: str, filename: str) -> List[Tuple[str, Dict[str, str]]]:
+    """Parse a config file into (section, options) pairs, without interpolation."""
+    sections = _parse_simple(data)
+    if sections is not None:
+        return sections
+    parser = ConfigParser(interpolation=None)
+    parser.read_string(data, source=filename)
+    return [
+        (section, dict(parser.items(section, raw=True)))
+        for section in parser.sections()
+    ]
+
+
+class ConfigCache:
+    """A file holding the parsed form of config files, keyed on their contents.
+
+    It is read on first use; call save() to write back any changes."""
+
+    def __init__(self, filename: Path) -> None:
+        self.filename = filename
+        self._entries = None  # type: Optional[Dict[str, Tuple[str, list]]]
+        self._changed = False
+
+    def _load(self) -> Dict[str, Tuple[str, list]]:
+        if self._entries is not None:
+            return self._entries
+        self._entries = {}
+        try:
+            with open(self.filename, "rb") as file_handle:
+                # marshal.load() on a file object is far slower than reading it all
+                cached = marshal.loads(file_handle.read())  # nosec
+        except FileNotFoundError:
+            return self._entries
+        except (OSError, EOFError, ValueError, TypeError):
+            module_logger.warning("Ignoring unreadable config cache %s", self.filename)
+            return self._entries
+        if (
+            isinstance(cached, tuple)
+            and len(cached) == 2
+            and cached[0] == _CACHE_FORMAT
+            and isinstance(cached[1], dict)
+        ):
+            self._entries = cached[1]
+        return self._entries
+
+    def get(self, filename: str, digest: str) -> Optional[list]:
+        entry = self._load().get(filename)
+        if entry is None or entry[0] != digest:
+            return None
+        return entry[1]
+
+    def put(self, filename: str, digest: str, sections: list) -> None:
+        self._load()[filename] = (digest, sections)
+        self._changed = True
+
+    def save(self) -> None:
+        """Write the cache back, if it changed, dropping files which are gone."""
+        if not self._changed or self._entries is None:
+            return
+        entries = {k: v for (k, v) in self._entries.items() if os.path.exists(k)}
+        temp_name = None
+        try:
+            (temp_fd, temp_name) = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(self.filename)),
+                prefix=".",
+                suffix=".tmp",
+            )
+            with os.fdopen(temp_fd, "wb") as file_handle:
+                file_handle.write(marshal.dumps((_CACHE_FORMAT, entries)))
+            os.replace(temp_name, self.filename)
+        except OSError:
+            module_logger.exception("Could not write config cache %s", self.filename)
+            if temp_name is not None and os.path.exists(temp_name):
+                os.unlink(temp_name)
+            return
+        self._entries = entries
+        self._changed = False
+
+
+def read_parsed_file(
+    filename: Path, kind: str, parse: Callable[[bytes, str], Any]
+) -> Tuple[str, Any]:
+    """Return the digest of a file's contents and the result of parse() on them.
+
+    The result is kept in memory, and parse() is only called again when the
+    file changes. kind distinguishes different parsers of the same file."""
+    key = (os.path.abspath(filename), kind)
+    stat = os.stat(filename)
+    previous = _compiled.get(key)
+    if (
+        previous is not None
+        and previous[4]
+        and previous[0] == stat.st_mtime_ns
+        and previous[1] == stat.st_size
+    ):
+        return (previous[2], previous[3])
+    mtime_is_safe = stat.st_mtime + _MTIME_GRANULARITY < time.time()
+    with open(filename, "rb") as file_handle:
+        raw = file_handle.read()
+    digest = hashlib.sha256(raw).hexdigest()
+    if previous is not None and previous[2] == digest:
+        parsed = previous[3]
+    else:
+        parsed = parse(raw, digest)
+    _compiled[key] = (stat.st_mtime_ns, stat.st_size, digest, parsed, mtime_is_safe)
+    return (digest, parsed)
+
+
+def read_raw_sections(
+    filename: Path, cache: Optional[ConfigCache] = None
+) -> Tuple[str, List[Tuple[str, Dict[str, str]]]]:
+    """Read a config file into its digest and (section, options) pairs.
+
+    No interpolation is done. The parsed file is kept in memory (and in cache,
+    if given) keyed on the file's contents, so re-reading an unchanged file
+    skips parsing it. The result is shared, so must not be modified."""
+    abs_filename = os.path.abspath(filename)
+
+    def parse(raw: bytes, digest: str) -> List[Tuple[str, Dict[str, str]]]:
+        sections = None
+        if cache is not None:
+            sections = cache.get(abs_filename, digest)
+        if sections is None:
+            sections = _parse_sections(raw.decode("utf-8"), str(filename))
+            if cache is not None:
+                cache.put(abs_filename, digest, sections)
+        return sections
+
+    return read_parsed_file(filename, "sections", parse)
+
+
+def interpolate_sections(
+    sections: Iterable[Tuple[str, Dict[str, str]]],
+    filename: str,
+    result: Optional[Dict[str, Dict[str, str]]] = None,
+) -> Dict[str, Dict[str, str]]:
+    """Substitute environment variables into section names and values.
+
+    The sections are added to result (a new dict, if not given); the option
+    dicts are always copies."""
+    # os.environ is slow to look things up in, so take a copy
+    environ = dict(os.environ)
+    if result is None:
+        result = {}
+    for (section, options) in sections:
+        name = interpolate_env(section, environ)
+        if name in result:
+            raise DuplicateSectionError(name, filename)
+        for value in options.values():
+            if "%env:" in value:
+                options = {k: interpolate_env(v, environ) for (k, v) in options.items()}
                 break
-            old_value = value
-        return value
+        else:
+            options = dict(options)
+        result[name] = options
+    return result
+
+
+def read_config_sections(
+    filename: Path, cache: Optional[ConfigCache] = None
+) -> Dict[str, Dict[str, str]]:
+    """Read a config file into a dict of section name -> options.
+
+    Environment variables are substituted into section names and values."""
+    (_, sections) = read_raw_sections(filename, cache)
+    return interpolate_sections(sections, str(filename))
@@ -0,0 +1,300 @@
+"""Keep track of the files under a directory without re-reading it all each
+time."""
+
+import ctypes
+import ctypes.util
+import errno
+import fnmatch
+import glob
+import logging
+import os
+import re
+import stat
+import struct
+import sys
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+module_logger = logging.getLogger("AntEye.filetree")
+
+# (size, mtime)
+FileInfo = Tuple[int, float]
+
+# directory -> (mtime, [(name, is a directory)])
+_DirCache = Dict[str, Tuple[int, List[Tuple[str, bool]]]]
+
+# from <sys/inotify.h>
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ONLYDIR = 0x1000000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (
+    _IN_MODIFY
+    | _IN_ATTRIB
+    | _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+    | _IN_DELETE_SELF
+    | _IN_MOVE_SELF
+    | _IN_ONLYDIR
+)
+
+_EVENT = struct.Struct("iIII")
+
+
+def inotify_available() -> bool:
+    return sys.platform.startswith("linux") and bool(ctypes.util.find_library("c"))
+
+
+class _Inotify:
+    """Just enough of inotify(7), through libc."""
+
+    def __init__(self) -> None:
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths = {}  # type: Dict[int, str]
+
+    def watch(self, path: str) -> None:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, "{}: {}".format(os.strerror(code), path))
+        self.paths[wd] = path
+
+    def read(self) -> Optional[List[Tuple[str, str, int]]]:
+        """The (directory, name, mask) of each event since the last read, or
+        None if the kernel dropped some."""
+        events = []  # type: List[Tuple[str, str, int]]
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                (wd, mask, _, length) = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & _IN_Q_OVERFLOW:
+                    return None
+                if mask & _IN_IGNORED:
+                    self.paths.pop(wd, None)
+                    continue
+                if wd in self.paths:
+                    events.append((self.paths[wd], name, mask))
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+# a component of a glob: its regex and whether it matches hidden names, or
+# None for **
+_GlobPart = Optional[Tuple[Any, bool]]
+
+
+def _glob_match(names: List[str], parts: List[_GlobPart]) -> bool:
+    if not parts:
+        return not names
+    if parts[0] is None:
+        for index in range(len(names) + 1):
+            if index and names[index - 1].startswith("."):
+                break
+            if _glob_match(names[index:], parts[1:]):
+                return True
+        return False
+    if not names:
+        return False
+    (regex, hidden) = parts[0]
+    if names[0].startswith(".") and not hidden:
+        return False
+    return bool(regex.match(names[0])) and _glob_match(names[1:], parts[1:])
+
+
+def compile_glob(pattern: str) -> Tuple[str, Optional[int], Callable[[str], bool]]:
+    """Split pattern (as for glob.glob(recursive=True)) into the directory to
+    scan, how far below it to go (None for all the way), and a test for
+    which paths relative to it match."""
+    components = pattern.split(os.sep)
+    index = len(components) - 1
+    for (position, component) in enumerate(components):
+        if glob.has_magic(component):
+            index = position
+            break
+    base = os.sep.join(components[:index])
+    if not base:
+        base = os.sep if pattern.startswith(os.sep) else os.curdir
+    rest = components[index:]
+    max_depth = None if "**" in rest else len(rest) - 1
+    parts = [
+        None if x == "**" else (re.compile(fnmatch.translate(x)), x.startswith("."))
+        for x in rest
+    ]  # type: List[_GlobPart]
+    return (base, max_depth, lambda x: _glob_match(x.split(os.sep), parts))
+
+
+class FileTree:
+    """The regular files under root, with their sizes and modification times.
+
+    Directories are descended to max_depth levels below root (None for no
+    limit), and only files whose path relative to root passes match (if
+    given) are kept.
+
+    scan() brings the files up to date. A directory is only re-read when its
+    own mtime has changed, i.e. when entries have been added, removed or
+    renamed; otherwise its entries, and whether each is a directory, are
+    reused from last time, and only the files are stat()ed again. With
+    use_inotify (Linux only), after the first scan only what the kernel says
+    has changed is looked at at all."""
+
+    def __init__(
+        self,
+        root: str,
+        max_depth: Optional[int] = None,
+        match: Optional[Callable[[str], bool]] = None,
+        use_inotify: bool = False,
+    ) -> None:
+        self.root = root
+        self.max_depth = max_depth
+        self.match = match
+        self.files = {}  # type: Dict[str, FileInfo]
+        self._dirs = {}  # type: _DirCache
+        self._inotify = None  # type: Optional[_Inotify]
+        self._watching = False
+        if use_inotify:
+            self._inotify = _Inotify()
+
+    def __del__(self) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if getattr(self, "_inotify", None) is not None:
+            self._inotify.close()  # type: ignore
+            self._inotify = None
+
+    def _depth(self, directory: str) -> int:
+        if directory == self.root:
+            return 0
+        return os.path.relpath(directory, self.root).count(os.sep) + 1
+
+    def _add_file(self, path: str) -> None:
+        if self.match is not None and not self.match(os.path.relpath(path, self.root)):
+            return
+        try:
+            info = os.stat(path)
+        except OSError:
+            self.files.pop(path, None)
+            return
+        if stat.S_ISREG(info.st_mode):
+            self.files[path] = (info.st_size, info.st_mtime)
+        else:
+            self.files.pop(path, None)
+
+    def _walk(self, top: str, dirs: _DirCache) -> None:
+        """Read top and what's below it into self.files and dirs."""
+        stack = [top]
+        while stack:
+            directory = stack.pop()
+            try:
+                if self._inotify is not None:
+                    # before listing it, so we can't miss anything
+                    self._inotify.watch(directory)
+                mtime = os.stat(directory).st_mtime_ns
+                cached = self._dirs.get(directory)
+                if cached is not None and cached[0] == mtime:
+                    entries = cached[1]
+                else:
+                    with os.scandir(directory) as iterator:
+                        entries = [
+                            (x.name, x.is_dir(follow_symlinks=False)) for x in iterator
+                        ]
+            except OSError as error:
+                # a directory we can't read, or which has just gone, is skipped
+                # unless it's the one we were asked for
+                if directory == top or error.errno in (errno.ENOSPC, errno.ENOMEM):
+                    raise
+                continue
+            dirs[directory] = (mtime, entries)
+            descend = self.max_depth is None or self._depth(directory) < self.max_depth
+            for (name, is_dir) in entries:
+                path = os.path.join(directory, name)
+                if is_dir:
+                    if descend:
+                        stack.append(path)
+                else:
+                    self._add_file(path)
+
+    def _full_scan(self) -> None:
+        self.files = {}
+        dirs = {}  # type: _DirCache
+        self._walk(self.root, dirs)
+        self._dirs = dirs
+
+    def _forget(self, directory: str) -> None:
+        prefix = directory.rstrip(os.sep) + os.sep
+        for path in [x for x in self.files if x.startswith(prefix)]:
+            del self.files[path]
+        for path in [x for x in self._dirs if x == directory or x.startswith(prefix)]:
+            del self._dirs[path]
+
+    def _apply(self, events: List[Tuple[str, str, int]]) -> bool:
+        """Update from inotify events; False if a full scan is needed."""
+        for (directory, name, mask) in events:
+            if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF):
+                if directory == self.root:
+                    return False
+                continue
+            path = os.path.join(directory, name)
+            if mask & _IN_ISDIR:
+                if mask & (_IN_DELETE | _IN_MOVED_FROM):
+                    self._forget(path)
+                elif mask & (_IN_CREATE | _IN_MOVED_TO):
+                    if self.max_depth is None or self._depth(path) <= self.max_depth:
+                        try:
+                            self._walk(path, self._dirs)
+                        except OSError:
+                            # gone again already, or out of watches
+                            return False
+            elif mask & (_IN_DELETE | _IN_MOVED_FROM):
+                self.files.pop(path, None)
+            else:
+                self._add_file(path)
+        return True
+
+    def scan(self) -> Dict[str, FileInfo]:
+        """Bring the files up to date, and return them."""
+        if self._inotify is not None and self._watching:
+            events = self._inotify.read()
+            if events is not None and self._apply(events):
+                return self.files
+        try:
+            self._full_scan()
+        except OSError as error:
+            if self._inotify is None or error.errno not in (errno.ENOSPC, errno.ENOMEM):
+                raise
+            module_logger.warning(
+                "Unable to watch %s (%s); rescanning it each time instead",
+                self.root,
+                error,
+            )
+            self.close()
+            self._full_scan()
+        self._watching = self._inotify is not None
+        return self.files
@@ -0,0 +1,63 @@
+"""Forecast when a falling figure (e.g. free disk space) will run out."""
+
+from array import array
+from typing import Optional
+
+# fewer samples than this give too wild a slope to act on
+MIN_SAMPLES = 3
+
+
+class TrendEstimator:
+    """The least-squares trend of the last size samples of a figure.
+
+    The samples are kept in a fixed-size ring of floats, so an estimator
+    costs the same however long it runs."""
+
+    def __init__(self, size: int) -> None:
+        if size < MIN_SAMPLES:
+            raise ValueError("need at least {} samples".format(MIN_SAMPLES))
+        self.size = size
+        self._times = array("d", [0.0] * size)
+        self._values = array("d", [0.0] * size)
+        self._next = 0
+        self.count = 0
+
+    def add(self, when: float, value: float) -> None:
+        self._times[self._next] = when
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def clear(self) -> None:
+        self._next = 0
+        self.count = 0
+
+    def slope(self) -> Optional[float]:
+        """The change in the figure per second, or None if there are too few
+        samples to tell."""
+        if self.count < MIN_SAMPLES:
+            return None
+        times = self._times[: self.count]
+        values = self._values[: self.count]
+        # relative to the first sample, to keep the sums small
+        origin = min(times)
+        mean_time = sum(t - origin for t in times) / self.count
+        mean_value = sum(values) / self.count
+        spread = sum((t - origin - mean_time) ** 2 for t in times)
+        if spread == 0:
+            return None
+        return (
+            sum(
+                (t - origin - mean_time) * (v - mean_value)
+                for (t, v) in zip(times, values)
+            )
+            / spread
+        )
+
+    def time_to_zero(self, current: float) -> Optional[float]:
+        """Seconds until the figure, now current, reaches zero at the present
+        trend; None if it is not falling (or we can't yet tell)."""
+        slope = self.slope()
+        if slope is None or slope >= 0:
+            return None
+        return current / -slope
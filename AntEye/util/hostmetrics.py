@@ -0,0 +1,161 @@
+"""The host's load, memory, swap, pressure and disk space, shared by the host
+monitors.
+
+On Linux everything comes straight from /proc: /proc/loadavg, /proc/meminfo,
+/proc/pressure/* and one read of the mount table, which lets monitors on
+different paths of the same filesystem share one statvfs(). Each is read only
+when a monitor first asks for it, and (via host_metrics()) only once per loop
+(see AntEye.util.loopcache). Elsewhere, os.getloadavg(), psutil and
+os.statvfs() are used instead."""
+
+import errno
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .loopcache import LoopCache
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+_PRESSURE_LINE = re.compile(r"^(some|full) (.*)$")
+_MOUNT_ESCAPE = re.compile(r"\\([0-7]{3})")
+
+
+def _unescape_mount(path: str) -> str:
+    """Undo the octal escapes (e.g. \\040 for a space) in /proc/self/mounts."""
+    return _MOUNT_ESCAPE.sub(lambda x: chr(int(x.group(1), 8)), path)
+
+
+class HostMetrics:
+    """The host's figures, each read the first time it is asked for."""
+
+    def __init__(self, root: str = "/proc") -> None:
+        self.root = root
+        self.when = time.time()
+        self.use_proc = os.path.isfile(os.path.join(root, "meminfo"))
+        self._loadavg = None  # type: Optional[Tuple[float, float, float]]
+        self._meminfo = None  # type: Optional[Dict[str, int]]
+        self._pressure = {}  # type: Dict[str, Dict[str, float]]
+        self._mounts = None  # type: Optional[List[str]]
+        self._statvfs = {}  # type: Dict[str, os.statvfs_result]
+
+    def _read(self, *path: str) -> str:
+        with open(os.path.join(self.root, *path)) as file_handle:
+            return file_handle.read()
+
+    def loadavg(self) -> Tuple[float, float, float]:
+        """The 1, 5 and 15 minute load averages."""
+        if self._loadavg is None:
+            if self.use_proc:
+                fields = self._read("loadavg").split()
+                self._loadavg = (float(fields[0]), float(fields[1]), float(fields[2]))
+            else:
+                self._loadavg = os.getloadavg()
+        return self._loadavg
+
+    def meminfo(self) -> Dict[str, int]:
+        """/proc/meminfo, in bytes."""
+        if self._meminfo is None:
+            self._meminfo = {}
+            for line in self._read("meminfo").splitlines():
+                (key, _, value) = line.partition(":")
+                fields = value.split()
+                if not fields:
+                    continue
+                amount = int(fields[0])
+                if len(fields) > 1 and fields[1] == "kB":
+                    amount *= 1024
+                self._meminfo[key] = amount
+        return self._meminfo
+
+    def memory(self) -> Tuple[int, int]:
+        """Total and available memory, in bytes."""
+        if not self.use_proc:
+            if psutil is None:
+                raise RuntimeError("psutil is not installed")
+            stats = psutil.virtual_memory()
+            return (stats.total, stats.available)
+        meminfo = self.meminfo()
+        available = meminfo.get("MemAvailable")
+        if available is None:
+            # kernels before 3.14 don't estimate it for us
+            available = (
+                meminfo["MemFree"]
+                + meminfo.get("Buffers", 0)
+                + meminfo.get("Cached", 0)
+            )
+        return (meminfo["MemTotal"], available)
+
+    def swap(self) -> Tuple[int, int]:
+        """Total and free swap, in bytes."""
+        if not self.use_proc:
+            if psutil is None:
+                raise RuntimeError("psutil is not installed")
+            stats = psutil.swap_memory()
+            return (stats.total, stats.free)
+        meminfo = self.meminfo()
+        return (meminfo["SwapTotal"], meminfo["SwapFree"])
+
+    def pressure(self, resource: str) -> Dict[str, float]:
+        """The pressure stall averages for cpu, memory or io, e.g.
+        {"some_avg10": 1.5, ...}; empty if the kernel doesn't provide them."""
+        if resource not in self._pressure:
+            values = {}  # type: Dict[str, float]
+            try:
+                text = self._read("pressure", resource)
+            except OSError:
+                text = ""
+            for line in text.splitlines():
+                matches = _PRESSURE_LINE.match(line)
+                if not matches:
+                    continue
+                for item in matches.group(2).split():
+                    (key, _, value) = item.partition("=")
+                    if key.startswith("avg"):
+                        values["{}_{}".format(matches.group(1), key)] = float(value)
+            self._pressure[resource] = values
+        return self._pressure[resource]
+
+    def mounts(self) -> List[str]:
+        """The mount points, longest first."""
+        if self._mounts is None:
+            mounts = set()
+            if self.use_proc:
+                for line in self._read("self", "mounts").splitlines():
+                    fields = line.split()
+                    if len(fields) > 1:
+                        mounts.add(_unescape_mount(fields[1]))
+            self._mounts = sorted(mounts, key=len, reverse=True)
+        return self._mounts
+
+    def mount_point(self, path: str) -> str:
+        """The mount point of the filesystem holding path, or path itself if
+        the mount table isn't available."""
+        real = os.path.realpath(path)
+        if not os.path.exists(real):
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        for mount in self.mounts():
+            if real == mount or real.startswith(mount.rstrip("/") + "/"):
+                return mount
+        return path
+
+    def statvfs(self, path: str) -> os.statvfs_result:
+        """statvfs() for the filesystem holding path, shared with every other
+        path on it."""
+        mount = self.mount_point(path)
+        result = self._statvfs.get(mount)
+        if result is None:
+            result = self._statvfs[mount] = os.statvfs(mount)
+        return result
+
+
+_CACHE = LoopCache(HostMetrics)
+
+
+def host_metrics() -> HostMetrics:
+    """The host's figures as of this loop."""
+    return _CACHE.get()
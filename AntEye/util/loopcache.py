@@ -0,0 +1,42 @@
+"""Values shared by every monitor for the duration of one loop.
+
+Some monitors each look at the same expensive thing (the process table, for
+one). A LoopCache collects it the first time a monitor asks for it in a loop,
+and hands every other monitor in that loop the same copy.
+
+The main loop calls new_loop() before running the monitors. Until it has,
+(e.g. when a monitor is run on its own) nothing is cached."""
+
+import threading
+from typing import Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+_loop = 0
+
+
+def new_loop() -> None:
+    """Mark everything cached so far as out of date."""
+    global _loop
+    _loop += 1
+
+
+class LoopCache(Generic[T]):
+    """The value of collect(), collected at most once per loop."""
+
+    def __init__(self, collect: Callable[[], T]) -> None:
+        self.collect = collect
+        self._loop = 0
+        self._value = None  # type: Optional[T]
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        with self._lock:
+            if self._value is None or self._loop == 0 or self._loop != _loop:
+                self._value = self.collect()
+                self._loop = _loop
+            return self._value
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._value = None
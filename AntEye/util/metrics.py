@@ -0,0 +1,206 @@
+"""Internal instrumentation: histograms and counters for the main loop, in the
+Prometheus text exposition format.
+
+Everything is recorded in REGISTRY, which ignores what it is given until
+something enables it (the prometheus logger), so the hooks in the main loop
+cost next to nothing otherwise."""
+
+import bisect
+import threading
+from typing import Dict, List, Tuple
+
+# upper bounds, in seconds, from a quick monitor to a slow loop
+BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+_BOUNDS = [repr(x) for x in BUCKETS] + ["+Inf"]
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# name -> (type, help)
+DESCRIPTIONS = {
+    "anteye_loop_seconds": ("histogram", "Time taken by each loop."),
+    "anteye_loop_phase_seconds": (
+        "histogram",
+        "Time taken by each phase of the loop.",
+    ),
+    "anteye_loop_overruns_total": (
+        "counter",
+        "Loops which took longer than the interval.",
+    ),
+    "anteye_monitor_run_seconds": ("histogram", "Time taken by each monitor's test."),
+    "anteye_logger_save_seconds": (
+        "histogram",
+        "Time taken by a logger to record one monitor.",
+    ),
+    "anteye_logger_batch_seconds": (
+        "histogram",
+        "Time taken by a logger to process a batch.",
+    ),
+    "anteye_alerter_send_seconds": (
+        "histogram",
+        "Time taken by an alerter to send an alert.",
+    ),
+    "anteye_alerts_total": ("counter", "Alerts sent, by type."),
+    "anteye_listener_batches_total": (
+        "counter",
+        "Batches of results received from remote instances.",
+    ),
+    "anteye_listener_monitors_total": (
+        "counter",
+        "Monitor results received from remote instances.",
+    ),
+    "anteye_listener_bytes_total": (
+        "counter",
+        "Bytes received from remote instances.",
+    ),
+    "anteye_listener_errors_total": (
+        "counter",
+        "Connections from remote instances which could not be processed.",
+    ),
+    "anteye_listener_ingest_seconds": (
+        "histogram",
+        "Time taken to process a batch from a remote instance.",
+    ),
+}
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(
+            '{}="{}"'.format(
+                key,
+                value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+            )
+            for (key, value) in labels
+        )
+        + "}"
+    )
+
+
+def format_value(value: float) -> str:
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def render_metric(
+    name: str, metric_type: str, description: str, samples: Dict[Labels, float]
+) -> List[str]:
+    """The exposition lines for a counter or gauge with the given samples."""
+    lines = ["# HELP {} {}".format(name, description)]
+    lines.append("# TYPE {} {}".format(name, metric_type))
+    for (labels, value) in sorted(samples.items()):
+        lines.append("{}{} {}".format(name, format_labels(labels), format_value(value)))
+    return lines
+
+
+class Histogram:
+    """Counts of observations in each of BUCKETS, plus the overflow."""
+
+    __slots__ = ("counts", "sum")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+    def render(self, name: str, labels: Labels) -> List[str]:
+        lines = []
+        cumulative = 0
+        for (bound, count) in zip(_BOUNDS, self.counts):
+            cumulative += count
+            lines.append(
+                "{}_bucket{} {}".format(
+                    name, format_labels(labels + (("le", bound),)), cumulative
+                )
+            )
+        lines.append(
+            "{}_sum{} {}".format(name, format_labels(labels), format_value(self.sum))
+        )
+        lines.append("{}_count{} {}".format(name, format_labels(labels), cumulative))
+        return lines
+
+
+class Registry:
+    """The histograms and counters, keyed by metric name and labels."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._histograms = {}  # type: Dict[str, Dict[Labels, Histogram]]
+        self._counters = {}  # type: Dict[str, Dict[Labels, float]]
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Add an observation (in seconds) to a histogram."""
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        """Increase a counter."""
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def forget(self, label: str, value: str) -> None:
+        """Drop every series with the given label value, e.g. for a monitor
+        which has been removed."""
+        with self._lock:
+            for metrics in (self._histograms, self._counters):
+                for series in metrics.values():
+                    for key in [k for k in series if (label, value) in k]:
+                        del series[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._histograms = {}
+            self._counters = {}
+
+    def render(self) -> List[str]:
+        """The exposition lines for everything recorded so far."""
+        lines = []  # type: List[str]
+        with self._lock:
+            for (name, counters) in sorted(self._counters.items()):
+                (metric_type, description) = DESCRIPTIONS.get(name, ("counter", name))
+                lines.extend(render_metric(name, metric_type, description, counters))
+            for (name, histograms) in sorted(self._histograms.items()):
+                (metric_type, description) = DESCRIPTIONS.get(name, ("histogram", name))
+                lines.append("# HELP {} {}".format(name, description))
+                lines.append("# TYPE {} {}".format(name, metric_type))
+                for (labels, histogram) in sorted(histograms.items()):
+                    lines.extend(histogram.render(name, labels))
+        return lines
+
+
+REGISTRY = Registry()
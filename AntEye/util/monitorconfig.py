@@ -0,0 +1,149 @@
+"""Load the monitors config, following includes and expanding templates."""
+
+import glob
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .envconfig import (
+    ConfigCache,
+    interpolate_env,
+    interpolate_sections,
+    read_parsed_file,
+    read_raw_sections,
+)
+
+TEMPLATE_OPTION = "template_file"
+TEMPLATE_PLACEHOLDER = "{item}"
+
+Sections = List[Tuple[str, Dict[str, str]]]
+
+# filename -> (digest, defaults, [(template file, digest)], expanded sections)
+_expanded = {}  # type: Dict[str, Tuple[str, tuple, list, Sections]]
+
+
+def _parse_items(raw: bytes, digest: str) -> List[str]:
+    """Parse a template file: one item per line, ignoring blanks and comments."""
+    items = []
+    for line in raw.decode("utf-8").splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            items.append(line)
+    return items
+
+
+def _read_items(path: Path) -> Tuple[str, List[str]]:
+    return read_parsed_file(path, "items", _parse_items)
+
+
+def _template_path(filename: Path, options: Dict[str, str]) -> Path:
+    """Template files are relative to the file which uses them."""
+    path = Path(interpolate_env(options[TEMPLATE_OPTION]))
+    if not path.is_absolute():
+        path = filename.parent / path
+    return path
+
+
+def _expand(sections: Sections, defaults: Dict[str, str], filename: Path) -> Sections:
+    expanded = []  # type: Sections
+    for (name, options) in sections:
+        merged = dict(defaults)
+        merged.update(options)
+        if TEMPLATE_OPTION not in options:
+            expanded.append((name, merged))
+            continue
+        del merged[TEMPLATE_OPTION]
+        (_, items) = _read_items(_template_path(filename, options))
+        for item in items:
+            expanded.append(
+                (
+                    name.replace(TEMPLATE_PLACEHOLDER, item),
+                    {
+                        k: v.replace(TEMPLATE_PLACEHOLDER, item)
+                        for (k, v) in merged.items()
+                    },
+                )
+            )
+    return expanded
+
+
+def _load_file(
+    filename: Path, sections: Sections, digest: str, defaults: Dict[str, str]
+) -> Sections:
+    """Expand one monitors file, re-using the last expansion if neither it, its
+    template files, nor the defaults passed in have changed."""
+    defaults_key = tuple(sorted(defaults.items()))
+    key = os.path.abspath(filename)
+    previous = _expanded.get(key)
+    if (
+        previous is not None
+        and previous[0] == digest
+        and previous[1] == defaults_key
+        and all(
+            _read_items(path)[0] == item_digest for (path, item_digest) in previous[2]
+        )
+    ):
+        return previous[3]
+    sections = [x for x in sections if x[0] != "defaults"]
+    templates = {
+        _template_path(filename, options)
+        for (_, options) in sections
+        if TEMPLATE_OPTION in options
+    }
+    expanded = _expand(sections, defaults, filename)
+    _expanded[key] = (
+        digest,
+        defaults_key,
+        [(path, _read_items(path)[0]) for path in sorted(templates)],
+        expanded,
+    )
+    return expanded
+
+
+def _defaults(sections: Sections) -> Dict[str, str]:
+    for (name, options) in sections:
+        if name == "defaults":
+            return options
+    return {}
+
+
+def monitor_files(filename: Path, include: List[str]) -> List[Path]:
+    """The main monitors file followed by the included ones, in order. As
+    template files are, include globs are relative to the main file."""
+    files = [filename]
+    seen = {os.path.abspath(filename)}
+    for pattern in include:
+        if not os.path.isabs(pattern):
+            pattern = str(filename.parent / pattern)
+        for match in sorted(glob.glob(pattern)):
+            if os.path.abspath(match) not in seen:
+                seen.add(os.path.abspath(match))
+                files.append(Path(match))
+    return files
+
+
+def load_monitor_sections(
+    filename: Path,
+    include: Optional[List[str]] = None,
+    cache: Optional[ConfigCache] = None,
+) -> Dict[str, Dict[str, str]]:
+    """Load the monitor sections from filename and any files matching the
+    include globs, with defaults applied, templates expanded and environment
+    variables substituted.
+
+    The [defaults] of the main file apply to all files; an included file's
+    [defaults] apply on top of those, to that file only. Each file's expansion
+    is cached, so only files which changed get expanded again."""
+    (digest, sections) = read_raw_sections(filename, cache)
+    base_defaults = _defaults(sections)
+    result = {}  # type: Dict[str, Dict[str, str]]
+    for this_file in monitor_files(filename, include or []):
+        if this_file != filename:
+            (digest, sections) = read_raw_sections(this_file, cache)
+            defaults = dict(base_defaults)
+            defaults.update(_defaults(sections))
+        else:
+            defaults = base_defaults
+        expanded = _load_file(this_file, sections, digest, defaults)
+        interpolate_sections(expanded, str(this_file), result)
+    return result
@@ -0,0 +1,298 @@
+"""A snapshot of the process table, shared by the process monitors.
+
+Reading the whole process table is by far the slowest part of checking for a
+process, so it is done once per loop (see AntEye.util.loopcache) and indexed
+by every name a process can be matched on: its name, the basename of its
+executable and its argv[0]. Each monitor's lookup is then a dict access.
+
+Beyond the names, a process's owner and resource usage are read only when a
+monitor has asked for them (with ProcessSnapshot.require()), from the same
+pass over the table.
+
+The table can be read with psutil, or on Linux straight from /proc, which is
+quicker as it reads only what the monitors asked for."""
+
+import os
+import time
+import weakref
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from .loopcache import LoopCache
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import pwd
+except ImportError:
+    pwd = None  # type: ignore
+
+READERS = ["psutil", "proc"]
+
+# what can be asked for beyond the names; each is an attribute of ProcessInfo
+FIELDS = ["username", "rss", "cpu_time", "num_fds", "num_threads", "create_time"]
+
+# the kernel truncates a process's name (/proc/PID/comm) to this length
+_COMM_LENGTH = 15
+
+
+class ProcessInfo:
+    """The parts of a process the monitors match on and check. Sizes are in
+    bytes, times in seconds, and anything not read is None."""
+
+    __slots__ = ("pid", "name", "exe", "argv0") + tuple(FIELDS)
+
+    def __init__(
+        self,
+        pid: int,
+        name: Optional[str],
+        exe: Optional[str] = None,
+        argv0: Optional[str] = None,
+        username: Optional[str] = None,
+        rss: Optional[int] = None,
+        cpu_time: Optional[float] = None,
+        num_fds: Optional[int] = None,
+        num_threads: Optional[int] = None,
+        create_time: Optional[float] = None,
+    ) -> None:
+        self.pid = pid
+        self.name = name
+        self.exe = exe
+        self.argv0 = argv0
+        self.username = username
+        self.rss = rss
+        self.cpu_time = cpu_time
+        self.num_fds = num_fds
+        self.num_threads = num_threads
+        self.create_time = create_time
+
+    def __repr__(self) -> str:
+        return "<ProcessInfo pid={} name={}>".format(self.pid, self.name)
+
+
+class ProcessTable:
+    """Processes indexed by each name they can be matched on, and by those
+    names and their owner. when is the time the table was read."""
+
+    def __init__(
+        self, processes: Iterable[ProcessInfo], when: Optional[float] = None
+    ) -> None:
+        self.processes = list(processes)
+        self.when = time.time() if when is None else when
+        self._by_name = {}  # type: Dict[str, List[ProcessInfo]]
+        self._by_user = {}  # type: Dict[Tuple[str, str], List[ProcessInfo]]
+        for process in self.processes:
+            names = {process.name, process.argv0}
+            if process.exe:
+                names.add(os.path.basename(process.exe))
+            for name in names:
+                if not name:
+                    continue
+                self._by_name.setdefault(name, []).append(process)
+                if process.username is not None:
+                    self._by_user.setdefault((name, process.username), []).append(
+                        process
+                    )
+
+    def find(self, name: str, username: Optional[str] = None) -> List[ProcessInfo]:
+        """The processes matching name, and owned by username if given."""
+        if username is None:
+            return self._by_name.get(name, [])
+        return self._by_user.get((name, username), [])
+
+    def __len__(self) -> int:
+        return len(self.processes)
+
+
+# field -> the psutil attribute giving it
+_PSUTIL_ATTRS = {
+    "username": "username",
+    "rss": "memory_info",
+    "cpu_time": "cpu_times",
+    "num_fds": "num_fds",
+    "num_threads": "num_threads",
+    "create_time": "create_time",
+}
+
+# the fields read from /proc/PID/stat
+_STAT_FIELDS = {"rss", "cpu_time", "num_threads", "create_time"}
+
+
+def read_psutil(fields: Set[str]) -> List[ProcessInfo]:
+    """Read the process table with psutil."""
+    attrs = ["name", "exe", "cmdline"]
+    for (field, attr) in _PSUTIL_ATTRS.items():
+        if field in fields:
+            attrs.append(attr)
+    processes = []
+    for process in psutil.process_iter(attrs):
+        info = process.info
+        cmdline = info["cmdline"]
+        memory = info.get("memory_info")
+        cpu = info.get("cpu_times")
+        processes.append(
+            ProcessInfo(
+                process.pid,
+                info["name"],
+                info["exe"],
+                cmdline[0] if cmdline else None,
+                info.get("username"),
+                rss=memory.rss if memory else None,
+                cpu_time=cpu.user + cpu.system if cpu else None,
+                num_fds=info.get("num_fds"),
+                num_threads=info.get("num_threads"),
+                create_time=info.get("create_time"),
+            )
+        )
+    return processes
+
+
+def _read_cmdline(path: str) -> List[str]:
+    with open(path, "rb") as file_handle:
+        data = file_handle.read()
+    if not data:
+        return []
+    # as psutil does, allow for processes which rewrite their command line
+    # separated by spaces
+    separator = b"\0" if data.endswith(b"\0") else b" "
+    if data.endswith(separator):
+        data = data[:-1]
+    arguments = data.split(separator)
+    if separator == b"\0" and len(arguments) == 1 and b" " in data:
+        arguments = data.split(b" ")
+    return [x.decode("utf-8", "surrogateescape") for x in arguments]
+
+
+def _boot_time(root: str) -> float:
+    with open(os.path.join(root, "stat")) as file_handle:
+        for line in file_handle:
+            if line.startswith("btime "):
+                return float(line.split()[1])
+    raise OSError("no btime in {}/stat".format(root))
+
+
+def read_proc(fields: Set[str], root: str = "/proc") -> List[ProcessInfo]:
+    """Read the process table from /proc, skipping anything not in fields."""
+    usernames = {}  # type: Dict[int, str]
+    read_stat = not _STAT_FIELDS.isdisjoint(fields)
+    if read_stat:
+        ticks = os.sysconf("SC_CLK_TCK")
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        boot_time = _boot_time(root)
+    processes = []
+    for entry in os.scandir(root):
+        if not entry.name.isdigit():
+            continue
+        process = ProcessInfo(int(entry.name), None)
+        try:
+            try:
+                with open(os.path.join(entry.path, "comm"), "rb") as file_handle:
+                    name = (
+                        file_handle.read()
+                        .rstrip(b"\n")
+                        .decode("utf-8", "surrogateescape")
+                    )
+            except PermissionError:
+                # hidden from us, e.g. by /proc's hidepid option; without a
+                # name, no monitor can find it
+                continue
+            # as psutil does, leave out what we may not read (AccessDenied)
+            # rather than the whole process
+            try:
+                cmdline = _read_cmdline(os.path.join(entry.path, "cmdline"))
+            except PermissionError:
+                cmdline = []
+            try:
+                exe = os.readlink(os.path.join(entry.path, "exe"))
+                if exe.endswith(" (deleted)") and not os.path.exists(exe):
+                    exe = exe[: -len(" (deleted)")]
+                process.exe = exe
+            except OSError:
+                # not ours to look at, or a kernel thread
+                pass
+            if "username" in fields:
+                try:
+                    uid = entry.stat().st_uid
+                except PermissionError:
+                    uid = None
+                if uid is not None:
+                    username = usernames.get(uid)
+                    if username is None:
+                        try:
+                            username = pwd.getpwuid(uid).pw_name
+                        except (KeyError, AttributeError):
+                            username = str(uid)
+                        usernames[uid] = username
+                    process.username = username
+            if read_stat:
+                try:
+                    with open(os.path.join(entry.path, "stat"), "rb") as file_handle:
+                        # the name may contain spaces and brackets; skip past it
+                        stat = file_handle.read().rsplit(b")", 1)[1].split()
+                except PermissionError:
+                    stat = None
+                if stat is not None:
+                    process.cpu_time = (int(stat[11]) + int(stat[12])) / ticks
+                    process.num_threads = int(stat[17])
+                    process.create_time = boot_time + int(stat[19]) / ticks
+                    process.rss = int(stat[21]) * page_size
+            if "num_fds" in fields:
+                try:
+                    process.num_fds = len(os.listdir(os.path.join(entry.path, "fd")))
+                except PermissionError:
+                    pass
+        except (FileNotFoundError, ProcessLookupError):
+            # the process has gone away since we listed it
+            continue
+        if len(name) >= _COMM_LENGTH and cmdline:
+            # as psutil does, find the full name of a long-named process
+            full_name = os.path.basename(cmdline[0])
+            if full_name.startswith(name):
+                name = full_name
+        process.name = name
+        process.argv0 = cmdline[0] if cmdline else None
+        processes.append(process)
+    return processes
+
+
+class ProcessSnapshot:
+    """The process table as of this loop, read once for all the monitors
+    using the same reader."""
+
+    def __init__(self, reader: str) -> None:
+        self.reader = reader
+        # monitor -> the fields it asked for; a monitor which goes away (e.g.
+        # on reload) takes its fields with it
+        self._required = (
+            weakref.WeakKeyDictionary()
+        )  # type: weakref.WeakKeyDictionary[Any, FrozenSet[str]]
+        self._cache = LoopCache(self._collect)
+
+    def require(self, owner: Any, *fields: str) -> None:
+        """Ask for fields beyond the names (see FIELDS) to be read, for as long
+        as owner is around."""
+        wanted = self.fields()
+        self._required[owner] = frozenset(fields)
+        if not wanted.issuperset(fields):
+            self._cache.invalidate()
+
+    def fields(self) -> Set[str]:
+        """The fields asked for by the owners still around."""
+        return set().union(*self._required.values())
+
+    def _collect(self) -> ProcessTable:
+        if self.reader == "proc":
+            return ProcessTable(read_proc(self.fields()))
+        return ProcessTable(read_psutil(self.fields()))
+
+    def table(self) -> ProcessTable:
+        return self._cache.get()
+
+
+SNAPSHOTS = {reader: ProcessSnapshot(reader) for reader in READERS}
+
+
+def proc_available() -> bool:
+    return os.path.isfile("/proc/self/comm")
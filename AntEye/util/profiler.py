@@ -0,0 +1,225 @@
+"""Profile the main loop, to find out what made a slow loop slow."""
+
+import logging
+import os
+import stat
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+PROFILE_MODES = ["sample", "cprofile"]
+
+_PREFIX = "loop-"
+
+module_logger = logging.getLogger("AntEye.profiler")
+
+
+class LoopProfiler:
+    """Profile one loop at a time, and write a report for each.
+
+    In "sample" mode a thread records the main thread's stack every interval
+    seconds, which costs little enough to leave running; the stacks are written
+    in the collapsed format used by flamegraph.pl and speedscope. In "cprofile"
+    mode the loop runs under cProfile, which is exact but slows it down, and the
+    stats are written for pstats or snakeviz.
+
+    Alongside each profile is a text report of the slowest monitors, loggers
+    and alerters (as passed to record()) and the top call sites. Only loops
+    taking at least threshold seconds are kept, and only the last keep of
+    those.
+
+    If no directory is given, a private one is made in the temporary directory
+    the first time a profile is written."""
+
+    def __init__(
+        self,
+        directory: Optional[Path] = None,
+        mode: str = "sample",
+        interval: float = 0.01,
+        top: int = 10,
+        keep: int = 20,
+        threshold: float = 0.0,
+    ) -> None:
+        if mode not in PROFILE_MODES:
+            raise ValueError(
+                "profile mode must be one of {}".format(", ".join(PROFILE_MODES))
+            )
+        self.directory = directory
+        # whether we made the directory ourselves
+        self.temporary = False
+        self.mode = mode
+        self.interval = interval
+        self.top = top
+        self.keep = keep
+        self.threshold = threshold
+        self._timings = {}  # type: Dict[str, List[Tuple[str, float]]]
+        self._started = 0.0
+        self._profile = None  # type: Any
+        self._sampler = None  # type: Optional[threading.Thread]
+        self._stop = threading.Event()
+        self._stacks = Counter()  # type: Counter[str]
+        self._sites = Counter()  # type: Counter[str]
+        self._count = 0
+
+    def start(self) -> None:
+        """Start profiling a loop."""
+        self._timings = {"monitor": [], "logger": [], "alerter": []}
+        self._started = time.time()
+        if self.mode == "cprofile":
+            # not imported until needed, as few people will use it
+            import cProfile
+
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+            return
+        self._stacks = Counter()
+        self._sites = Counter()
+        self._stop.clear()
+        self._sampler = threading.Thread(
+            target=self._sample, args=(threading.get_ident(),), name="loop-profiler"
+        )
+        self._sampler.daemon = True
+        self._sampler.start()
+
+    def record(self, kind: str, name: str, seconds: float) -> None:
+        """Note how long a monitor, logger or alerter took in this loop."""
+        self._timings[kind].append((name, seconds))
+
+    def _sample(self, thread_id: int) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            self._sites[
+                "{}:{}:{}".format(
+                    frame.f_globals.get("__name__", "?"),
+                    frame.f_code.co_name,
+                    frame.f_lineno,
+                )
+            ] += 1
+            stack = []
+            while frame is not None:
+                stack.append(
+                    "{}:{}".format(
+                        frame.f_globals.get("__name__", "?"), frame.f_code.co_name
+                    )
+                )
+                frame = frame.f_back
+            self._stacks[";".join(reversed(stack))] += 1
+
+    def stop(self, duration: float, interval: int) -> Optional[Path]:
+        """Stop profiling the loop, which took duration seconds, and write the
+        report if it was slow enough. Returns the report's path if so."""
+        if self._profile is not None:
+            self._profile.disable()
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+            self._sampler = None
+        profile = self._profile
+        self._profile = None
+        if duration < self.threshold:
+            return None
+        try:
+            return self._write(duration, interval, profile)
+        except OSError:
+            module_logger.exception("Unable to write profile to %s", self.directory)
+            return None
+
+    def _prepare(self) -> Path:
+        """The directory to write to, made if need be.
+
+        We may well be running as root, and delete files from it as well as
+        write them, so a directory anyone else could have put things in is
+        refused."""
+        if self.directory is None:
+            self.directory = Path(tempfile.mkdtemp(prefix="anteye-profile-"))
+            self.temporary = True
+            module_logger.info("Writing loop profiles to %s", self.directory)
+            return self.directory
+        os.makedirs(str(self.directory), mode=0o700, exist_ok=True)
+        info = os.lstat(str(self.directory))
+        if not stat.S_ISDIR(info.st_mode):
+            raise PermissionError("{} is not a directory".format(self.directory))
+        if hasattr(os, "geteuid") and (
+            info.st_uid != os.geteuid() or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+        ):
+            raise PermissionError(
+                "{} is not ours alone to write to".format(self.directory)
+            )
+        return self.directory
+
+    def _write(self, duration: float, interval: int, profile: Any) -> Path:
+        directory = self._prepare()
+        self._count += 1
+        stem = directory / "{}{}-{:06d}".format(
+            _PREFIX,
+            time.strftime("%Y%m%d-%H%M%S", time.localtime(self._started)),
+            self._count,
+        )
+        lines = [
+            "loop started {}, took {:.3f}s (interval {}s{})".format(
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self._started)),
+                duration,
+                interval,
+                ", overran" if duration > interval else "",
+            )
+        ]
+        for kind in ["monitor", "logger", "alerter"]:
+            lines.append("")
+            lines.append("slowest {}s:".format(kind))
+            slowest = sorted(self._timings[kind], key=lambda x: x[1], reverse=True)
+            for (name, seconds) in slowest[: self.top]:
+                lines.append("  {:10.4f}s  {}".format(seconds, name))
+        lines.append("")
+        if profile is not None:
+            import pstats
+
+            profile.dump_stats(str(stem) + ".pstats")
+            lines.append("top call sites (own time, calls):")
+            stats = pstats.Stats(profile).stats  # type: ignore
+            ordered = sorted(stats.items(), key=lambda x: x[1][2], reverse=True)
+            for (key, (_, calls, own, _, _)) in ordered[: self.top]:
+                (filename, line, function) = key
+                lines.append(
+                    "  {:10.4f}s  {:8d}  {}:{}({})".format(
+                        own, calls, filename, line, function
+                    )
+                )
+        else:
+            with open(str(stem) + ".folded", "w") as file_handle:
+                for (stack, count) in sorted(self._stacks.items()):
+                    file_handle.write("{} {}\n".format(stack, count))
+            total = sum(self._sites.values())
+            lines.append(
+                "top call sites ({} samples every {}s):".format(total, self.interval)
+            )
+            for (site, count) in self._sites.most_common(self.top):
+                lines.append("  {:9.1f}%  {}".format(count * 100 / total, site))
+        report = Path(str(stem) + ".txt")
+        with open(str(report), "w") as file_handle:
+            file_handle.write("\n".join(lines) + "\n")
+        self._rotate(directory)
+        return report
+
+    def _rotate(self, directory: Path) -> None:
+        """Delete all but the newest keep profiles."""
+        if not self.keep:
+            return
+        stems = sorted(
+            {
+                x.split(".")[0]
+                for x in os.listdir(str(directory))
+                if x.startswith(_PREFIX)
+            }
+        )
+        for stem in stems[: -self.keep]:
+            for extension in [".txt", ".folded", ".pstats"]:
+                try:
+                    os.unlink(str(directory / (stem + extension)))
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,168 @@
+"""The status of the services checked by the unix_service and rc monitors,
+found for all of them at once.
+
+Where systemd is running, one call to systemctl lists every service, and a
+monitor's status is looked up in that. Otherwise (or for a service it doesn't
+list), the distinct status commands of the monitors due to run are run, several at
+a time and each with a time limit (see AntEye.util.commands), the first time
+any monitor asks in a loop; the rest of those monitors then find their result
+waiting (see AntEye.util.loopcache).
+
+supervise_running() does what svok(8) does, without running it."""
+
+import errno
+import os
+import shutil
+import subprocess  # nosec
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Set, Tuple
+
+from . import commands
+from .loopcache import LoopCache
+
+# how many status commands to run at once
+WORKERS = 8
+
+# a status command and its time limit
+Command = Tuple[Tuple[str, ...], float]
+
+# the exit codes of "systemctl status" (as "service" runs it) for a running
+# and a stopped service
+_SYSTEMD_RUNNING = 0
+_SYSTEMD_STOPPED = 3
+
+
+class StatusResult:
+    """How a status command went: its exit code and output, or the reason it
+    couldn't be run (in which case returncode is None)."""
+
+    __slots__ = ("returncode", "output", "error")
+
+    def __init__(
+        self, returncode: Optional[int], output: str = "", error: str = ""
+    ) -> None:
+        self.returncode = returncode
+        self.output = output
+        self.error = error
+
+
+def run_status(command: Command) -> StatusResult:
+    (args, timeout) = command
+    try:
+        result = commands.run(args, timeout=timeout, stderr=subprocess.STDOUT)
+    except subprocess.TimeoutExpired:
+        return StatusResult(None, error="timed out after {}s".format(timeout))
+    except OSError as error:
+        return StatusResult(None, error=str(error))
+    return StatusResult(
+        result.returncode, result.output.decode("utf-8", "replace").strip()
+    )
+
+
+class StatusProbe:
+    """The results of the status commands registered by the monitors.
+
+    An owner (a monitor) registering a command must have a wants_status()
+    method, saying whether it will ask for its command's result this loop;
+    the first time a command is asked for, it is run along with those of the
+    owners which will, and not the rest (e.g. monitors not due to run)."""
+
+    def __init__(self, workers: int = WORKERS) -> None:
+        self.workers = workers
+        # monitor -> its command; a monitor which goes away (e.g. on reload)
+        # takes its command with it
+        self._commands = (
+            weakref.WeakKeyDictionary()
+        )  # type: weakref.WeakKeyDictionary[Any, Command]
+        # command -> its result, for this loop
+        self._cache = LoopCache(dict)  # type: LoopCache[Dict[Command, StatusResult]]
+        self._lock = threading.Lock()
+
+    def register(self, owner: Any, command: Command) -> None:
+        with self._lock:
+            self._commands[owner] = command
+
+    def _run(self, commands: Set[Command]) -> Dict[Command, StatusResult]:
+        if len(commands) < 2:
+            return {command: run_status(command) for command in commands}
+        with ThreadPoolExecutor(min(self.workers, len(commands))) as executor:
+            return dict(zip(commands, executor.map(run_status, commands)))
+
+    def result(self, command: Command) -> StatusResult:
+        """The result of command as of this loop."""
+        with self._lock:
+            results = self._cache.get()
+            if command not in results:
+                wanted = {command}
+                wanted.update(
+                    other
+                    for (owner, other) in self._commands.items()
+                    if other not in results and owner.wants_status()
+                )
+                results.update(self._run(wanted))
+            return results[command]
+
+
+PROBE = StatusProbe()
+
+
+def systemd_available() -> bool:
+    return os.path.isdir("/run/systemd/system") and bool(shutil.which("systemctl"))
+
+
+def read_systemd_services() -> Dict[str, str]:
+    """The active state of every service unit systemd knows about."""
+    output = commands.check_output(
+        [
+            "systemctl",
+            "list-units",
+            "--type=service",
+            "--all",
+            "--plain",
+            "--no-legend",
+            "--full",
+        ],
+        timeout=30,
+        stderr=subprocess.DEVNULL,
+        limit=16 * 1024 * 1024,
+    ).decode("utf-8", "replace")
+    states = {}
+    for line in output.splitlines():
+        # UNIT LOAD ACTIVE SUB DESCRIPTION; a bullet marks some units
+        fields = line.lstrip("●* ").split(None, 4)
+        if len(fields) >= 4:
+            states[fields[0]] = fields[2]
+    return states
+
+
+_SYSTEMD_SERVICES = LoopCache(read_systemd_services)
+
+
+def systemd_status(service: str) -> Optional[int]:
+    """The exit code "service <service> status" would give on a systemd host,
+    or None if systemd hasn't listed the service (e.g. the name is an alias)."""
+    if not service.endswith(".service"):
+        service += ".service"
+    state = _SYSTEMD_SERVICES.get().get(service)
+    if state is None:
+        return None
+    if state in ("active", "reloading"):
+        return _SYSTEMD_RUNNING
+    return _SYSTEMD_STOPPED
+
+
+def supervise_running(path: str) -> bool:
+    """Whether supervise is running for the service in path, as svok tells:
+    supervise holds its control fifo open for reading."""
+    try:
+        descriptor = os.open(
+            os.path.join(path, "supervise", "ok"), os.O_WRONLY | os.O_NONBLOCK
+        )
+    except OSError as error:
+        if error.errno in (errno.ENXIO, errno.ENOENT):
+            return False
+        raise
+    os.close(descriptor)
+    return True
@@ -0,0 +1,155 @@
+"""Persist monitor state across restarts of AntEye."""
+
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Collection, Dict, Tuple
+
+from .json_encoding import json_dumps, json_loads
+
+module_logger = logging.getLogger("AntEye.statestore")
+
+# Compact the file once we've appended this many times more records than
+# there are monitors (with a floor, so small configs don't compact constantly)
+_COMPACT_RATIO = 4
+_COMPACT_MINIMUM = 1000
+
+# seconds between checkpoints of the fields which change on every run
+CHECKPOINT_INTERVAL = 300
+
+
+class StateStore:
+    """An append-only log of monitor states.
+
+    Each line is a JSON record of one monitor's state; later lines replace
+    earlier ones for the same monitor. Only monitors whose state changed are
+    appended each time. Changes to the volatile fields of a state (counters,
+    timestamps and the like, which change on every run) are only written
+    every checkpoint_interval seconds. The file is rewritten with just the
+    latest record for each monitor when enough records have been appended."""
+
+    def __init__(
+        self, filename: Path, checkpoint_interval: float = CHECKPOINT_INTERVAL
+    ) -> None:
+        self.filename = filename
+        self.checkpoint_interval = checkpoint_interval
+        # the last record written for each monitor, and its state without the
+        # volatile fields
+        self._written = {}  # type: Dict[str, bytes]
+        self._significant = {}  # type: Dict[str, bytes]
+        self._appended = 0
+        self._checkpointed = time.time()
+
+    def load(self) -> Dict[str, Tuple[str, dict]]:
+        """Read the file, returning (monitor_type, state) for each monitor."""
+        states = {}  # type: Dict[str, Tuple[str, dict]]
+        try:
+            with open(self.filename, "rb") as file_handle:
+                for line_number, line in enumerate(file_handle, start=1):
+                    try:
+                        record = json_loads(line)
+                        states[record["name"]] = (record["type"], record["state"])
+                    except (ValueError, KeyError, TypeError):
+                        # most likely a partial line from a crash while writing
+                        module_logger.warning(
+                            "Ignoring bad record on line %d of %s",
+                            line_number,
+                            self.filename,
+                        )
+        except FileNotFoundError:
+            return {}
+        except OSError:
+            module_logger.exception("Could not read state file %s", self.filename)
+            return {}
+        return states
+
+    @staticmethod
+    def _encode(name: str, monitor_type: str, state: dict) -> bytes:
+        record = {"name": name, "type": monitor_type, "state": state}
+        return json_dumps(record) + b"\n"
+
+    def save(
+        self,
+        states: Dict[str, Tuple[str, dict]],
+        compact: bool = False,
+        volatile: Collection[str] = (),
+        checkpoint: bool = False,
+    ) -> None:
+        """Record the given states, appending only those which changed.
+
+        A change to only the volatile fields of a state is written at the next
+        checkpoint: when checkpoint is set, or checkpoint_interval seconds
+        have passed since the last one.
+
+        If compact is set, or enough records have been appended by a
+        checkpoint, rewrite the file instead; this also drops monitors not in
+        states."""
+        now = time.time()
+        checkpoint = checkpoint or now - self._checkpointed >= self.checkpoint_interval
+        significant = {
+            name: self._encode(
+                name,
+                monitor_type,
+                {k: v for (k, v) in state.items() if k not in volatile},
+            )
+            for (name, (monitor_type, state)) in states.items()
+        }
+        if compact or (
+            checkpoint
+            and self._appended > max(_COMPACT_MINIMUM, _COMPACT_RATIO * len(states))
+        ):
+            self._compact(
+                {
+                    name: self._encode(name, monitor_type, state)
+                    for (name, (monitor_type, state)) in states.items()
+                },
+                significant,
+            )
+            self._checkpointed = now
+            return
+        records = {}  # type: Dict[str, bytes]
+        for (name, (monitor_type, state)) in states.items():
+            if not checkpoint and self._significant.get(name) == significant[name]:
+                continue
+            record = self._encode(name, monitor_type, state)
+            if self._written.get(name) != record:
+                records[name] = record
+        if checkpoint:
+            self._checkpointed = now
+        if not records:
+            return
+        try:
+            with open(self.filename, "ab") as file_handle:
+                file_handle.write(b"".join(records.values()))
+        except OSError:
+            module_logger.exception("Could not write state file %s", self.filename)
+            return
+        self._written.update(records)
+        for name in records:
+            self._significant[name] = significant[name]
+        self._appended += len(records)
+
+    def _compact(
+        self, records: Dict[str, bytes], significant: Dict[str, bytes]
+    ) -> None:
+        """Atomically rewrite the file with just the given records."""
+        temp_name = None
+        try:
+            temp_fd, temp_name = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(self.filename)),
+                prefix=".",
+                suffix=".tmp",
+            )
+            with os.fdopen(temp_fd, "wb") as file_handle:
+                file_handle.write(b"".join(records.values()))
+            os.replace(temp_name, self.filename)
+        except OSError:
+            module_logger.exception("Could not compact state file %s", self.filename)
+            if temp_name is not None and os.path.exists(temp_name):
+                os.unlink(temp_name)
+            return
+        self._written = dict(records)
+        self._significant = dict(significant)
+        self._appended = 0
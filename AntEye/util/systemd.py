@@ -0,0 +1,188 @@
+"""The state of the systemd units, shared by the systemd-unit monitors.
+
+systemd's ListUnits is called at most once per loop (see
+AntEye.util.loopcache), and the units indexed by name, so a monitor for one
+unit is a dict access and one for a glob a single pass over the names.
+
+Alternatively, watch() subscribes to systemd's signals: units' state changes
+are then applied as they happen, from a thread running a GLib main loop, and
+ListUnits is only called again when units come or go (or every so often, in
+case a signal has been missed)."""
+
+import fnmatch
+import glob
+import logging
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .loopcache import LoopCache
+
+try:
+    import pydbus
+except ImportError:
+    pydbus = None
+
+try:
+    from gi.repository import GLib
+except ImportError:
+    GLib = None
+
+module_logger = logging.getLogger("AntEye.systemd")
+
+# the interfaces and properties we care about
+_UNIT_INTERFACE = "org.freedesktop.systemd1.Unit"
+_PROPERTIES = {
+    "LoadState": "load_state",
+    "ActiveState": "active_state",
+    "SubState": "sub_state",
+}
+
+# how often to re-read all the units when watching, in case a signal was lost
+_RESYNC_INTERVAL = 300
+
+
+class UnitInfo:
+    """The parts of a unit the monitors check."""
+
+    __slots__ = ("name", "load_state", "active_state", "sub_state", "path")
+
+    def __init__(
+        self, name: str, load_state: str, active_state: str, sub_state: str, path: str
+    ) -> None:
+        self.name = name
+        self.load_state = load_state
+        self.active_state = active_state
+        self.sub_state = sub_state
+        self.path = path
+
+    def __repr__(self) -> str:
+        return "<UnitInfo {} {}/{}>".format(
+            self.name, self.active_state, self.sub_state
+        )
+
+
+class UnitTable:
+    """Units indexed by name and by D-Bus object path."""
+
+    def __init__(self, units: Iterable[UnitInfo]) -> None:
+        self.units = {unit.name: unit for unit in units}
+        self._by_path = {unit.path: unit for unit in self.units.values()}
+        # the names in order, for globs to run through
+        self._names = sorted(self.units)
+
+    def find(self, matcher: "UnitMatcher") -> List[UnitInfo]:
+        """The units matcher matches, by name."""
+        if matcher.regex is None:
+            unit = self.units.get(matcher.pattern)
+            return [unit] if unit is not None else []
+        match = matcher.regex.match
+        return [self.units[name] for name in self._names if match(name)]
+
+    def update(self, path: str, properties: Dict[str, Any]) -> None:
+        """Apply the changed properties of the unit at path, if we know it."""
+        unit = self._by_path.get(path)
+        if unit is None:
+            return
+        for (prop, attr) in _PROPERTIES.items():
+            if prop in properties:
+                setattr(unit, attr, properties[prop])
+
+    def __len__(self) -> int:
+        return len(self.units)
+
+
+class UnitMatcher:
+    """A unit name, or a glob of them, compiled once."""
+
+    def __init__(self, pattern: str) -> None:
+        self.pattern = pattern
+        self.regex = None  # type: Optional[Any]
+        if glob.has_magic(pattern):
+            self.regex = re.compile(fnmatch.translate(pattern))
+
+
+def read_units() -> List[UnitInfo]:
+    """All the units systemd knows about, from ListUnits."""
+    systemd = pydbus.SystemBus().get(".systemd1")
+    return [
+        UnitInfo(name, load_state, active_state, sub_state, path)
+        for (
+            name,
+            _description,
+            load_state,
+            active_state,
+            sub_state,
+            _follower,
+            path,
+            _job_id,
+            _job_type,
+            _job_path,
+        ) in systemd.ListUnits()
+    ]
+
+
+class UnitSnapshot:
+    """The units as of this loop, or as last told by systemd if watching."""
+
+    def __init__(self, read: Callable[[], List[UnitInfo]] = read_units) -> None:
+        self.read = read
+        self._cache = LoopCache(self._collect)
+        self._lock = threading.Lock()
+        self._watching = False
+        # when watching, the live table and when it was last read in full
+        self._table = None  # type: Optional[UnitTable]
+        self._read_at = 0.0
+
+    def _collect(self) -> UnitTable:
+        return UnitTable(self.read())
+
+    def table(self) -> UnitTable:
+        if not self._watching:
+            return self._cache.get()
+        with self._lock:
+            if self._table is None or time.time() - self._read_at > _RESYNC_INTERVAL:
+                self._table = self._collect()
+                self._read_at = time.time()
+            return self._table
+
+    def _stale(self) -> None:
+        with self._lock:
+            self._table = None
+
+    def _signal(
+        self, _sender: str, path: str, _iface: str, signal: str, params: tuple
+    ) -> None:
+        if signal == "PropertiesChanged":
+            (interface, changed, invalidated) = params
+            if interface != _UNIT_INTERFACE:
+                return
+            if not set(invalidated).isdisjoint(_PROPERTIES):
+                self._stale()
+                return
+            with self._lock:
+                if self._table is not None:
+                    self._table.update(path, changed)
+        elif signal in ("UnitNew", "UnitRemoved", "Reloading"):
+            self._stale()
+
+    def watch(self) -> None:
+        """Have state changes pushed to us by systemd instead of polling."""
+        if self._watching:
+            return
+        if GLib is None:
+            raise RuntimeError("watching systemd needs pydbus and PyGObject")
+        bus = pydbus.SystemBus()
+        bus.subscribe(sender="org.freedesktop.systemd1", signal_fired=self._signal)
+        # systemd only sends the signals while someone has asked for them
+        bus.get(".systemd1").Subscribe()
+        thread = threading.Thread(
+            target=GLib.MainLoop().run, name="systemd-watch", daemon=True
+        )
+        thread.start()
+        self._watching = True
+        module_logger.info("Watching systemd for unit changes")
+
+
+SNAPSHOT = UnitSnapshot()
@@ -0,0 +1,150 @@
+"""Helpers shared by the benchmark scripts."""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+TOP = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(TOP))
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the options every benchmark takes."""
+    parser.add_argument(
+        "--output", help="write results as JSON to this file (default: stdout)"
+    )
+    parser.add_argument(
+        "--baseline", help="JSON results from an earlier run to compare against"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=20.0,
+        help="percentage over the baseline at which a result is a regression",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="how many times to repeat each timing"
+    )
+
+
+def write_config(
+    directory: Path,
+    monitors: Iterable[Tuple[str, Dict[str, str]]],
+    monitor_options: Optional[Dict[str, str]] = None,
+    extra: str = "",
+) -> Path:
+    """Write a monitor.ini and monitors.ini, returning the path to the former.
+
+    monitor_options are added to the [monitor] section; extra is appended to
+    monitor.ini as-is (for [reporting], loggers and alerters)."""
+    monitors_file = directory / "monitors.ini"
+    with open(monitors_file, "w") as file_handle:
+        for (name, options) in monitors:
+            file_handle.write("[{}]\n".format(name))
+            for (key, value) in options.items():
+                file_handle.write("{}={}\n".format(key, value))
+            file_handle.write("\n")
+    config = directory / "monitor.ini"
+    options = {"interval": "60", "monitors": str(monitors_file)}
+    options.update(monitor_options or {})
+    with open(config, "w") as file_handle:
+        file_handle.write("[monitor]\n")
+        for (key, value) in options.items():
+            file_handle.write("{}={}\n".format(key, value))
+        file_handle.write("\n" + extra)
+    return config
+
+
+def null_monitors(count: int, failing: int = 0) -> List[Tuple[str, Dict[str, str]]]:
+    """count null monitors, the first failing of which are fail monitors."""
+    return [
+        ("monitor-{}".format(i), {"type": "fail" if i < failing else "null"})
+        for i in range(count)
+    ]
+
+
+def time_repeat(
+    function: Callable[[], object], repeat: int, setup: Optional[Callable] = None
+) -> Dict[str, float]:
+    """Time function repeat times, returning the min and median in seconds."""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {"min": min(timings), "median": statistics.median(timings)}
+
+
+def compare(
+    results: Dict[str, float], baseline: Dict[str, float], tolerance: float
+) -> List[str]:
+    """Describe each result which is more than tolerance percent over baseline."""
+    regressions = []
+    for (name, value) in sorted(results.items()):
+        base = baseline.get(name)
+        if not isinstance(base, (int, float)) or base <= 0:
+            continue
+        change = (value - base) / base * 100
+        if change > tolerance:
+            regressions.append(
+                "{}: {:.6g} vs baseline {:.6g} (+{:.1f}%)".format(
+                    name, value, base, change
+                )
+            )
+    return regressions
+
+
+def report(
+    name: str, metrics: Dict[str, float], details: dict, options: argparse.Namespace
+) -> int:
+    """Output the results, and compare them to the baseline if there is one.
+
+    metrics are the numbers checked against the baseline, where lower is
+    better; details are included in the output for information only. Returns
+    the exit status for the script."""
+    output = {
+        "benchmark": name,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "metrics": metrics,
+        "details": details,
+    }
+    data = json.dumps(output, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, "w") as file_handle:
+            file_handle.write(data + "\n")
+    else:
+        print(data)
+    if not options.baseline:
+        return 0
+    with open(options.baseline) as file_handle:
+        baseline = json.load(file_handle)
+    regressions = compare(metrics, baseline.get("metrics", {}), options.tolerance)
+    for regression in regressions:
+        print("REGRESSION " + regression, file=sys.stderr)
+    return 1 if regressions else 0
+
+
+def quiet_logging() -> None:
+    """Stop AntEye logging warnings (e.g. about no alerters) to the console."""
+    logging.getLogger("AntEye").setLevel(logging.CRITICAL + 1)
+
+
+def environment() -> Dict[str, str]:
+    """Environment for running AntEye in a subprocess from the source tree."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [str(TOP)] + [x for x in env.get("PYTHONPATH", "").split(os.pathsep) if x]
+    )
+    return env
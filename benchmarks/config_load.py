@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+"""Benchmark loading a large monitors config.
+
+Run from the top of the source tree:
+
+    python benchmarks/config_load.py [--sections 20000]
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from AntEye.AntEye import AntEye  # noqa: E402
+from AntEye.util import envconfig, get_config_dict  # noqa: E402
+
+
+def write_monitors(filename: Path, sections: int, continuation: bool) -> None:
+    with open(filename, "w") as file_handle:
+        file_handle.write("[defaults]\ngap=60\ntolerance=1\n")
+        if continuation:
+            # a multi-line value needs the full ConfigParser
+            file_handle.write("failure_doc=a value\n  over two lines\n")
+        file_handle.write("\n")
+        for i in range(sections):
+            file_handle.write(
+                "[monitor-{0}]\ntype=null\ngroup=group-{1}\n"
+                "failure_doc=check %env:BENCH_HOST% number {0}\n\n".format(i, i % 50)
+            )
+
+
+def time_it(label: str, function: Callable[[], object]) -> None:
+    gc.collect()
+    start = time.perf_counter()
+    function()
+    print("{0:<45} {1:8.3f}s".format(label, time.perf_counter() - start))
+
+
+def configparser_load(filename: Path) -> None:
+    config = envconfig.EnvironmentAwareConfigParser()
+    config.read(filename)
+    for section in config.sections():
+        get_config_dict(config, section)
+
+
+def bench_read(directory: Path, sections: int, continuation: bool) -> None:
+    monitors = directory / "monitors.ini"
+    cache = directory / "monitors.cache"
+    write_monitors(monitors, sections, continuation)
+    if cache.exists():
+        cache.unlink()
+    kind = "multi-line" if continuation else "simple"
+
+    def read() -> None:
+        config_cache = envconfig.ConfigCache(cache)
+        envconfig.read_config_sections(monitors, config_cache)
+        config_cache.save()
+
+    time_it("ConfigParser ({})".format(kind), lambda: configparser_load(monitors))
+    envconfig._compiled.clear()
+    time_it("read_config_sections ({}, parse)".format(kind), read)
+    envconfig._compiled.clear()
+    time_it("read_config_sections ({}, cache file)".format(kind), read)
+    time_it("read_config_sections ({}, in memory)".format(kind), read)
+
+
+def bench_startup(directory: Path, sections: int) -> None:
+    monitors = directory / "monitors.ini"
+    write_monitors(monitors, sections, False)
+    config = directory / "monitor.ini"
+    with open(config, "w") as file_handle:
+        file_handle.write("[monitor]\ninterval=60\nmonitors={0}\n".format(monitors))
+    envconfig._compiled.clear()
+    instance = None
+
+    def start() -> None:
+        nonlocal instance
+        instance = AntEye(config)
+
+    time_it("AntEye startup", start)
+    assert instance is not None
+    time_it("AntEye reload (unchanged)", instance._load_config)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sections", type=int, default=20000)
+    options = parser.parse_args()
+
+    os.environ["BENCH_HOST"] = "localhost"
+    print("Loading {0} monitor sections".format(options.sections))
+    with tempfile.TemporaryDirectory() as directory:
+        bench_read(Path(directory), options.sections, False)
+        bench_read(Path(directory), options.sections, True)
+        bench_startup(Path(directory), options.sections)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+"""Benchmark AntEye under synthetic load, against local stand-in services.
+
+Runs thousands of null/fail monitors plus HTTP and TCP monitors against stub
+servers on 127.0.0.1, with an email alerter sending to a stub SMTP sink and an
+MQTT logger publishing to a stub broker, so it needs no network access. Also
+measures memory per monitor and how fast the network listener ingests
+results from a remote instance.
+
+Run from the top of the source tree:
+
+    python benchmarks/load.py [--monitors 5000] [--loops 5] [--output results.json]
+    python benchmarks/load.py --baseline results.json --tolerance 20
+
+Exits non-zero if any metric is more than --tolerance percent over the
+baseline.
+"""
+
+import argparse
+import gc
+import importlib.util
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import common
+import stubs
+
+from AntEye.AntEye import AntEye  # noqa: E402
+from AntEye.Loggers.network import Listener, NetworkLogger  # noqa: E402
+
+PHASES = ["run_tests", "do_recovery", "do_recovered", "do_alerts", "do_logs"]
+
+_KEY = "benchmark"
+
+
+def summarise(timings: List[float]) -> Dict[str, float]:
+    ordered = sorted(timings)
+    return {
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+
+def wait_for(condition: Callable[[], bool], timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def load_monitors(
+    options: argparse.Namespace, http_port: int, tcp_port: int
+) -> List[Tuple[str, Dict[str, str]]]:
+    monitors = common.null_monitors(options.monitors, options.failing)
+    for i in range(options.http):
+        monitors.append(
+            (
+                "http-{}".format(i),
+                {"type": "http", "url": "http://127.0.0.1:{}/".format(http_port)},
+            )
+        )
+    for i in range(options.tcp):
+        monitors.append(
+            (
+                "tcp-{}".format(i),
+                {"type": "tcp", "host": "127.0.0.1", "port": str(tcp_port)},
+            )
+        )
+    return monitors
+
+
+def reporting(smtp_port: int, mqtt_port: int) -> str:
+    """The [reporting] section and its logger and alerter sections."""
+    loggers = []
+    extra = (
+        "[email]\ntype=email\nhost=127.0.0.1\nport={}\n"
+        "from=anteye@localhost\nto=admin@localhost\n\n".format(smtp_port)
+    )
+    if importlib.util.find_spec("paho") is not None:
+        loggers.append("mqtt")
+        extra += "[mqtt]\ntype=mqtt\nhost=127.0.0.1\nport={}\n\n".format(mqtt_port)
+    return (
+        "[reporting]\nloggers={}\nalerters=email\n\n".format(",".join(loggers)) + extra
+    )
+
+
+def instrument(instance: AntEye) -> Dict[str, List[float]]:
+    """Wrap the instance's loop phases to record how long each call takes."""
+    timings = {phase: [] for phase in PHASES}  # type: Dict[str, List[float]]
+
+    def wrap(phase: str) -> None:
+        original = getattr(instance, phase)
+
+        def timed() -> None:
+            start = time.perf_counter()
+            original()
+            timings[phase].append(time.perf_counter() - start)
+
+        setattr(instance, phase, timed)
+
+    for phase in PHASES:
+        wrap(phase)
+    return timings
+
+
+def run_loops(instance: AntEye, loops: int) -> Dict:
+    timings = instrument(instance)
+    loop_timings = []
+    for _ in range(loops):
+        start = time.perf_counter()
+        instance.run_loop()
+        loop_timings.append(time.perf_counter() - start)
+    return {
+        "loop": summarise(loop_timings),
+        "phases": {phase: summarise(timings[phase]) for phase in PHASES},
+    }
+
+
+def memory_per_monitor(config: Path, count: int) -> Dict[str, float]:
+    """Bytes allocated per monitor when loading count monitors."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        instance = AntEye(config)
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    assert len(instance.monitors) == count
+    return {
+        "bytes_per_monitor": (after - before) / count,
+        "total_bytes": after - before,
+    }
+
+
+def listener_ingest(instance: AntEye, batches: int) -> Dict[str, float]:
+    """Send batches of the instance's monitors to a Listener feeding instance."""
+    received = []  # type: List[int]
+    update = instance.update_remote_monitor
+
+    def counting_update(data: dict, hostname: str) -> None:
+        update(data, hostname)
+        received.append(len(data))
+
+    instance.update_remote_monitor = counting_update  # type: ignore
+    listener = Listener(instance, 0, _KEY, allow_pickle=False)
+    listener.daemon = True
+    port = listener.sock.getsockname()[1]
+    # the thread calls listen() itself, but the first batch may beat it there
+    listener.sock.listen(5)
+    listener.start()
+    sender = NetworkLogger({"host": "127.0.0.1", "port": str(port), "key": _KEY})
+    try:
+        start = time.perf_counter()
+        for _ in range(batches):
+            sender.start_batch()
+            for (name, monitor) in instance.monitors.items():
+                sender.save_result2(name, monitor)
+            sender.end_batch()
+        if not wait_for(lambda: len(received) >= batches, 60):
+            raise RuntimeError(
+                "listener only received {} of {} batches".format(len(received), batches)
+            )
+        elapsed = time.perf_counter() - start
+    finally:
+        listener.running = False
+        listener.sock.close()
+        instance.update_remote_monitor = update  # type: ignore
+    monitors = sum(received)
+    return {
+        "seconds": elapsed,
+        "batches": batches,
+        "monitors": monitors,
+        "monitors_per_second": monitors / elapsed,
+        "seconds_per_1000_monitors": elapsed / monitors * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    common.add_arguments(parser)
+    parser.add_argument(
+        "--monitors", type=int, default=5000, help="number of null/fail monitors"
+    )
+    parser.add_argument(
+        "--failing", type=int, default=50, help="how many monitors should fail"
+    )
+    parser.add_argument("--http", type=int, default=50, help="number of HTTP monitors")
+    parser.add_argument("--tcp", type=int, default=50, help="number of TCP monitors")
+    parser.add_argument("--loops", type=int, default=5, help="loops to run")
+    parser.add_argument(
+        "--batches", type=int, default=20, help="network logger batches to send"
+    )
+    options = parser.parse_args()
+    common.quiet_logging()
+
+    servers = {
+        "http": stubs.HTTPStub().start(),
+        "tcp": stubs.TCPStub().start(),
+        "smtp": stubs.SMTPStub().start(),
+        "mqtt": stubs.MQTTStub().start(),
+    }
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            null_only = Path(directory) / "memory"
+            null_only.mkdir()
+            memory = memory_per_monitor(
+                common.write_config(null_only, common.null_monitors(options.monitors)),
+                options.monitors,
+            )
+
+            monitors = load_monitors(options, servers["http"].port, servers["tcp"].port)
+            config = common.write_config(
+                Path(directory),
+                monitors,
+                extra=reporting(servers["smtp"].port, servers["mqtt"].port),
+            )
+            instance = AntEye(config)
+            loops = run_loops(instance, options.loops)
+            # MQTT publishes asynchronously; give them a moment to arrive
+            wait_for(lambda: servers["mqtt"].count >= len(monitors), 5)
+            ingest = listener_ingest(instance, options.batches)
+            for logger in instance.loggers.values():
+                # stop the MQTT logger's network thread while the broker is up
+                if hasattr(logger, "_disconnect"):
+                    logger._disconnect()
+    finally:
+        for server in servers.values():
+            server.stop()
+
+    metrics = {
+        "loop_s": loops["loop"]["median"],
+        "bytes_per_monitor": memory["bytes_per_monitor"],
+        "ingest_s_per_1000_monitors": ingest["seconds_per_1000_monitors"],
+    }
+    for phase in PHASES:
+        metrics[phase + "_s"] = loops["phases"][phase]["median"]
+    details = {
+        "monitors": len(monitors),
+        "failing": options.failing,
+        "loops": options.loops,
+        "timings": loops,
+        "memory": memory,
+        "ingest": ingest,
+        "received": {name: server.count for (name, server) in servers.items()},
+    }
+    sys.exit(common.report("load", metrics, details, options))
+
+
+if __name__ == "__main__":
+    main()
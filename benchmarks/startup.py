@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+"""Benchmark startup: imports, config loading and a single loop.
+
+Run from the top of the source tree:
+
+    python benchmarks/startup.py [--monitors 1000] [--output results.json]
+    python benchmarks/startup.py --baseline results.json --tolerance 20
+
+Exits non-zero if any metric is more than --tolerance percent over the
+baseline.
+"""
+
+import argparse
+import re
+import subprocess  # nosec
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import common
+
+from AntEye.AntEye import AntEye  # noqa: E402
+from AntEye.util import envconfig, monitorconfig  # noqa: E402
+
+_IMPORTTIME = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def parse_importtime(output: str) -> List[Dict]:
+    """Parse the output of python -X importtime into a list of modules."""
+    modules = []
+    for line in output.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match is None:
+            continue
+        modules.append(
+            {
+                "module": match.group(4),
+                "self_us": int(match.group(1)),
+                "cumulative_us": int(match.group(2)),
+                "depth": (len(match.group(3)) - 1) // 2,
+            }
+        )
+    return modules
+
+
+def import_cost(repeat: int) -> Dict:
+    """Time importing the CLI module, and find which imports dominate."""
+    best = None  # type: Optional[List[Dict]]
+    best_total = None
+    for _ in range(repeat):
+        result = subprocess.run(  # nosec
+            [sys.executable, "-X", "importtime", "-c", "import AntEye.monitor"],
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            env=common.environment(),
+            check=True,
+        )
+        modules = parse_importtime(result.stderr)
+        total = sum(
+            x["cumulative_us"]
+            for x in modules
+            if x["depth"] == 0 and x["module"].startswith("AntEye")
+        )
+        if best_total is None or total < best_total:
+            best = modules
+            best_total = total
+    assert best is not None
+    top = sorted(best, key=lambda x: x["self_us"], reverse=True)[:20]
+    return {
+        "total_us": best_total,
+        "module_count": len(best),
+        "top_self": top,
+        "AntEye": [x for x in best if x["module"].startswith("AntEye")],
+    }
+
+
+def cold_start(config: Path, repeat: int) -> Dict[str, float]:
+    """Time the whole --test run in a fresh interpreter."""
+
+    def run() -> None:
+        subprocess.run(  # nosec
+            [sys.executable, "-m", "AntEye.monitor", "--test", "-q", "-f", str(config)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            env=common.environment(),
+            check=True,
+        )
+
+    return common.time_repeat(run, repeat)
+
+
+def interpreter_start(repeat: int) -> Dict[str, float]:
+    """Time an interpreter doing nothing, to put cold_start in context."""
+
+    def run() -> None:
+        subprocess.run([sys.executable, "-c", "pass"], check=True)  # nosec
+
+    return common.time_repeat(run, repeat)
+
+
+def forget_config() -> None:
+    """Make the next config load parse everything from scratch."""
+    envconfig._compiled.clear()
+    monitorconfig._expanded.clear()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    common.add_arguments(parser)
+    parser.add_argument(
+        "--monitors", type=int, default=1000, help="number of monitors to load"
+    )
+    parser.add_argument(
+        "--failing", type=int, default=100, help="how many monitors should fail"
+    )
+    options = parser.parse_args()
+    common.quiet_logging()
+
+    with tempfile.TemporaryDirectory() as directory:
+        small = Path(directory) / "small"
+        small.mkdir()
+        small_config = common.write_config(small, common.null_monitors(1))
+        large = Path(directory) / "large"
+        large.mkdir()
+        large_config = common.write_config(
+            large, common.null_monitors(options.monitors, options.failing)
+        )
+
+        imports = import_cost(options.repeat)
+        interpreter = interpreter_start(options.repeat)
+        cold = cold_start(small_config, options.repeat)
+        cold_large = cold_start(large_config, options.repeat)
+        load = common.time_repeat(
+            lambda: AntEye(large_config), options.repeat, setup=forget_config
+        )
+        instance = AntEye(large_config)
+        loop = common.time_repeat(instance.run_loop, options.repeat)
+
+    metrics = {
+        "import_s": imports["total_us"] / 1e6,
+        "cold_start_s": cold["min"],
+        "cold_start_large_s": cold_large["min"],
+        "config_load_s": load["min"],
+        "run_loop_s": loop["min"],
+    }
+    details = {
+        "monitors": options.monitors,
+        "failing": options.failing,
+        "interpreter_start": interpreter,
+        "cold_start": cold,
+        "cold_start_large": cold_large,
+        "config_load": load,
+        "run_loop": loop,
+        "imports": imports,
+    }
+    sys.exit(common.report("startup", metrics, details, options))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Local stand-ins for the services monitors, loggers and alerters talk to.
+
+Each stub listens on 127.0.0.1 on a free port, runs in a daemon thread, and
+counts what it receives. They implement just enough of each protocol for
+AntEye's clients to be happy."""
+
+import socketserver
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any, Tuple
+
+
+# the listen() backlog; the default (5) overflows when the monitors all
+# connect at once, and the connections left over wait a second for the
+# SYN to be sent again, which would be most of what we measure
+_BACKLOG = 1024
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = _BACKLOG
+
+    def __init__(self, address: Tuple[str, int], handler: Any) -> None:
+        socketserver.TCPServer.__init__(self, address, handler)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def increment(self) -> None:
+        with self.lock:
+            self.count += 1
+
+
+class _HTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = _BACKLOG
+    count = 0
+    lock = threading.Lock()
+
+    def increment(self) -> None:
+        with self.lock:
+            self.count += 1
+
+
+class Stub:
+    """Base for the stubs: start() to listen, stop() when done."""
+
+    def __init__(self, server: Any) -> None:
+        self.server = server
+        self.port = server.server_address[1]
+        self._thread = threading.Thread(target=server.serve_forever)
+        self._thread.daemon = True
+
+    @property
+    def count(self) -> int:
+        return self.server.count
+
+    def start(self) -> "Stub":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _HTTPHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        self.server.increment()  # type: ignore
+        body = b"ok\n"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class HTTPStub(Stub):
+    """Answers every GET with 200 OK."""
+
+    def __init__(self) -> None:
+        super().__init__(_HTTPServer(("127.0.0.1", 0), _HTTPHandler))
+
+
+class _TCPHandler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        self.server.increment()  # type: ignore
+
+
+class TCPStub(Stub):
+    """Accepts connections and closes them."""
+
+    def __init__(self) -> None:
+        super().__init__(_Server(("127.0.0.1", 0), _TCPHandler))
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str) -> None:
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self) -> None:
+        self._reply("220 localhost stub SMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                self._reply("250 localhost")
+            elif command == b"DATA":
+                self._reply("354 go ahead")
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data == b".\r\n":
+                        break
+                self.server.increment()  # type: ignore
+                self._reply("250 queued")
+            elif command == b"QUIT":
+                self._reply("221 bye")
+                return
+            else:
+                # MAIL, RCPT, RSET, NOOP
+                self._reply("250 ok")
+
+
+class SMTPStub(Stub):
+    """Accepts and discards mail, counting messages."""
+
+    def __init__(self) -> None:
+        super().__init__(_Server(("127.0.0.1", 0), _SMTPHandler))
+
+
+class _MQTTHandler(socketserver.BaseRequestHandler):
+    def _read(self, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise EOFError()
+            data += chunk
+        return data
+
+    def _packet(self) -> Tuple[int, bytes]:
+        header = self._read(1)[0]
+        length = 0
+        multiplier = 1
+        while True:
+            byte = self._read(1)[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        return (header, self._read(length))
+
+    def handle(self) -> None:
+        try:
+            while True:
+                (header, body) = self._packet()
+                packet_type = header >> 4
+                if packet_type == 1:  # CONNECT
+                    self.request.sendall(b"\x20\x02\x00\x00")
+                elif packet_type == 3:  # PUBLISH
+                    self.server.increment()  # type: ignore
+                    qos = (header >> 1) & 3
+                    if qos:
+                        topic_length = struct.unpack("!H", body[:2])[0]
+                        packet_id = body[2 + topic_length : 4 + topic_length]
+                        # PUBACK or PUBREC
+                        self.request.sendall(
+                            (b"\x40\x02" if qos == 1 else b"\x50\x02") + packet_id
+                        )
+                elif packet_type == 6:  # PUBREL
+                    self.request.sendall(b"\x70\x02" + body[:2])
+                elif packet_type == 8:  # SUBSCRIBE
+                    granted = b""
+                    offset = 2
+                    while offset < len(body):
+                        topic_length = struct.unpack("!H", body[offset : offset + 2])[0]
+                        offset += 2 + topic_length
+                        granted += body[offset : offset + 1]
+                        offset += 1
+                    payload = body[:2] + granted
+                    self.request.sendall(bytes([0x90, len(payload)]) + payload)
+                elif packet_type == 12:  # PINGREQ
+                    self.request.sendall(b"\xd0\x00")
+                elif packet_type == 14:  # DISCONNECT
+                    return
+        except (EOFError, OSError):
+            return
+
+
+class MQTTStub(Stub):
+    """A minimal MQTT 3.1.1 broker which accepts and discards publishes."""
+
+    def __init__(self) -> None:
+        super().__init__(_Server(("127.0.0.1", 0), _MQTTHandler))
@@ -1,6 +1,10 @@
 # type: ignore
+import configparser
 import os
+import tempfile
 import unittest
+from pathlib import Path
+from unittest.mock import patch
 
 from AntEye.util import envconfig
 
@@ -17,3 +21,88 @@ class TestEnvConfig(unittest.TestCase):
         config = envconfig.EnvironmentAwareConfigParser()
         config.read("tests/monitor-env.ini")
         self.assertEqual(config.get("monitor-test1", "monitors"), "hello")
+
+
+class TestReadConfigSections(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = Path(self.directory.name) / "monitors.ini"
+        self.cache = Path(self.directory.name) / "monitors.cache"
+        envconfig._compiled.clear()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _write(self, data):
+        with open(self.filename, "w") as f:
+            f.write(data)
+
+    def test_same_as_configparser(self):
+        data = (
+            "; comment\n[one]\ntype = null\nKey: a=b\n  # indented comment\n"
+            "[two:%env:TEST_VALUE%]\nempty=\nvalue=x %env:TEST_VALUE% y\n"
+        )
+        sections = envconfig._parse_simple(data)
+        self.assertIsNotNone(sections)
+        parser = configparser.ConfigParser(interpolation=None)
+        parser.read_string(data)
+        self.assertEqual(
+            sections, [(s, dict(parser.items(s))) for s in parser.sections()]
+        )
+        self._write(data)
+        self.assertEqual(
+            envconfig.read_config_sections(self.filename),
+            {
+                "one": {"type": "null", "key": "a=b"},
+                "two:test1": {"empty": "", "value": "x test1 y"},
+            },
+        )
+
+    def test_fallback(self):
+        for data in [
+            "[one]\nvalue=a\n  b\n",
+            "[DEFAULT]\ngroup=x\n[one]\ntype=null\n",
+            "[one]\na=1\n[one]\na=2\n",
+            "[one]\nnovalue\n",
+        ]:
+            self.assertIsNone(envconfig._parse_simple(data), data)
+        self._write("[DEFAULT]\ngroup=x\n[one]\nvalue=a\n  b\n")
+        self.assertEqual(
+            envconfig.read_config_sections(self.filename),
+            {"one": {"group": "x", "value": "a\nb"}},
+        )
+        self._write("[one]\na=1\n[one]\na=2\n")
+        with self.assertRaises(configparser.DuplicateSectionError):
+            envconfig.read_config_sections(self.filename)
+
+    def test_missing_env(self):
+        self._write("[one]\nvalue=%env:NOT_A_REAL_VARIABLE%\n")
+        with self.assertRaises(ValueError):
+            envconfig.read_config_sections(self.filename)
+
+    def test_cache(self):
+        self._write("[one]\ntype=null\n")
+        expected = {"one": {"type": "null"}}
+        cache = envconfig.ConfigCache(self.cache)
+        self.assertEqual(envconfig.read_config_sections(self.filename, cache), expected)
+        cache.save()
+        self.assertTrue(self.cache.exists())
+        with patch.object(envconfig, "_parse_sections") as parse:
+            # in memory
+            self.assertEqual(
+                envconfig.read_config_sections(self.filename, cache), expected
+            )
+            # from the cache file
+            envconfig._compiled.clear()
+            self.assertEqual(
+                envconfig.read_config_sections(
+                    self.filename, envconfig.ConfigCache(self.cache)
+                ),
+                expected,
+            )
+            parse.assert_not_called()
+        self._write("[one]\ntype=fail\n")
+        self.assertEqual(
+            envconfig.read_config_sections(self.filename, cache),
+            {"one": {"type": "fail"}},
+        )
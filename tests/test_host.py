@@ -1,5 +1,11 @@
 # type: ignore
+import os
+import sys
+import tempfile
+import time
 import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
 
 from AntEye.Monitors import host
 from AntEye.Monitors.monitor import MonitorConfigurationError
@@ -123,6 +129,161 @@ class TestHostMonitors(unittest.TestCase):
         m = host.MonitorCommand("test", config_options)
         self.assertTupleEqual(m.get_params(), (["ls", "/"], "", 10))
 
+    @unittest.skipIf(sys.platform == "win32", "needs a shell")
+    def test_PkgAudit_cache(self):
+        with tempfile.TemporaryDirectory() as root:
+            pkg = os.path.join(root, "pkg")
+            runs = os.path.join(root, "runs")
+            with open(pkg, "w") as file_handle:
+                file_handle.write(
+                    "#!/bin/sh\n"
+                    "echo run >> {}\n"
+                    "echo '2 problem(s) in 1 installed package(s) found.'\n"
+                    "exit 1\n".format(runs)
+                )
+            os.chmod(pkg, 0o755)
+            vuln_db = os.path.join(root, "vuln.xml")
+            package_db = os.path.join(root, "local.sqlite")
+            for path in [vuln_db, package_db]:
+                open(path, "w").close()
+            config = {"path": pkg, "vuln_db": vuln_db, "package_db": package_db}
+            m = host.MonitorPkgAudit("test", config)
+            for _ in range(2):
+                self.assertFalse(m.run_test())
+                self.assertEqual(m.last_result, "2 problems")
+            with open(runs) as file_handle:
+                self.assertEqual(len(file_handle.readlines()), 1)
+            # a new vulnerability database means auditing again
+            os.utime(vuln_db, (time.time() + 10, time.time() + 10))
+            self.assertFalse(m.run_test())
+            self.assertFalse(m.run_test())
+            with open(runs) as file_handle:
+                self.assertEqual(len(file_handle.readlines()), 2)
+            m = host.MonitorPkgAudit("test", dict(config, cache_max_age="0"))
+            m.run_test()
+            m.run_test()
+            with open(runs) as file_handle:
+                self.assertEqual(len(file_handle.readlines()), 4)
+
+    def test_Command_timeout(self):
+        m = host.MonitorCommand(
+            "test",
+            {
+                "command": '"{}" -c "import time; time.sleep(30)"'.format(
+                    sys.executable
+                ),
+                "command_timeout": "0.5",
+            },
+        )
+        start = time.time()
+        self.assertFalse(m.run_test())
+        self.assertLess(time.time() - start, 10)
+        self.assertIn("timed out after 0.5 seconds", m.last_result)
+
+    def test_DiskSpace_values(self):
+        m = host.MonitorDiskSpace("test", {"partition": "/", "limit": "1"})
+        m.run_test()
+        self.assertEqual(
+            sorted(m.values.keys()),
+            ["free_bytes", "free_inodes", "percent_free", "total_bytes"],
+        )
+        self.assertLessEqual(m.values["free_bytes"], m.values["total_bytes"])
+
+    @unittest.skipUnless(sys.platform == "linux", "needs /proc")
+    def test_host_values(self):
+        m = host.MonitorLoadAvg("test", {"max": "10000"})
+        self.assertTrue(m.run_test(), m.last_result)
+        self.assertEqual(m.last_result, "%0.2f" % m.values["load5"])
+        m = host.MonitorMemory("test", {"percent_free": "0"})
+        self.assertTrue(m.run_test(), m.last_result)
+        self.assertEqual(m.last_result, "{}% free".format(m.values["percent_free"]))
+        self.assertGreater(m.values["total_bytes"], 0)
+        m = host.MonitorSwap("test", {"percent_free": "0"})
+        self.assertTrue(m.run_test(), m.last_result)
+        self.assertIn("free_bytes", m.values)
+
+    @unittest.skipIf(sys.platform == "win32", "uses statvfs")
+    def test_DiskSpace_forecast(self):
+        m = host.MonitorDiskSpace(
+            "test",
+            {
+                "partition": "/",
+                "limit": "1",
+                "forecast_horizon": "7200",
+                "forecast_samples": "3",
+            },
+        )
+        # losing 1M and 10 inodes a minute
+        for (minute, ok) in [(0, True), (1, True), (2, False), (3, False)]:
+            metrics = SimpleNamespace(
+                when=minute * 60.0,
+                statvfs=lambda _: SimpleNamespace(
+                    f_bavail=(100 - minute) * 256,
+                    f_frsize=4096,
+                    f_blocks=1000 * 256,
+                    f_files=100000,
+                    f_favail=100000 - minute * 10,
+                ),
+            )
+            with patch.object(host, "host_metrics", return_value=metrics):
+                self.assertEqual(m.run_test(), ok, m.last_result)
+        self.assertEqual(
+            m.last_result,
+            "97.00MiB free (9%); full in 0+01:37:00; inodes full in 6+22:37:00",
+        )
+        self.assertEqual(m.values["seconds_to_full"], 97 * 60)
+        self.assertEqual(m.values["free_inodes"], 99970)
+
+    def test_Filestat_glob(self):
+        with tempfile.TemporaryDirectory() as root:
+            for (name, age) in [("a/daily-1.tgz", 7200), ("b/daily-2.tgz", 60)]:
+                path = os.path.join(root, name)
+                os.makedirs(os.path.dirname(path))
+                with open(path, "w") as file_handle:
+                    file_handle.write("x" * 100)
+                os.utime(path, (time.time() - age, time.time() - age))
+            m = host.MonitorFileStat(
+                "test",
+                {
+                    "mode": "glob",
+                    "filename": os.path.join(root, "*", "daily-*.tgz"),
+                    "maxage": "3600",
+                    "maxsize": "150",
+                },
+            )
+            self.assertFalse(m.run_test())
+            self.assertEqual(m.last_result, "Total size is 200, should be <= 150 bytes")
+            m.maxsize = None
+            self.assertTrue(m.run_test(), m.last_result)
+            self.assertEqual(m.values["count"], 2)
+            self.assertRegex(m.last_result, "^2 files, 200 bytes, newest 6[01] seconds")
+            m.max_oldest_age = 3600
+            self.assertFalse(m.run_test())
+            self.assertRegex(m.last_result, "^Oldest file's age is 7[12]")
+            m = host.MonitorFileStat(
+                "test", {"mode": "glob", "filename": os.path.join(root, "*.tgz")}
+            )
+            self.assertFalse(m.run_test())
+            self.assertEqual(m.last_result, "Found 0 files, should be >= 1")
+
+    def test_Filestat_directory(self):
+        with tempfile.TemporaryDirectory() as root:
+            m = host.MonitorFileStat(
+                "test", {"mode": "directory", "filename": root, "max_count": "1"}
+            )
+            self.assertTrue(m.run_test(), m.last_result)
+            self.assertEqual(m.last_result, "0 files, 0 bytes")
+            for name in ["one", "two"]:
+                with open(os.path.join(root, name), "w"):
+                    pass
+            self.assertFalse(m.run_test())
+            self.assertEqual(m.last_result, "Found 2 files, should be <= 1")
+            m = host.MonitorFileStat(
+                "test", {"mode": "directory", "filename": os.path.join(root, "x")}
+            )
+            self.assertFalse(m.run_test())
+            self.assertRegex(m.last_result, "^Directory .* does not exist")
+
 
 if __name__ == "__main__":
     unittest.main()
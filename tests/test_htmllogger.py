@@ -1,6 +1,9 @@
 # type: ignore
 import os
+import shutil
+import tempfile
 import unittest
+import unittest.mock
 
 from AntEye.Loggers.file import HTMLLogger
 from AntEye.Monitors.monitor import MonitorNull
@@ -37,6 +40,54 @@ class TestHTMLLogger(unittest.TestCase):
             "style.css was not copied",
         )
 
+    def _log(self, test_logger, monitor):
+        test_logger.start_batch()
+        test_logger.save_result2(monitor.name, monitor)
+        test_logger.end_batch()
+        with open(os.path.join("test_html", "status.html")) as fh:
+            return fh.read()
+
+    def test_resources_copied_once(self):
+        test_logger = HTMLLogger({"folder": "test_html", "filename": "status.html"})
+        monitor = MonitorNull()
+        monitor.run_test()
+        with unittest.mock.patch("shutil.copy2", wraps=shutil.copy2) as copy:
+            self._log(test_logger, monitor)
+            self._log(test_logger, monitor)
+        copy.assert_called_once()
+
+    def test_row_cache(self):
+        test_logger = HTMLLogger({"folder": "test_html", "filename": "status.html"})
+        monitor = MonitorNull("cached", {})
+        monitor.run_test()
+        self._log(test_logger, monitor)
+        cached = test_logger._row_cache["cached"]
+        self._log(test_logger, monitor)
+        self.assertIs(test_logger._row_cache["cached"], cached)
+        monitor.record_fail("oh no")
+        html = self._log(test_logger, monitor)
+        self.assertIsNot(test_logger._row_cache["cached"], cached)
+        self.assertIn('<tr class="table-danger">', html)
+        self.assertIn("<td>oh no</td>", html)
+
+    def test_template_hup(self):
+        source = tempfile.mkdtemp()
+        for filename in ["header.html", "footer.html", "style.css"]:
+            with open(os.path.join(source, filename), "w") as fh:
+                fh.write("_STATUS_ " + filename + "\n")
+        test_logger = HTMLLogger(
+            {"folder": "test_html", "filename": "status.html", "source_folder": source}
+        )
+        monitor = MonitorNull()
+        monitor.run_test()
+        self.assertTrue(self._log(test_logger, monitor).startswith("OK header.html"))
+        with open(os.path.join(source, "header.html"), "w") as fh:
+            fh.write("new _HOST_ _STATUS_\n")
+        self.assertTrue(self._log(test_logger, monitor).startswith("OK header.html"))
+        test_logger.hup()
+        self.assertTrue(self._log(test_logger, monitor).startswith("new "))
+        shutil.rmtree(source)
+
     def tearDown(self):
         if os.path.isdir(self._test_path):
             for filename in os.listdir(self._test_path):
@@ -1,16 +1,19 @@
 # type: ignore
+import gzip
+import json
 import os.path
+import shutil
 import socket
 import tempfile
 import time
 import unittest
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 from freezegun import freeze_time
 
-from AntEye.Loggers import logger
-from AntEye.Loggers.file import FileLogger, HTMLLogger
+from AntEye.Loggers import logger, mqtt
+from AntEye.Loggers.file import FileLogger, HTMLLogger, JsonLogger
 from AntEye.Monitors.monitor import MonitorFail, MonitorNull
 from AntEye.AntEye import AntEye
 from AntEye.version import VERSION
@@ -67,6 +70,45 @@ class TestLogger(unittest.TestCase):
             s.log_result(this_logger)
         mock_method.assert_called_once()
 
+    def test_changes_mode(self):
+        with patch.object(logger.Logger, "save_result2") as mock_method:
+            this_logger = logger.Logger({"mode": "changes", "changes_refresh": "0"})
+            s = AntEye(Path("tests/monitor-empty.ini"))
+            monitor = MonitorNull()
+            s.add_monitor("test", monitor)
+            monitor.run_test()
+            s.log_result(this_logger)
+            self.assertEqual(mock_method.call_count, 1)
+            monitor.run_test()
+            s.log_result(this_logger)
+            self.assertEqual(mock_method.call_count, 1)
+            monitor.record_fail("broken")
+            s.log_result(this_logger)
+            self.assertEqual(mock_method.call_count, 2)
+            monitor.record_fail("still broken")
+            s.log_result(this_logger)
+            self.assertEqual(mock_method.call_count, 2)
+
+    def test_changes_refresh(self):
+        with patch.object(logger.Logger, "save_result2") as mock_method:
+            this_logger = logger.Logger({"mode": "changes", "changes_refresh": "60"})
+            s = AntEye(Path("tests/monitor-empty.ini"))
+            monitor = MonitorNull()
+            s.add_monitor("test", monitor)
+            monitor.run_test()
+            with freeze_time("2020-04-18 12:00:00"):
+                s.log_result(this_logger)
+            with freeze_time("2020-04-18 12:00:30"):
+                s.log_result(this_logger)
+            self.assertEqual(mock_method.call_count, 1)
+            with freeze_time("2020-04-18 12:01:00"):
+                s.log_result(this_logger)
+            self.assertEqual(mock_method.call_count, 2)
+
+    def test_changes_unsupported(self):
+        with self.assertRaises(logger.LoggerConfigurationError):
+            HTMLLogger({"filename": "x.html", "mode": "changes"})
+
 
 class TestFileLogger(unittest.TestCase):
     @freeze_time("2020-04-18 12:00+00:00")
@@ -189,6 +231,71 @@ class TestFileLogger(unittest.TestCase):
             # Windows won't remove a file which is in use
             pass
 
+    def test_file_batch(self):
+        temp_logfile = tempfile.mkstemp()[1]
+        file_logger = FileLogger({"filename": temp_logfile, "buffered": False})
+        monitor1 = MonitorNull("null", {})
+        monitor2 = MonitorFail("fail", {})
+        monitor1.run_test()
+        monitor2.run_test()
+        with patch.object(
+            file_logger.file_handle, "write", wraps=file_logger.file_handle.write
+        ) as write:
+            with freeze_time("2020-04-18 12:00:00+00:00"):
+                file_logger.start_batch()
+            file_logger.save_result2("null", monitor1)
+            file_logger.save_result2("fail", monitor2)
+            file_logger.end_batch()
+        write.assert_called_once()
+        with open(temp_logfile, "r") as fh:
+            lines = fh.readlines()
+        self.assertEqual(lines[1], "1587211200 null: ok (0.000s)\n")
+        self.assertTrue(lines[2].startswith("1587211200 fail: failed since"))
+        os.unlink(temp_logfile)
+
+    def test_file_rotate(self):
+        folder = tempfile.mkdtemp()
+        temp_logfile = os.path.join(folder, "monitor.log")
+        file_logger = FileLogger(
+            {
+                "filename": temp_logfile,
+                "rotate_size": "100",
+                "rotate_keep": "2",
+                "rotate_compress": "1",
+            }
+        )
+        monitor = MonitorNull("null", {})
+        monitor.run_test()
+        for second in range(5):
+            with freeze_time("2020-04-18 12:00:0{}+00:00".format(second)):
+                file_logger.start_batch()
+                for _ in range(5):
+                    file_logger.save_result2("null", monitor)
+                file_logger.end_batch()
+        file_logger._rotator.queue.join()
+        self.assertEqual(
+            sorted(os.listdir(folder)),
+            [
+                "monitor.log",
+                "monitor.log.20200418-120003.gz",
+                "monitor.log.20200418-120004.gz",
+            ],
+        )
+        with gzip.open(
+            os.path.join(folder, "monitor.log.20200418-120004.gz"), "rt"
+        ) as fh:
+            self.assertEqual(fh.readline(), "1587211204 null: ok (0.000s)\n")
+        # a config reload replaces the rotator thread rather than adding one
+        rotator = file_logger._rotator
+        file_logger.__init__(
+            {"filename": temp_logfile, "rotate_size": "100", "_name": "logfile"}
+        )
+        self.assertFalse(rotator.is_alive())
+        self.assertTrue(file_logger._rotator.is_alive())
+        file_logger._stop_rotator()
+        file_logger.file_handle.close()
+        shutil.rmtree(folder)
+
 
 class TestHTMLLogger(unittest.TestCase):
     @staticmethod
@@ -229,3 +336,174 @@ class TestHTMLLogger(unittest.TestCase):
         test_file = self._write_html({"tz": "Europe/Warsaw"})
         golden_file = "tests/html/test2.html"
         self._compare_files(test_file, golden_file)
+
+
+class TestJsonLogger(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.filename = os.path.join(self.folder, "status.json")
+
+    def tearDown(self):
+        for filename in os.listdir(self.folder):
+            os.unlink(os.path.join(self.folder, filename))
+        os.rmdir(self.folder)
+
+    def _log(self, json_logger, *monitors):
+        json_logger.start_batch()
+        for monitor in monitors:
+            json_logger.save_result2(monitor.name, monitor)
+        json_logger.end_batch()
+
+    @freeze_time("2020-04-18 12:00:00+00:00")
+    def test_json(self):
+        json_logger = JsonLogger({"filename": self.filename})
+        monitor1 = MonitorNull("null", {})
+        monitor2 = MonitorFail("fail", {"depend": "null"})
+        monitor1.run_test()
+        monitor2.run_test()
+        self._log(json_logger, monitor1, monitor2)
+        self.assertEqual(os.listdir(self.folder), ["status.json"])
+        with open(self.filename) as fh:
+            text = fh.read()
+        self.assertIn('\n    "generated":"2020-04-18 12:00:00+00:00"', text)
+        self.assertEqual(
+            json.loads(text)["monitors"],
+            {
+                "null": {
+                    "virtual_fail_count": 0,
+                    "result": "",
+                    "first_failure_time": "",
+                    "last_run_duration": 0,
+                    "status": "OK",
+                    "dependencies": [],
+                },
+                "fail": {
+                    "virtual_fail_count": 1,
+                    "result": "This monitor always fails.",
+                    "first_failure_time": "2020-04-18 12:00:00+00:00",
+                    "last_run_duration": 0,
+                    "status": "Fail",
+                    "dependencies": ["null"],
+                },
+            },
+        )
+
+    def test_compact(self):
+        json_logger = JsonLogger({"filename": self.filename, "compact": "1"})
+        monitor = MonitorNull("null", {})
+        monitor.run_test()
+        self._log(json_logger, monitor)
+        with open(self.filename) as fh:
+            text = fh.read()
+        self.assertNotIn("\n", text)
+        self.assertEqual(json.loads(text)["monitors"]["null"]["status"], "OK")
+
+    def test_history_rotation(self):
+        history = os.path.join(self.folder, "history.ndjson")
+        json_logger = JsonLogger(
+            {
+                "filename": self.filename,
+                "history_file": history,
+                "history_max_size": "100",
+                "history_keep": "2",
+            }
+        )
+        monitor = MonitorNull("null", {})
+        monitor.run_test()
+        for _ in range(5):
+            self._log(json_logger, monitor)
+        self.assertEqual(
+            sorted(os.listdir(self.folder)),
+            ["history.ndjson", "history.ndjson.1", "history.ndjson.2", "status.json"],
+        )
+        with open(history + ".1") as fh:
+            for line in fh:
+                self.assertEqual(json.loads(line)["name"], "null")
+
+
+class TestMQTTLogger(unittest.TestCase):
+    def _make_logger(self, options: dict = None):
+        if options is None:
+            options = {}
+        options.update({"host": "localhost", "_name": "mqtt"})
+        client = MagicMock()
+        client.publish.return_value.rc = 0
+        with patch.object(mqtt, "_make_client", return_value=client) as make_client:
+            mqtt_logger = mqtt.MQTTLogger(options)
+        make_client.assert_called_once_with("AntEye_mqtt")
+        client.connect_async.assert_called_once_with("localhost", 1883, 60)
+        client.loop_start.assert_called_once()
+        return mqtt_logger, client
+
+    def _log(self, mqtt_logger, *monitors):
+        mqtt_logger.start_batch()
+        for monitor in monitors:
+            mqtt_logger.save_result2(monitor.name, monitor)
+        mqtt_logger.end_batch()
+
+    def test_publish_only_changes(self):
+        mqtt_logger, client = self._make_logger()
+        monitor1 = MonitorNull("null", {})
+        monitor2 = MonitorFail("fail", {})
+        monitor1.run_test()
+        monitor2.run_test()
+        self._log(mqtt_logger, monitor1, monitor2)
+        client.publish.assert_any_call("AntEye/null", payload="ON", retain=True)
+        client.publish.assert_any_call("AntEye/fail", payload="OFF", retain=True)
+        self.assertEqual(client.publish.call_count, 2)
+
+        client.publish.reset_mock()
+        self._log(mqtt_logger, monitor1, monitor2)
+        client.publish.assert_not_called()
+
+        monitor2.record_success()
+        self._log(mqtt_logger, monitor1, monitor2)
+        client.publish.assert_called_once_with(
+            "AntEye/fail", payload="ON", retain=True
+        )
+
+    def test_failed_publish_is_retried(self):
+        mqtt_logger, client = self._make_logger()
+        monitor = MonitorNull("null", {})
+        monitor.run_test()
+        client.publish.return_value.rc = 4
+        self._log(mqtt_logger, monitor)
+        client.publish.return_value.rc = 0
+        client.publish.reset_mock()
+        self._log(mqtt_logger, monitor)
+        client.publish.assert_called_once_with("AntEye/null", payload="ON", retain=True)
+
+    def test_republish_on_reconnect(self):
+        mqtt_logger, client = self._make_logger({"hass": "1"})
+        monitor = MonitorNull("null", {})
+        monitor.run_test()
+        self._log(mqtt_logger, monitor)
+        self.assertEqual(client.publish.call_count, 2)
+        client.publish.reset_mock()
+        # paho reconnects by itself, e.g. after the broker restarts
+        client.on_connect(client, None, {}, 0)
+        self._log(mqtt_logger, monitor)
+        self.assertEqual(client.publish.call_count, 2)
+        client.publish.assert_called_with(
+            "homeassistant/binary_sensor/AntEye_null/state", payload="ON", retain=True
+        )
+
+    def test_hass_registration(self):
+        mqtt_logger, client = self._make_logger({"hass": "1"})
+        monitor = MonitorNull("null", {})
+        monitor.run_test()
+        self._log(mqtt_logger, monitor)
+        self._log(mqtt_logger, monitor)
+        self.assertEqual(
+            client.publish.call_args_list,
+            [
+                (
+                    ("homeassistant/binary_sensor/AntEye_null/config",),
+                    {"payload": '{"name": "null"}', "retain": True},
+                ),
+                (
+                    ("homeassistant/binary_sensor/AntEye_null/state",),
+                    {"payload": "ON", "retain": True},
+                ),
+            ],
+        )
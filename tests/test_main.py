@@ -2,6 +2,7 @@
 import configparser
 import os
 import os.path
+import pickle
 import sys
 import tempfile
 import time
@@ -11,7 +12,11 @@ from unittest.mock import patch
 
 from AntEye import Alerters, monitor, AntEye
 from AntEye.Loggers import network
+from AntEye.Monitors.host import MonitorDiskSpace, MonitorFileStat
 from AntEye.Monitors.monitor import MonitorNull
+from AntEye.Monitors.service import MonitorProcess
+from AntEye.util.json_encoding import json_dumps, json_loads
+from AntEye.util.metrics import REGISTRY
 
 
 class TestMonitor(unittest.TestCase):
@@ -58,6 +63,231 @@ class TestPidFile(unittest.TestCase):
         self.assertFalse(os.path.exists(s.pidfile))
 
 
+class TestStateFile(unittest.TestCase):
+    def _write_config(self, directory, monitor_type):
+        with open(os.path.join(directory, "monitors.ini"), "w") as f:
+            f.write("[test]\ntype={}\n".format(monitor_type))
+        config = os.path.join(directory, "monitor.ini")
+        with open(config, "w") as f:
+            f.write(
+                "[monitor]\ninterval=60\nmonitors={0}/monitors.ini\n"
+                "state_file={0}/state.json\n".format(directory)
+            )
+        return config
+
+    def test_restore(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = self._write_config(directory, "fail")
+            s = AntEye.AntEye(config)
+            s.run_tests()
+            s.run_tests()
+            s._save_state()
+            self.assertEqual(s.monitors["test"].error_count, 2)
+
+            s = AntEye.AntEye(config)
+            monitor = s.monitors["test"]
+            self.assertEqual(monitor.error_count, 2)
+            self.assertEqual(monitor.tests_run, 2)
+            self.assertIsNotNone(monitor.first_failure_time())
+
+            # the counters are saved at a checkpoint, e.g. on shutdown
+            s.run_tests()
+            s._save_state()
+            s._save_state(checkpoint=True)
+            self.assertEqual(AntEye.AntEye(config).monitors["test"].tests_run, 3)
+
+            # a monitor which changed type starts afresh
+            config = self._write_config(directory, "null")
+            s = AntEye.AntEye(config)
+            self.assertEqual(s.monitors["test"].error_count, 0)
+
+    def test_restore_alerter(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = self._write_config(directory, "fail")
+            with open(config, "a") as f:
+                f.write(
+                    "[reporting]\nalerters=later\n"
+                    "[later]\ntype=execute\nfail_command=true\ndelay=1\n"
+                )
+            s = AntEye.AntEye(config)
+            s.alerters["later"]._ooh_failures.append("test")
+            s._save_state()
+            s = AntEye.AntEye(config)
+            self.assertEqual(s.alerters["later"]._ooh_failures, ["test"])
+
+    def test_one_shot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = self._write_config(directory, "fail")
+            s = AntEye.AntEye(config, one_shot=True)
+            s.run_tests()
+            s._save_state()
+            self.assertFalse(os.path.exists(os.path.join(directory, "state.json")))
+
+
+class TestReload(unittest.TestCase):
+    def _write_monitors(self, directory, monitors):
+        with open(os.path.join(directory, "monitors.ini"), "w") as f:
+            f.write(monitors)
+
+    def test_reload(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = os.path.join(directory, "monitor.ini")
+            with open(config, "w") as f:
+                f.write(
+                    "[monitor]\ninterval=60\nmonitors={}/monitors.ini\n".format(
+                        directory
+                    )
+                )
+            self._write_monitors(
+                directory,
+                "[one]\ntype=null\n[two]\ntype=null\n"
+                "[three]\ntype=null\ndepend=two\n",
+            )
+            s = AntEye.AntEye(config)
+            s.run_tests()
+            one = s.monitors["one"]
+            self.assertEqual(one.tests_run, 1)
+            self.assertFalse(one._force_run)
+
+            self._write_monitors(
+                directory,
+                "[one]\ntype=null\n[two]\ntype=null\ngap=300\n"
+                "[three]\ntype=null\ndepend=two\n",
+            )
+            with patch.object(s, "update_monitor_config") as update:
+                s._load_config()
+            update.assert_called_once()
+            self.assertEqual(update.call_args[0][0], "two")
+            # unchanged monitors keep their state and schedule
+            self.assertIs(s.monitors["one"], one)
+            self.assertEqual(one.tests_run, 1)
+            self.assertFalse(one._force_run)
+
+            self._write_monitors(directory, "[one]\ntype=null\n[two]\ntype=null\n")
+            s._load_config()
+            self.assertNotIn("three", s.monitors)
+
+            self._write_monitors(directory, "[one]\ntype=null\ndepend=two\n")
+            with self.assertRaises(SystemExit):
+                s._load_config()
+
+
+class TestInclude(unittest.TestCase):
+    def test_include(self):
+        with tempfile.TemporaryDirectory() as directory:
+            os.mkdir(os.path.join(directory, "monitors.d"))
+            with open(os.path.join(directory, "monitors.ini"), "w") as f:
+                f.write("[one]\ntype=null\n")
+            with open(os.path.join(directory, "monitors.d", "two.ini"), "w") as f:
+                f.write("[two]\ntype=null\ndepend=one\n")
+            config = os.path.join(directory, "monitor.ini")
+            with open(config, "w") as f:
+                f.write(
+                    "[monitor]\ninterval=60\nmonitors={0}/monitors.ini\n"
+                    "include={0}/monitors.d/*.ini\n".format(directory)
+                )
+            s = AntEye.AntEye(config)
+            self.assertEqual(sorted(s.monitors), ["one", "two"])
+
+
+class TestInstrumentation(unittest.TestCase):
+    def tearDown(self):
+        REGISTRY.enabled = False
+        REGISTRY.clear()
+
+    def _write_config(self, directory, reporting):
+        with open(os.path.join(directory, "monitors.ini"), "w") as f:
+            f.write("[one]\ntype=null\n[two]\ntype=fail\n")
+        config = os.path.join(directory, "monitor.ini")
+        with open(config, "w") as f:
+            f.write(
+                "[monitor]\ninterval=60\nmonitors={}/monitors.ini\n"
+                "[prometheus]\ntype=prometheus\nport=0\n"
+                "[say]\ntype=execute\nfail_command=true\n{}".format(
+                    directory, reporting
+                )
+            )
+        return config
+
+    def test_enabled_by_logger(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = self._write_config(directory, "[reporting]\nalerters=say\n")
+            s = AntEye.AntEye(config)
+            self.assertFalse(REGISTRY.enabled)
+            s.run_loop()
+            self.assertEqual(REGISTRY.render(), [])
+
+            config = self._write_config(
+                directory, "[reporting]\nalerters=say\nloggers=prometheus\n"
+            )
+            s = AntEye.AntEye(config)
+            self.addCleanup(s.loggers["prometheus"]._stop_server)
+            self.assertTrue(REGISTRY.enabled)
+            s.run_loop()
+            self.assertIsInstance(s.monitors["one"].last_run_duration, float)
+            metrics = "\n".join(REGISTRY.render())
+            for line in [
+                'anteye_loop_phase_seconds_count{phase="run_tests"} 1',
+                'anteye_monitor_run_seconds_count{monitor="one",type="null"} 1',
+                'anteye_logger_batch_seconds_count{logger="prometheus",type="prometheus"} 1',
+                'anteye_alerter_send_seconds_count{alerter="say",type="execute"} 1',
+                'anteye_alerts_total{alert_type="failure",alerter="say",type="execute"} 1',
+                "anteye_loop_seconds_count 1",
+            ]:
+                self.assertIn(line, metrics)
+            self.assertNotIn("anteye_loop_overruns_total", metrics)
+            s.interval = 0
+            s.run_loop()
+            self.assertIn("anteye_loop_overruns_total 1", REGISTRY.render())
+
+
+class TestProfile(unittest.TestCase):
+    def test_toggle(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "monitors.ini"), "w") as f:
+                f.write("[one]\ntype=null\n")
+            config = os.path.join(directory, "monitor.ini")
+            with open(config, "w") as f:
+                f.write(
+                    "[monitor]\ninterval=60\nmonitors={0}/monitors.ini\n"
+                    "profile_dir={0}/profile\n".format(directory)
+                )
+            s = AntEye.AntEye(config)
+            s.run_loop()
+            self.assertFalse(os.path.exists(os.path.join(directory, "profile")))
+            s._handle_sigusr1()
+            s.run_loop()
+            (report,) = [
+                x
+                for x in os.listdir(os.path.join(directory, "profile"))
+                if x.endswith(".txt")
+            ]
+            with open(os.path.join(directory, "profile", report)) as f:
+                self.assertIn("slowest monitors:\n", f.read())
+            s._handle_sigusr1()
+            s.run_loop()
+            self.assertEqual(len(os.listdir(os.path.join(directory, "profile"))), 2)
+
+    def test_default_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = os.path.join(directory, "monitor.ini")
+            with open(config, "w") as f:
+                f.write(
+                    "[monitor]\ninterval=60\nmonitors=tests/monitors-empty.ini\n"
+                    "state_file={}/state.json\n".format(directory)
+                )
+            s = AntEye.AntEye(config)
+            self.assertEqual(s._profiler.directory, Path(directory) / "anteye-profile")
+
+    def test_bad_mode(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = os.path.join(directory, "monitor.ini")
+            with open(config, "w") as f:
+                f.write("[monitor]\ninterval=60\nprofile_mode=guess\n")
+            with self.assertRaises(RuntimeError):
+                AntEye.AntEye(config)
+
+
 class TestSanity(unittest.TestCase):
     def test_config_has_alerting(self):
         m = AntEye.AntEye("tests/monitor-empty.ini")
@@ -102,6 +332,28 @@ class TestNetworkMonitors(unittest.TestCase):
         self.assertIn("test1", s.remote_monitors["remote.host"])
         self.assertNotIn("test2", s.remote_monitors["remote.host"])
 
+    def test_local_state(self):
+        # monitors holding state only meaningful locally must still serialize
+        s = AntEye.AntEye("tests/monitor-empty.ini")
+        monitors = [
+            MonitorProcess("p", {"process_name": "init", "max_cpu_percent": "50"}),
+            MonitorDiskSpace("d", {"partition": "/", "limit": "1"}),
+            MonitorFileStat("f", {"filename": "tests", "mode": "directory"}),
+        ]
+        data = {}
+        for m in monitors:
+            m.run_test()
+            data[m.name] = {
+                "cls_type": m.monitor_type,
+                "data": json_loads(json_dumps(m.to_python_dict())),
+            }
+        s.update_remote_monitor(data, "remote.host")
+        for m in monitors:
+            remote = s.remote_monitors["remote.host"][m.name]
+            self.assertEqual(remote.describe(), m.describe())
+            pickle.dumps(m)
+
+
 class TestSiteMonitors(unittest.TestCase):
     def test_simple(self):
         sites = ["opsandbox.mybank.cn", "graphmonitor.mybank.cn","fintechmgr.mybank.cn","loghubs.mybank.cn","family.mybank.cn","groups.mybank.cn","zabbix.mybank.cn","jenkins.mybank.cn","cli.mybank.cn","firewall.mybank.cn"]
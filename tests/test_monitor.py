@@ -2,16 +2,31 @@
 import datetime
 import os
 import platform
+import shutil
+import sys
+import tempfile
 import time
 import unittest
 from pathlib import Path
+from unittest.mock import patch
 
 import arrow
 
 from AntEye.Monitors.compound import CompoundMonitor
+from AntEye.Monitors.file import MonitorLogTail, _WindowCounter
 from AntEye.Monitors.monitor import Monitor, MonitorFail, MonitorNull
+from AntEye.Monitors.service import (
+    MonitorProcess,
+    MonitorRC,
+    MonitorSystemdUnit,
+    MonitorUnixService,
+)
+from AntEye.util.processes import ProcessInfo, ProcessTable
+from AntEye.util.serviceprobe import StatusResult
+from AntEye.util.systemd import UnitInfo, UnitSnapshot
 from AntEye.AntEye import AntEye
 from AntEye.util import MonitorState, UpDownTime
+from AntEye.util.json_encoding import json_dumps, json_loads
 
 
 class TestMonitor(unittest.TestCase):
@@ -386,3 +401,368 @@ class TestMonitor(unittest.TestCase):
             m.run_test()
         m.run_recovered()
         os.stat("did_recovered")
+
+    @unittest.skipUnless(sys.platform == "linux", "needs /proc")
+    def test_process(self):
+        python = os.path.basename(os.path.realpath(sys.executable))
+        for reader in ["psutil", "proc"]:
+            m = MonitorProcess(
+                "process", {"process_name": python, "max_count": 1000, "reader": reader}
+            )
+            m.run_test()
+            self.assertTrue(m.test_success(), "{}: {}".format(reader, m.last_result))
+            m = MonitorProcess(
+                "process",
+                {"process_name": "no-such-process-anteye", "reader": reader},
+            )
+            m.run_test()
+            self.assertFalse(m.test_success(), reader)
+            self.assertEqual(m.last_result, "0 matching processes running")
+
+    def test_process_bad_reader(self):
+        with self.assertRaises(ValueError):
+            MonitorProcess("process", {"process_name": "x", "reader": "ps"})
+
+    def test_process_usage(self):
+        m = MonitorProcess(
+            "process",
+            {
+                "process_name": "worker",
+                "max_rss": "1G",
+                "max_cpu_percent": "50",
+                "max_fds": "100",
+                "max_threads": "10",
+                "aggregate": "sum",
+            },
+        )
+
+        class Snapshot:
+            def table(self):
+                return table
+
+        m._snapshot = Snapshot()
+        table = ProcessTable(
+            [
+                ProcessInfo(
+                    1,
+                    "worker",
+                    rss=300 * self.one_MB,
+                    cpu_time=10.0,
+                    num_fds=20,
+                    num_threads=2,
+                    create_time=900.0,
+                ),
+                ProcessInfo(
+                    2,
+                    "worker",
+                    rss=300 * self.one_MB,
+                    cpu_time=0.0,
+                    num_fds=30,
+                    num_threads=2,
+                    create_time=950.0,
+                ),
+            ],
+            when=1000.0,
+        )
+        m.run_test()
+        self.assertTrue(m.test_success(), m.last_result)
+        self.assertEqual(
+            m.last_result,
+            "2 matching processes running; rss 600.00MiB, cpu 10.0%, fds 50, threads 4",
+        )
+        # 30s of CPU in 60s for one, 5s for the other, since the last run
+        table = ProcessTable(
+            [
+                ProcessInfo(
+                    1,
+                    "worker",
+                    rss=800 * self.one_MB,
+                    cpu_time=40.0,
+                    num_fds=20,
+                    num_threads=2,
+                    create_time=900.0,
+                ),
+                ProcessInfo(
+                    2,
+                    "worker",
+                    rss=300 * self.one_MB,
+                    cpu_time=5.0,
+                    num_fds=30,
+                    num_threads=2,
+                    create_time=950.0,
+                ),
+            ],
+            when=1060.0,
+        )
+        m.run_test()
+        self.assertFalse(m.test_success())
+        self.assertEqual(
+            m.last_result,
+            "2 matching processes running; rss 1.07GiB > 1024.00MiB, cpu 58.3% > 50.0%",
+        )
+        m.aggregate = "max"
+        table.when = 1120.0
+        m.run_test()
+        self.assertTrue(m.test_success(), m.last_result)
+        self.assertIn("rss 800.00MiB, cpu 0.0%, fds 30, threads 2", m.last_result)
+
+    def test_process_cpu_window(self):
+        m = MonitorProcess(
+            "process",
+            {"process_name": "worker", "max_cpu_percent": "50", "cpu_window": "120"},
+        )
+        m._cpu_percents(0.0, [ProcessInfo(1, "worker", cpu_time=0.0, create_time=0.0)])
+        m._cpu_percents(
+            60.0, [ProcessInfo(1, "worker", cpu_time=60.0, create_time=0.0)]
+        )
+        # no sample is 120s old yet, so measure from the oldest
+        self.assertEqual(
+            m._cpu_percents(
+                90.0, [ProcessInfo(1, "worker", cpu_time=60.0, create_time=0.0)]
+            ),
+            [60.0 * 100 / 90],
+        )
+        # now measure from the one taken at 60s
+        self.assertEqual(
+            m._cpu_percents(
+                180.0, [ProcessInfo(1, "worker", cpu_time=66.0, create_time=0.0)]
+            ),
+            [5.0],
+        )
+
+    def test_process_age(self):
+        m = MonitorProcess(
+            "process", {"process_name": "worker", "min_age": "60", "max_age": "3600"}
+        )
+        self.assertEqual(
+            m._check_usage(
+                1000.0,
+                [
+                    ProcessInfo(1, "worker", create_time=0.0),
+                    ProcessInfo(2, "worker", create_time=970.0),
+                ],
+            ),
+            (["oldest 1000s", "youngest 30s"], ["youngest 30s < 60s"]),
+        )
+
+    @patch("AntEye.Monitors.service.pydbus", True)
+    def test_systemd_unit(self):
+        snapshot = UnitSnapshot(
+            lambda: [
+                UnitInfo("ssh.service", "loaded", "active", "running", "/u/ssh"),
+                UnitInfo("getty@tty1.service", "loaded", "active", "running", "/1"),
+                UnitInfo("getty@tty2.service", "loaded", "failed", "failed", "/2"),
+            ]
+        )
+        results = {}
+        for name in ["ssh.service", "getty@*.service", "getty@tty1.*", "nope*"]:
+            m = MonitorSystemdUnit("unit", {"name": name})
+            m._snapshot = snapshot
+            m.run_test()
+            results[name] = (m.test_success(), m.last_result)
+        self.assertEqual(
+            results,
+            {
+                "ssh.service": (True, "Unit ssh.service is active (running)"),
+                "getty@*.service": (
+                    False,
+                    "1 of 2 units matching getty@*.service failed: Unit "
+                    "getty@tty2.service has active state: failed (wanted "
+                    "['active', 'reloading'])",
+                ),
+                "getty@tty1.*": (True, "Unit getty@tty1.service is active (running)"),
+                "nope*": (False, "No unit nope*"),
+            },
+        )
+        m = MonitorSystemdUnit(
+            "unit", {"name": "getty@*", "active_states": "active,failed"}
+        )
+        m._snapshot = snapshot
+        m.run_test()
+        self.assertEqual(m.last_result, "All 2 units matching getty@* are ok")
+
+    @unittest.skipIf(platform.system() == "Windows", "needs a shell")
+    def test_rc(self):
+        directory = tempfile.mkdtemp()
+        try:
+            for (service, code) in [("good", 0), ("bad", 1)]:
+                path = os.path.join(directory, service)
+                with open(path, "w") as script:
+                    script.write("#!/bin/sh\nexit %d\n" % code)
+                os.chmod(path, 0o755)
+            good = MonitorRC("rc", {"service": "good", "path": directory + "/"})
+            bad = MonitorRC("rc", {"service": "bad", "path": directory + "/"})
+            good.run_test()
+            bad.run_test()
+            self.assertTrue(good.test_success(), good.last_result)
+            self.assertFalse(bad.test_success())
+            self.assertEqual(bad.last_result, "Return code: 1 (wanted 0)")
+        finally:
+            shutil.rmtree(directory)
+
+    def test_unix_service_systemd(self):
+        states = {"ssh": 0, "nginx": 3}
+        with patch("AntEye.Monitors.service.systemd_status", side_effect=states.get):
+            for (service, state, success) in [
+                ("ssh", "running", True),
+                ("nginx", "running", False),
+                ("ssh", "stopped", False),
+            ]:
+                m = MonitorUnixService(
+                    "service", {"service": service, "state": state, "systemd": "yes"}
+                )
+                m.run_test()
+                self.assertEqual(m.test_success(), success, m.last_result)
+                self.assertFalse(m.wants_status())
+            # a name systemd doesn't list falls back to "service X status"
+            m = MonitorUnixService("service", {"service": "sshd", "systemd": "yes"})
+            with patch(
+                "AntEye.Monitors.service.STATUS_PROBE.result",
+                return_value=StatusResult(0),
+            ):
+                m.run_test()
+            self.assertTrue(m.test_success(), m.last_result)
+            self.assertTrue(m.wants_status())
+
+
+class TestLogTail(unittest.TestCase):
+    config = {
+        "patterns": "error, timeout",
+        "error_regex": "ERROR",
+        "error_max": "2",
+        "timeout_regex": "timed out after ([0-9]+)s",
+        "timeout_max": "0",
+    }
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "app.log")
+        self.write("ERROR before we started\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, text, mode="a", path=None):
+        with open(path or self.path, mode) as file_handle:
+            file_handle.write(text)
+
+    def monitor(self, **options):
+        config = dict(self.config, path=self.path)
+        config.update(options)
+        return MonitorLogTail("logtail", config)
+
+    def test_counts(self):
+        m = self.monitor()
+        m.run_test()
+        self.assertTrue(m.test_success(), m.last_result)
+        self.assertEqual(m.values, {"error": 0, "timeout": 0})
+        self.write("INFO fine\nERROR one\nERROR two\n")
+        m.run_test()
+        self.assertTrue(m.test_success(), m.last_result)
+        self.assertEqual(m.last_result, "error: 2, timeout: 0 in the last 60s")
+        self.write("ERROR: request timed out after 30s\n")
+        m.run_test()
+        self.assertFalse(m.test_success())
+        self.assertEqual(m.last_result, "error: 3 > 2, timeout: 1 > 0 in the last 60s")
+
+    def test_uncombined(self):
+        # a backreference stops the patterns being combined
+        m = self.monitor(error_regex=r"(E)RROR \1")
+        self.assertIsNone(m._combined)
+        m.run_test()
+        self.write("ERROR E\nERROR F\ntimed out after 5s\n")
+        m.run_test()
+        self.assertEqual(m.values, {"error": 1, "timeout": 1})
+
+    def test_single_pattern(self):
+        m = self.monitor(patterns="error", error_regex="^ERROR")
+        self.assertIsNotNone(m._combined)
+        m.run_test()
+        self.write("ERROR one\nINFO no ERROR\nERROR two\n")
+        m.run_test()
+        self.assertEqual(m.values, {"error": 2})
+
+    def test_from_start(self):
+        m = self.monitor(from_start="yes")
+        m.run_test()
+        self.assertEqual(m.values["error"], 1)
+        # but not a backlog written before the window
+        os.utime(self.path, (time.time() - 120, time.time() - 120))
+        m = self.monitor(from_start="yes")
+        m.run_test()
+        self.assertEqual(m.values["error"], 0)
+        self.write("ERROR after\n")
+        m.run_test()
+        self.assertEqual(m.values["error"], 1)
+
+    def test_partial_line(self):
+        m = self.monitor()
+        m.run_test()
+        self.write("ERR")
+        m.run_test()
+        self.assertEqual(m.values["error"], 0)
+        self.write("OR\n")
+        m.run_test()
+        self.assertEqual(m.values["error"], 1)
+
+    def test_rotation(self):
+        m = self.monitor()
+        m.run_test()
+        self.write("ERROR last in the old file\n")
+        os.rename(self.path, self.path + ".1")
+        m.run_test()
+        self.assertEqual(m.values["error"], 1)
+        self.assertTrue(m.test_success(), m.last_result)
+        self.write("ERROR first in the new file\n")
+        m.run_test()
+        self.assertEqual(m.values["error"], 2)
+
+    def test_truncation(self):
+        m = self.monitor()
+        m.run_test()
+        self.write("ERROR after truncation\n", mode="w")
+        m.run_test()
+        self.assertEqual(m.values["error"], 1)
+
+    def test_missing(self):
+        m = self.monitor(path=os.path.join(self.directory, "missing.log"))
+        m.run_test()
+        self.assertFalse(m.test_success())
+
+    def test_restart(self):
+        m = self.monitor()
+        m.run_test()
+        self.write("ERROR while running\n")
+        m.run_test()
+        state = json_loads(json_dumps(m.get_state()))
+        self.write("ERROR while stopped\n")
+        m = self.monitor()
+        m.restore_state(state)
+        m.run_test()
+        self.assertEqual(m.values["error"], 1)
+        # and if the file was rotated meanwhile, read the new one from its start
+        os.rename(self.path, self.path + ".1")
+        self.write("ERROR one\nERROR two\n")
+        m = self.monitor()
+        m.restore_state(state)
+        m.run_test()
+        self.assertEqual(m.values["error"], 2)
+        # nor, after a restart, what was written before the window
+        m = self.monitor()
+        m.restore_state(state)
+        os.utime(self.path, (time.time() - 120, time.time() - 120))
+        m.run_test()
+        self.assertEqual(m.values["error"], 0)
+
+    def test_bad_regex(self):
+        with self.assertRaises(ValueError):
+            self.monitor(error_regex="(")
+
+    def test_window(self):
+        counter = _WindowCounter(60)
+        counter.add(1000.0, 3)
+        counter.add(1030.0)
+        self.assertEqual(counter.total(1030.0), 4)
+        self.assertEqual(counter.total(1059.0), 4)
+        self.assertEqual(counter.total(1061.0), 1)
+        self.assertEqual(counter.total(1100.0), 0)
@@ -0,0 +1,103 @@
+# type: ignore
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from AntEye.util import envconfig, monitorconfig
+
+
+class TestLoadMonitorSections(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+        (self.path / "monitors.d").mkdir()
+        self._write("monitors.ini", "[defaults]\ngap=60\n\n[main]\ntype=null\n")
+        self._write(
+            "monitors.d/web.ini",
+            "[defaults]\ntolerance=2\n\n"
+            "[http-{item}]\ntype=http\nurl=https://{item}/\ntemplate_file=hosts.txt\n",
+        )
+        self._write("monitors.d/hosts.txt", "# web servers\nweb1\n\nweb2\n")
+        self._write("monitors.d/other.ini", "[other]\ntype=null\ngap=0\n")
+        envconfig._compiled.clear()
+        monitorconfig._expanded.clear()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _write(self, name, data):
+        with open(self.path / name, "w") as f:
+            f.write(data)
+
+    def _load(self):
+        return monitorconfig.load_monitor_sections(
+            self.path / "monitors.ini", [str(self.path / "monitors.d" / "*.ini")]
+        )
+
+    def test_load(self):
+        self.assertEqual(
+            self._load(),
+            {
+                "main": {"type": "null", "gap": "60"},
+                "other": {"type": "null", "gap": "0"},
+                "http-web1": {
+                    "type": "http",
+                    "url": "https://web1/",
+                    "gap": "60",
+                    "tolerance": "2",
+                },
+                "http-web2": {
+                    "type": "http",
+                    "url": "https://web2/",
+                    "gap": "60",
+                    "tolerance": "2",
+                },
+            },
+        )
+
+    def test_relative_include(self):
+        # relative to the main file, wherever we were started
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir("/")
+        sections = monitorconfig.load_monitor_sections(
+            self.path / "monitors.ini", ["monitors.d/*.ini"]
+        )
+        self.assertEqual(sections, self._load())
+
+    def test_duplicate(self):
+        self._write("monitors.d/other.ini", "[main]\ntype=null\n")
+        with self.assertRaises(envconfig.DuplicateSectionError):
+            self._load()
+
+    def test_expansion_cache(self):
+        self._load()
+        # only the changed file is expanded again
+        self._write("monitors.d/other.ini", "[other]\ntype=null\ngap=10\n")
+        with patch.object(
+            monitorconfig, "_expand", wraps=monitorconfig._expand
+        ) as expand:
+            sections = self._load()
+        self.assertEqual(expand.call_count, 1)
+        self.assertEqual(sections["other"]["gap"], "10")
+        self.assertEqual(expand.call_args[0][2], self.path / "monitors.d" / "other.ini")
+
+        # as are files using a changed template file
+        self._write("monitors.d/hosts.txt", "web1\nweb3\n")
+        with patch.object(
+            monitorconfig, "_expand", wraps=monitorconfig._expand
+        ) as expand:
+            sections = self._load()
+        self.assertEqual(expand.call_count, 1)
+        self.assertIn("http-web3", sections)
+        self.assertNotIn("http-web2", sections)
+
+        # and everything, if the main defaults change
+        self._write("monitors.ini", "[defaults]\ngap=30\n\n[main]\ntype=null\n")
+        with patch.object(
+            monitorconfig, "_expand", wraps=monitorconfig._expand
+        ) as expand:
+            sections = self._load()
+        self.assertEqual(expand.call_count, 3)
+        self.assertEqual(sections["http-web1"]["gap"], "30")
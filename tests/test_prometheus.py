@@ -0,0 +1,84 @@
+# type: ignore
+import unittest
+import urllib.error
+import urllib.request
+
+from AntEye.Loggers.prometheus import PrometheusLogger
+from AntEye.Monitors.monitor import MonitorFail, MonitorNull
+from AntEye.util.metrics import REGISTRY
+
+
+class TestPrometheusLogger(unittest.TestCase):
+    def setUp(self):
+        self.logger = PrometheusLogger({"port": "0", "_name": "prometheus"})
+        self.base = "http://127.0.0.1:{}".format(self.logger.port)
+        self.null = MonitorNull("null", {})
+        self.fail = MonitorFail("fail", {"group": "other"})
+        self.null.run_test()
+        self.null.values = {"free_bytes": 1024, "load5": 0.5}
+        self.fail.run_test()
+        self.logger.start_batch()
+        self.logger.save_result2("null", self.null)
+        self.logger.save_result2("fail", self.fail)
+        self.logger.end_batch()
+
+    def tearDown(self):
+        self.logger._stop_server()
+        REGISTRY.enabled = False
+        REGISTRY.clear()
+
+    def _get(self, path):
+        with urllib.request.urlopen(self.base + path, timeout=5) as response:
+            self.assertTrue(
+                response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            )
+            return response.read().decode("utf-8")
+
+    def test_gauges(self):
+        lines = self._get("/metrics").splitlines()
+        self.assertIn("# TYPE anteye_monitor_ok gauge", lines)
+        host = self.null.running_on
+        self.assertIn(
+            'anteye_monitor_ok{{group="default",host="{}",monitor="null"}} 1'.format(
+                host
+            ),
+            lines,
+        )
+        self.assertIn(
+            'anteye_monitor_ok{{group="other",host="{}",monitor="fail"}} 0'.format(
+                host
+            ),
+            lines,
+        )
+        self.assertIn(
+            'anteye_monitor_virtual_fail_count{{group="other",host="{}",'
+            'monitor="fail"}} 1'.format(host),
+            lines,
+        )
+
+    def test_values(self):
+        lines = self._get("/metrics").splitlines()
+        self.assertIn("# TYPE anteye_monitor_value gauge", lines)
+        host = self.null.running_on
+        for (name, value) in [("free_bytes", "1024"), ("load5", "0.5")]:
+            self.assertIn(
+                'anteye_monitor_value{{group="default",host="{}",monitor="null",'
+                'name="{}"}} {}'.format(host, name, value),
+                lines,
+            )
+        self.assertNotIn('monitor="fail",name=', "\n".join(lines))
+
+    def test_timings(self):
+        self.assertNotIn("anteye_loop_seconds", self._get("/metrics"))
+        REGISTRY.enabled = True
+        REGISTRY.observe("anteye_loop_seconds", 0.2)
+        lines = self._get("/metrics").splitlines()
+        self.assertIn("# TYPE anteye_loop_seconds histogram", lines)
+        self.assertIn('anteye_loop_seconds_bucket{le="0.1"} 0', lines)
+        self.assertIn('anteye_loop_seconds_bucket{le="0.25"} 1', lines)
+        self.assertIn("anteye_loop_seconds_count 1", lines)
+
+    def test_not_found(self):
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self._get("/status")
+        self.assertEqual(context.exception.code, 404)
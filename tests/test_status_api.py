@@ -0,0 +1,95 @@
+# type: ignore
+import json
+import socket
+import unittest
+import urllib.error
+import urllib.request
+
+from AntEye.Loggers.status import StatusAPILogger
+from AntEye.Monitors.monitor import MonitorFail, MonitorNull
+
+
+class TestStatusAPILogger(unittest.TestCase):
+    def setUp(self):
+        self.logger = StatusAPILogger({"port": "0", "_name": "status"})
+        self.base = "http://127.0.0.1:{}".format(self.logger.port)
+        self.null = MonitorNull("null", {})
+        self.fail = MonitorFail("fail", {"group": "other"})
+        self.null.run_test()
+        self.fail.run_test()
+        self._log()
+
+    def tearDown(self):
+        self.logger._stop_server()
+
+    def _log(self):
+        self.logger.start_batch()
+        self.logger.save_result2("null", self.null)
+        self.logger.save_result2("fail", self.fail)
+        self.logger.end_batch()
+
+    def _get(self, path, headers=None):
+        request = urllib.request.Request(self.base + path, headers=headers or {})
+        return urllib.request.urlopen(request, timeout=5)
+
+    def test_status(self):
+        response = self._get("/status")
+        data = json.loads(response.read())
+        self.assertEqual(sorted(data["monitors"]), ["fail", "null"])
+        self.assertEqual(data["monitors"]["null"]["status"], "ok")
+        self.assertEqual(data["monitors"]["fail"]["status"], "fail")
+
+    def test_filters(self):
+        data = json.loads(self._get("/status?state=fail").read())
+        self.assertEqual(list(data["monitors"]), ["fail"])
+        data = json.loads(self._get("/status?group=default,other").read())
+        self.assertEqual(sorted(data["monitors"]), ["fail", "null"])
+        data = json.loads(self._get("/status?group=default&state=FAIL").read())
+        self.assertEqual(data["monitors"], {})
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self._get("/status?colour=blue")
+        self.assertEqual(context.exception.code, 400)
+
+    def test_etag(self):
+        etag = self._get("/status").headers["ETag"]
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self._get("/status", {"If-None-Match": etag})
+        self.assertEqual(context.exception.code, 304)
+        # a new loop with the same state still has new results to fetch
+        self.null.run_test()
+        self.null.last_result = "something else"
+        self._log()
+        response = self._get("/status", {"If-None-Match": etag})
+        self.assertEqual(response.status, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        data = json.loads(response.read())
+        self.assertEqual(data["monitors"]["null"]["result"], "something else")
+
+    def test_etag_after_restart(self):
+        etag = self._get("/status").headers["ETag"]
+        self.logger._stop_server()
+        self.logger = StatusAPILogger({"port": "0", "_name": "status"})
+        self.base = "http://127.0.0.1:{}".format(self.logger.port)
+        self._log()
+        response = self._get("/status", {"If-None-Match": etag})
+        self.assertEqual(response.status, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_events(self):
+        sock = socket.create_connection(("127.0.0.1", self.logger.port), timeout=5)
+        sock.sendall(
+            b"GET /events?host=%s HTTP/1.1\r\n\r\n" % self.null.running_on.encode()
+        )
+        stream = sock.makefile("rb")
+        self.assertIn(b"200", stream.readline())
+        while stream.readline().strip():
+            pass
+        self.null.record_fail("oh no")
+        self._log()
+        self.assertTrue(stream.readline().startswith(b"id: "))
+        self.assertEqual(stream.readline(), b"event: change\n")
+        data = json.loads(stream.readline()[len(b"data: ") :])
+        self.assertEqual([x["name"] for x in data], ["null"])
+        self.assertEqual(data[0]["result"], "oh no")
+        stream.close()
+        sock.close()
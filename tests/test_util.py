@@ -1,10 +1,34 @@
 # type: ignore
 import datetime
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
 import unittest
+from pathlib import Path
+from unittest.mock import patch
 
 import arrow
 
 from AntEye import util
+from AntEye.util import commands, loopcache
+from AntEye.util.filetree import FileTree, compile_glob, inotify_available
+from AntEye.util.forecast import TrendEstimator
+from AntEye.util.hostmetrics import HostMetrics
+from AntEye.util.loopcache import LoopCache
+from AntEye.util.metrics import Registry
+from AntEye.util.processes import (
+    ProcessInfo,
+    ProcessSnapshot,
+    ProcessTable,
+    read_proc,
+)
+from AntEye.util.profiler import LoopProfiler
+from AntEye.util import serviceprobe
+from AntEye.util.statestore import StateStore
+from AntEye.util.systemd import UnitInfo, UnitMatcher, UnitSnapshot, UnitTable
 
 
 class TestUtil(unittest.TestCase):
@@ -165,3 +189,743 @@ class TestUpDownTime(unittest.TestCase):
 
         u2 = util.UpDownTime(2, 2, 3, 4)
         self.assertNotEqual(u1, u2)
+
+
+class TestStateStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = Path(self.directory.name) / "state.json"
+        self.store = StateStore(self.filename)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _lines(self):
+        with open(self.filename) as f:
+            return f.readlines()
+
+    def test_missing(self):
+        self.assertEqual(self.store.load(), {})
+
+    def test_append_changes(self):
+        self.store.save({"a": ("null", {"x": 1}), "b": ("null", {"x": 1})})
+        self.store.save({"a": ("null", {"x": 2}), "b": ("null", {"x": 1})})
+        self.assertEqual(len(self._lines()), 3)
+        self.assertEqual(
+            StateStore(self.filename).load(),
+            {"a": ("null", {"x": 2}), "b": ("null", {"x": 1})},
+        )
+
+    def test_volatile(self):
+        self.store.save({"a": ("null", {"x": 1, "runs": 1})}, volatile=["runs"])
+        # only the counter changed, so it waits for a checkpoint
+        self.store.save({"a": ("null", {"x": 1, "runs": 2})}, volatile=["runs"])
+        self.assertEqual(len(self._lines()), 1)
+        self.store.save({"a": ("null", {"x": 2, "runs": 3})}, volatile=["runs"])
+        self.assertEqual(len(self._lines()), 2)
+        self.store.save({"a": ("null", {"x": 2, "runs": 4})}, volatile=["runs"])
+        self.assertEqual(len(self._lines()), 2)
+        self.store.save(
+            {"a": ("null", {"x": 2, "runs": 4})}, volatile=["runs"], checkpoint=True
+        )
+        self.assertEqual(len(self._lines()), 3)
+        self.assertEqual(self.store.load(), {"a": ("null", {"x": 2, "runs": 4})})
+        # and checkpoints happen by themselves every so often
+        self.store.checkpoint_interval = 60
+        self.store.save({"a": ("null", {"x": 2, "runs": 5})}, volatile=["runs"])
+        self.assertEqual(len(self._lines()), 3)
+        with patch("time.time", return_value=time.time() + 61):
+            self.store.save({"a": ("null", {"x": 2, "runs": 6})}, volatile=["runs"])
+        self.assertEqual(len(self._lines()), 4)
+
+    def test_compact(self):
+        self.store.save({"a": ("null", {"x": 1}), "b": ("null", {"x": 1})})
+        self.store.save({"a": ("null", {"x": 2})}, compact=True)
+        self.assertEqual(len(self._lines()), 1)
+        self.assertEqual(self.store.load(), {"a": ("null", {"x": 2})})
+        self.assertEqual(os.listdir(self.directory.name), ["state.json"])
+
+    def test_bad_record(self):
+        self.store.save({"a": ("null", {"x": 1})})
+        with open(self.filename, "a") as f:
+            f.write('{"name": "a", "type": "nu')
+        with self.assertLogs("AntEye.statestore", level="WARNING"):
+            states = StateStore(self.filename).load()
+        self.assertEqual(states, {"a": ("null", {"x": 1})})
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+        self.registry.enabled = True
+
+    def test_disabled(self):
+        self.registry.enabled = False
+        self.registry.observe("anteye_loop_seconds", 1)
+        self.registry.inc("anteye_loop_overruns_total")
+        self.assertEqual(self.registry.render(), [])
+
+    def test_histogram(self):
+        for value in [0.0005, 0.001, 0.3, 100]:
+            self.registry.observe("anteye_monitor_run_seconds", value, monitor="a")
+        lines = self.registry.render()
+        self.assertIn(
+            "# HELP anteye_monitor_run_seconds Time taken by each monitor's test.",
+            lines,
+        )
+        for (bound, count) in [("0.001", 2), ("0.25", 2), ("60.0", 3), ("+Inf", 4)]:
+            self.assertIn(
+                'anteye_monitor_run_seconds_bucket{{monitor="a",le="{}"}} {}'.format(
+                    bound, count
+                ),
+                lines,
+            )
+        self.assertIn('anteye_monitor_run_seconds_count{monitor="a"} 4', lines)
+        self.assertIn('anteye_monitor_run_seconds_sum{monitor="a"} 100.3015', lines)
+
+    def test_counter(self):
+        self.registry.inc("anteye_alerts_total", alerter='say "hi"\n')
+        self.registry.inc("anteye_alerts_total", 2, alerter='say "hi"\n')
+        self.assertIn(
+            'anteye_alerts_total{alerter="say \\"hi\\"\\n"} 3', self.registry.render()
+        )
+
+    def test_forget(self):
+        self.registry.observe("anteye_monitor_run_seconds", 1, monitor="a")
+        self.registry.observe("anteye_monitor_run_seconds", 1, monitor="b")
+        self.registry.forget("monitor", "a")
+        lines = "\n".join(self.registry.render())
+        self.assertNotIn('monitor="a"', lines)
+        self.assertIn('monitor="b"', lines)
+
+
+class TestLoopCache(unittest.TestCase):
+    def setUp(self):
+        self.calls = 0
+
+    def collect(self):
+        self.calls += 1
+        return self.calls
+
+    def test_not_cached_outside_loop(self):
+        cache = LoopCache(self.collect)
+        with patch.object(loopcache, "_loop", 0):
+            self.assertEqual(cache.get(), 1)
+            self.assertEqual(cache.get(), 2)
+
+    def test_cached_per_loop(self):
+        cache = LoopCache(self.collect)
+        with patch.object(loopcache, "_loop", loopcache._loop):
+            loopcache.new_loop()
+            self.assertEqual(cache.get(), 1)
+            self.assertEqual(cache.get(), 1)
+            cache.invalidate()
+            self.assertEqual(cache.get(), 2)
+            loopcache.new_loop()
+            self.assertEqual(cache.get(), 3)
+
+
+class TestProcesses(unittest.TestCase):
+    def test_table(self):
+        table = ProcessTable(
+            [
+                ProcessInfo(1, "init", "/sbin/init", "/sbin/init", "root"),
+                ProcessInfo(2, "python3", "/usr/bin/python3.8", "python3", "www"),
+                ProcessInfo(3, "python3", "/usr/bin/python3.8", "python3", "root"),
+                ProcessInfo(4, "kthreadd"),
+            ]
+        )
+        self.assertEqual([x.pid for x in table.find("init")], [1])
+        self.assertEqual([x.pid for x in table.find("/sbin/init")], [1])
+        self.assertEqual([x.pid for x in table.find("python3.8")], [2, 3])
+        self.assertEqual([x.pid for x in table.find("python3")], [2, 3])
+        self.assertEqual([x.pid for x in table.find("python3", "www")], [2])
+        self.assertEqual([x.pid for x in table.find("kthreadd")], [4])
+        self.assertEqual(table.find("kthreadd", "root"), [])
+        self.assertEqual(table.find("sshd"), [])
+
+    def test_read_proc(self):
+        with tempfile.TemporaryDirectory() as root:
+            processes = {
+                "10": (b"sshd\n", b"/usr/sbin/sshd\0-D\0"),
+                "11": (
+                    b"a-very-long-nam\n",
+                    b"/opt/a-very-long-name\0--flag\0",
+                ),
+                "12": (b"worker\n", b"worker: busy doing things"),
+                "13": (b"kthreadd\n", b""),
+            }
+            for (pid, (comm, cmdline)) in processes.items():
+                os.mkdir(os.path.join(root, pid))
+                with open(os.path.join(root, pid, "comm"), "wb") as file_handle:
+                    file_handle.write(comm)
+                with open(os.path.join(root, pid, "cmdline"), "wb") as file_handle:
+                    file_handle.write(cmdline)
+            os.symlink("/usr/sbin/sshd", os.path.join(root, "10", "exe"))
+            os.mkdir(os.path.join(root, "self"))
+            found = {
+                x.pid: (x.name, x.exe, x.argv0, x.username)
+                for x in read_proc(set(), root)
+            }
+            self.assertEqual(
+                found,
+                {
+                    10: ("sshd", "/usr/sbin/sshd", "/usr/sbin/sshd", None),
+                    11: ("a-very-long-name", None, "/opt/a-very-long-name", None),
+                    12: ("worker", None, "worker:", None),
+                    13: ("kthreadd", None, None, None),
+                },
+            )
+            usernames = {x.username for x in read_proc({"username"}, root)}
+            self.assertEqual(len(usernames), 1)
+            self.assertNotIn(None, usernames)
+
+    def test_read_proc_denied(self):
+        with tempfile.TemporaryDirectory() as root:
+            for pid in ["10", "11"]:
+                os.mkdir(os.path.join(root, pid))
+                for name in ["comm", "cmdline"]:
+                    with open(os.path.join(root, pid, name), "wb") as file_handle:
+                        file_handle.write(b"sshd\n" if name == "comm" else b"sshd\0")
+            real_open = open
+
+            def denying_open(path, *args, **kwargs):
+                # 10 is hidden from us, and 11's command line
+                if path.endswith(os.path.join("10", "comm")) or path.endswith(
+                    os.path.join("11", "cmdline")
+                ):
+                    raise PermissionError(13, "Permission denied", path)
+                return real_open(path, *args, **kwargs)
+
+            with patch("builtins.open", denying_open):
+                found = [(x.pid, x.name, x.argv0) for x in read_proc(set(), root)]
+            self.assertEqual(found, [(11, "sshd", None)])
+
+    def test_snapshot_fields(self):
+        snapshot = ProcessSnapshot("proc")
+        owners = [type("Owner", (), {})() for _ in range(2)]
+        snapshot.require(owners[0], "rss")
+        snapshot.require(owners[1], "username", "rss")
+        self.assertEqual(snapshot.fields(), {"rss", "username"})
+        # a monitor which has gone (e.g. on reload) takes its fields with it
+        del owners[1]
+        self.assertEqual(snapshot.fields(), {"rss"})
+
+
+class TestSystemdUnits(unittest.TestCase):
+    def units(self):
+        return [
+            UnitInfo("ssh.service", "loaded", "active", "running", "/u/ssh"),
+            UnitInfo("getty@tty1.service", "loaded", "active", "running", "/u/tty1"),
+            UnitInfo("getty@tty2.service", "loaded", "failed", "failed", "/u/tty2"),
+        ]
+
+    def test_find(self):
+        table = UnitTable(self.units())
+        self.assertEqual(
+            [x.name for x in table.find(UnitMatcher("ssh.service"))], ["ssh.service"]
+        )
+        self.assertEqual(table.find(UnitMatcher("ssh")), [])
+        self.assertEqual(
+            [x.name for x in table.find(UnitMatcher("getty@*.service"))],
+            ["getty@tty1.service", "getty@tty2.service"],
+        )
+
+    def test_watched(self):
+        reads = []
+
+        def read():
+            reads.append(1)
+            return self.units()
+
+        snapshot = UnitSnapshot(read)
+        snapshot._watching = True
+        unit = snapshot.table().find(UnitMatcher("ssh.service"))[0]
+        changed = {"ActiveState": "deactivating", "SubState": "stop-sigterm"}
+        snapshot._signal(
+            "",
+            "/u/ssh",
+            "",
+            "PropertiesChanged",
+            ("org.freedesktop.systemd1.Unit", changed, []),
+        )
+        self.assertEqual(unit.active_state, "deactivating")
+        # other interfaces' changes are ignored
+        snapshot._signal(
+            "", "/u/ssh", "", "PropertiesChanged", ("other", {"SubState": "x"}, [])
+        )
+        self.assertEqual(unit.sub_state, "stop-sigterm")
+        self.assertIs(snapshot.table().units["ssh.service"], unit)
+        self.assertEqual(len(reads), 1)
+        # a new unit means listing them all again
+        snapshot._signal("", "/", "", "UnitNew", ("new.service", "/u/new"))
+        self.assertEqual(snapshot.table().units["ssh.service"].active_state, "active")
+        self.assertEqual(len(reads), 2)
+
+
+class TestCommands(unittest.TestCase):
+    def python(self, code):
+        return [sys.executable, "-c", code]
+
+    def test_run(self):
+        result = commands.run(self.python("print('hello'); raise SystemExit(2)"))
+        self.assertEqual((result.returncode, result.output), (2, b"hello\n"))
+        self.assertFalse(result.truncated)
+        with self.assertRaises(subprocess.CalledProcessError) as context:
+            commands.check_output(self.python("raise SystemExit(1)"))
+        self.assertEqual(context.exception.returncode, 1)
+        with self.assertRaises(OSError):
+            commands.run(["/no/such/command"])
+        # no limit, rather than no time at all
+        result = commands.run(self.python("print('slow')"), timeout=0)
+        self.assertEqual((result.returncode, result.output), (0, b"slow\n"))
+
+    def test_limit(self):
+        result = commands.run(
+            self.python("import sys; sys.stdout.write('x' * 100000)"), limit=1000
+        )
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.output, b"x" * 1000)
+        self.assertTrue(result.truncated)
+
+    @unittest.skipUnless(os.name == "posix", "needs process groups")
+    def test_timeout(self):
+        # the command's own children go too
+        code = (
+            "import subprocess, sys\n"
+            "child = subprocess.Popen([sys.executable, '-c', "
+            "'import time; time.sleep(30)'])\n"
+            "print(child.pid, flush=True)\n"
+            "child.wait()\n"
+        )
+        start = time.time()
+        with self.assertRaises(subprocess.TimeoutExpired) as context:
+            commands.run(self.python(code), timeout=1)
+        self.assertLess(time.time() - start, 10)
+        child = int(context.exception.output)
+        for _ in range(50):
+            try:
+                os.kill(child, 0)
+            except ProcessLookupError:
+                break
+            time.sleep(0.1)
+        else:
+            self.fail("child process was not killed")
+
+    @unittest.skipUnless(os.name == "posix", "needs sessions")
+    def test_left_running(self):
+        # something left running with our output doesn't hold us up
+        code = (
+            "import subprocess, sys\n"
+            "subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(5)'], "
+            "start_new_session=True)\n"
+            "print('started')\n"
+        )
+        start = time.time()
+        result = commands.run(self.python(code))
+        self.assertLess(time.time() - start, 4)
+        self.assertEqual(result.output, b"started\n")
+
+    def test_max_running(self):
+        with self.assertRaises(ValueError):
+            commands.set_max_running(0)
+        try:
+            commands.set_max_running(1)
+            self.assertEqual(commands.max_running(), 1)
+            self.assertEqual(commands.call(self.python("pass")), 0)
+        finally:
+            commands.set_max_running(commands.DEFAULT_MAX_RUNNING)
+
+
+class TestServiceProbe(unittest.TestCase):
+    def command(self, code, timeout=10.0):
+        return ((sys.executable, "-c", code), timeout)
+
+    class Owner:
+        def __init__(self, wants=True):
+            self.wants = wants
+
+        def wants_status(self):
+            return self.wants
+
+    def test_batch(self):
+        probe = serviceprobe.StatusProbe()
+        owners = [self.Owner() for _ in range(4)]
+        commands = [
+            self.command("print('running')"),
+            self.command("import sys; sys.exit(3)"),
+            self.command("import time; time.sleep(5)", timeout=0.2),
+            (("/no/such/status",), 10.0),
+        ]
+        for (owner, command) in zip(owners, commands):
+            probe.register(owner, command)
+        with patch.object(loopcache, "_loop", loopcache._loop):
+            loopcache.new_loop()
+            results = [probe.result(command) for command in commands]
+            self.assertEqual(
+                [(x.returncode, x.output) for x in results[:2]],
+                [(0, "running"), (3, "")],
+            )
+            self.assertIsNone(results[2].returncode)
+            self.assertEqual(results[2].error, "timed out after 0.2s")
+            self.assertIsNone(results[3].returncode)
+            # the same results for the rest of the loop
+            self.assertIs(probe.result(commands[0]), results[0])
+            loopcache.new_loop()
+            self.assertIsNot(probe.result(commands[0]), results[0])
+        # a monitor which has gone takes its command with it
+        del owners[0]
+        self.assertNotIn(commands[0], probe._commands.values())
+
+    def test_wanted(self):
+        probe = serviceprobe.StatusProbe()
+        (due, not_due) = (self.Owner(), self.Owner(wants=False))
+        (first, second, third) = [self.command(str(x)) for x in range(3)]
+        probe.register(due, first)
+        probe.register(not_due, second)
+        ran = []
+
+        def run_status(command):
+            ran.append(command)
+            return serviceprobe.StatusResult(0)
+
+        with patch.object(serviceprobe, "run_status", side_effect=run_status):
+            with patch.object(loopcache, "_loop", loopcache._loop):
+                loopcache.new_loop()
+                # asking for one command runs those of the owners which want
+                # theirs, and no others
+                probe.result(third)
+                self.assertEqual(sorted(ran), sorted([first, third]))
+                probe.result(first)
+                self.assertEqual(len(ran), 2)
+                probe.result(second)
+                self.assertEqual(ran[2:], [second])
+
+    def test_systemd(self):
+        output = (
+            b"ssh.service loaded active running OpenBSD Secure Shell server\n"
+            b"\xe2\x97\x8f nginx.service loaded failed failed A web server\n"
+        )
+        with patch.object(serviceprobe.commands, "check_output", return_value=output):
+            with patch.object(loopcache, "_loop", 0):
+                self.assertEqual(serviceprobe.systemd_status("ssh"), 0)
+                self.assertEqual(serviceprobe.systemd_status("nginx.service"), 3)
+                self.assertIsNone(serviceprobe.systemd_status("sshd"))
+
+    @unittest.skipUnless(hasattr(os, "mkfifo"), "needs fifos")
+    def test_supervise(self):
+        directory = tempfile.mkdtemp()
+        try:
+            self.assertFalse(serviceprobe.supervise_running(directory))
+            os.mkdir(os.path.join(directory, "supervise"))
+            fifo = os.path.join(directory, "supervise", "ok")
+            os.mkfifo(fifo)
+            self.assertFalse(serviceprobe.supervise_running(directory))
+            reader = os.open(fifo, os.O_RDONLY | os.O_NONBLOCK)
+            try:
+                self.assertTrue(serviceprobe.supervise_running(directory))
+            finally:
+                os.close(reader)
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestHostMetrics(unittest.TestCase):
+    def setUp(self):
+        self._root = tempfile.TemporaryDirectory()
+        self.root = self._root.name
+        self.addCleanup(self._root.cleanup)
+        files = {
+            "loadavg": "0.50 1.25 2.00 1/123 4567\n",
+            "meminfo": "MemTotal: 1000 kB\nMemFree: 100 kB\n"
+            "MemAvailable: 250 kB\nSwapTotal: 400 kB\nSwapFree: 100 kB\n"
+            "HugePages_Total: 0\n",
+            "pressure/memory": "some avg10=1.50 avg60=0.75 avg300=0.10 total=123\n"
+            "full avg10=0.00 avg60=0.00 avg300=0.00 total=0\n",
+            "self/mounts": "/dev/vda1 / ext4 rw 0 0\n"
+            "tmpfs {0}/my\\040disk tmpfs rw 0 0\n".format(self.root),
+        }
+        os.makedirs(os.path.join(self.root, "pressure"))
+        os.makedirs(os.path.join(self.root, "self"))
+        os.makedirs(os.path.join(self.root, "my disk", "sub"))
+        for (name, content) in files.items():
+            with open(os.path.join(self.root, name), "w") as file_handle:
+                file_handle.write(content)
+        self.metrics = HostMetrics(self.root)
+
+    def test_proc(self):
+        self.assertTrue(self.metrics.use_proc)
+        self.assertEqual(self.metrics.loadavg(), (0.5, 1.25, 2.0))
+        self.assertEqual(self.metrics.memory(), (1024000, 256000))
+        self.assertEqual(self.metrics.swap(), (409600, 102400))
+        self.assertEqual(self.metrics.meminfo()["HugePages_Total"], 0)
+        self.assertEqual(
+            self.metrics.pressure("memory"),
+            {
+                "some_avg10": 1.5,
+                "some_avg60": 0.75,
+                "some_avg300": 0.1,
+                "full_avg10": 0.0,
+                "full_avg60": 0.0,
+                "full_avg300": 0.0,
+            },
+        )
+        self.assertEqual(self.metrics.pressure("io"), {})
+
+    def test_mounts(self):
+        disk = os.path.join(self.root, "my disk")
+        self.assertEqual(self.metrics.mount_point(os.path.join(disk, "sub")), disk)
+        self.assertEqual(self.metrics.mount_point(disk), disk)
+        self.assertEqual(self.metrics.mount_point(self.root), "/")
+        with self.assertRaises(FileNotFoundError):
+            self.metrics.mount_point(os.path.join(self.root, "nothing"))
+        with patch("os.statvfs", return_value="result") as statvfs:
+            self.assertEqual(self.metrics.statvfs(disk), "result")
+            self.assertEqual(self.metrics.statvfs(os.path.join(disk, "sub")), "result")
+            statvfs.assert_called_once_with(disk)
+
+
+class TestTrendEstimator(unittest.TestCase):
+    def test_slope(self):
+        trend = TrendEstimator(3)
+        trend.add(1000.0, 500.0)
+        trend.add(1010.0, 400.0)
+        self.assertIsNone(trend.slope())
+        trend.add(1020.0, 300.0)
+        self.assertEqual(trend.slope(), -10.0)
+        self.assertEqual(trend.time_to_zero(300.0), 30.0)
+        # the oldest sample drops out of the ring
+        trend.add(1030.0, 300.0)
+        self.assertEqual(trend.slope(), -5.0)
+        trend.add(1040.0, 300.0)
+        self.assertEqual(trend.slope(), 0.0)
+        self.assertIsNone(trend.time_to_zero(300.0))
+
+    def test_noisy(self):
+        trend = TrendEstimator(4)
+        for (when, value) in [(0, 100), (10, 92), (20, 78), (30, 70)]:
+            trend.add(when, value)
+        self.assertAlmostEqual(trend.slope(), -1.04)
+
+    def test_size(self):
+        with self.assertRaises(ValueError):
+            TrendEstimator(2)
+
+
+class TestFileTree(unittest.TestCase):
+    def setUp(self):
+        self._root = tempfile.TemporaryDirectory()
+        self.root = self._root.name
+        self.addCleanup(self._root.cleanup)
+        self.write("a.log", 10)
+        self.write("sub/b.log", 20)
+        self.write("sub/deeper/c.txt", 30)
+
+    def write(self, name, size):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as file_handle:
+            file_handle.write("x" * size)
+
+    def sizes(self, tree):
+        return {
+            os.path.relpath(path, self.root): size
+            for (path, (size, _)) in tree.scan().items()
+        }
+
+    def test_compile_glob(self):
+        (base, depth, match) = compile_glob("/backups/*/daily-*.tar.gz")
+        self.assertEqual((base, depth), ("/backups", 1))
+        self.assertTrue(match("host/daily-1.tar.gz"))
+        self.assertFalse(match("daily-1.tar.gz"))
+        self.assertFalse(match("host/old/daily-1.tar.gz"))
+        self.assertFalse(match(".host/daily-1.tar.gz"))
+        (base, depth, match) = compile_glob("/var/log/**/*.log")
+        self.assertEqual((base, depth), ("/var/log", None))
+        self.assertTrue(match("syslog.log"))
+        self.assertTrue(match("nginx/old/access.log"))
+        self.assertFalse(match(".cache/x.log"))
+
+    def test_scan(self):
+        tree = FileTree(self.root)
+        self.assertEqual(
+            self.sizes(tree), {"a.log": 10, "sub/b.log": 20, "sub/deeper/c.txt": 30}
+        )
+        self.write("sub/b.log", 25)
+        self.write("sub/new.log", 5)
+        os.unlink(os.path.join(self.root, "a.log"))
+        self.assertEqual(
+            self.sizes(tree),
+            {"sub/b.log": 25, "sub/new.log": 5, "sub/deeper/c.txt": 30},
+        )
+
+    def test_unchanged_directories_not_reread(self):
+        tree = FileTree(self.root)
+        tree.scan()
+        with patch("os.scandir") as scandir:
+            self.write("sub/b.log", 25)
+            self.assertEqual(self.sizes(tree)["sub/b.log"], 25)
+            scandir.assert_not_called()
+
+    def test_depth_and_match(self):
+        tree = FileTree(self.root, 1, lambda x: x.endswith(".log"))
+        self.assertEqual(self.sizes(tree), {"a.log": 10, "sub/b.log": 20})
+
+    def test_missing(self):
+        tree = FileTree(os.path.join(self.root, "nothing"))
+        with self.assertRaises(FileNotFoundError):
+            tree.scan()
+
+    @unittest.skipUnless(inotify_available(), "needs inotify")
+    def test_inotify(self):
+        tree = FileTree(self.root, use_inotify=True)
+        self.addCleanup(tree.close)
+        self.assertEqual(len(self.sizes(tree)), 3)
+        self.write("sub/b.log", 25)
+        self.write("new/d.log", 40)
+        os.unlink(os.path.join(self.root, "a.log"))
+        with patch("os.scandir", wraps=os.scandir) as scandir:
+            self.assertEqual(
+                self.sizes(tree),
+                {"sub/b.log": 25, "sub/deeper/c.txt": 30, "new/d.log": 40},
+            )
+            # only the new directory was read
+            scandir.assert_called_once_with(os.path.join(self.root, "new"))
+        shutil.rmtree(os.path.join(self.root, "sub"))
+        self.assertEqual(self.sizes(tree), {"new/d.log": 40})
+
+
+class TestLoopProfiler(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _loop(self, profiler, duration=0.05):
+        profiler.start()
+        profiler.record("monitor", "fast", 0.001)
+        profiler.record("monitor", "slow", 0.04)
+        profiler.record("logger", "logfile", 0.002)
+        time.sleep(duration)
+        return profiler.stop(duration, 60)
+
+    def test_sample(self):
+        report = self._loop(LoopProfiler(self.path, interval=0.005))
+        self.assertEqual(
+            sorted(os.listdir(self.directory.name)),
+            [report.stem + ".folded", report.name],
+        )
+        with open(report) as f:
+            text = f.read()
+        self.assertRegex(text, r"slowest monitors:\n +0.0400s  slow\n +0.0010s  fast\n")
+        self.assertIn("top call sites", text)
+        with open(self.path / (report.stem + ".folded")) as f:
+            stacks = f.read()
+        self.assertRegex(stacks, r";test_util:_loop \d+\n")
+
+    def test_cprofile(self):
+        report = self._loop(LoopProfiler(self.path, mode="cprofile"))
+        self.assertIn(report.stem + ".pstats", os.listdir(self.directory.name))
+
+    def test_threshold_and_rotation(self):
+        profiler = LoopProfiler(self.path, keep=2, threshold=0.02)
+        self.assertIsNone(self._loop(profiler, duration=0.01))
+        self.assertEqual(os.listdir(self.directory.name), [])
+        reports = [self._loop(profiler) for _ in range(3)]
+        self.assertEqual(
+            sorted(x for x in os.listdir(self.directory.name) if x.endswith(".txt")),
+            [reports[1].name, reports[2].name],
+        )
+
+    def test_bad_mode(self):
+        with self.assertRaises(ValueError):
+            LoopProfiler(self.path, mode="guess")
+
+    def test_private_directory(self):
+        profiler = LoopProfiler()
+        report = self._loop(profiler)
+        self.addCleanup(shutil.rmtree, str(profiler.directory))
+        self.assertTrue(profiler.temporary)
+        self.assertEqual(report.parent, profiler.directory)
+        self.assertEqual(os.stat(str(profiler.directory)).st_mode & 0o777, 0o700)
+
+    @unittest.skipUnless(hasattr(os, "geteuid"), "needs POSIX ownership")
+    def test_shared_directory(self):
+        # somewhere others could have planted files or symlinks
+        os.chmod(self.directory.name, 0o777)
+        with self.assertLogs("AntEye.profiler", level="ERROR"):
+            self.assertIsNone(self._loop(LoopProfiler(self.path)))
+        os.chmod(self.directory.name, 0o700)
+        os.symlink(self.directory.name, str(self.path / "link"))
+        with self.assertLogs("AntEye.profiler", level="ERROR"):
+            self.assertIsNone(self._loop(LoopProfiler(self.path / "link")))
+        self.assertEqual(os.listdir(self.directory.name), ["link"])
+
+
+class TestLazyRegistry(unittest.TestCase):
+    def _run(self, code):
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stdout)
+
+    def test_no_plugins_imported(self):
+        self._run(
+            "import sys\n"
+            "import AntEye.AntEye\n"
+            "loaded = [m for m in ['AntEye.Monitors.network', 'AntEye.Loggers.mqtt', "
+            "'AntEye.Alerters.bulksms', 'requests'] if m in sys.modules]\n"
+            "assert not loaded, loaded\n"
+        )
+
+    def test_types_complete(self):
+        # every type registered by a plugin module must be in its lazy map
+        self._run(
+            "import importlib, pkgutil\n"
+            "import AntEye.AntEye\n"
+            "from AntEye.Monitors import monitor\n"
+            "from AntEye.Loggers import logger\n"
+            "from AntEye.Alerters import alerter\n"
+            "for base in (monitor, logger, alerter):\n"
+            "    package = base.__name__.rpartition('.')[0]\n"
+            "    before = base.all_types()\n"
+            "    path = importlib.import_module(package).__path__\n"
+            "    for info in pkgutil.iter_modules(path):\n"
+            "        try:\n"
+            "            importlib.import_module(package + '.' + info.name)\n"
+            "        except ImportError:\n"
+            "            pass\n"
+            "    assert base.all_types() == before, (before, base.all_types())\n"
+        )
+
+    def test_get_class(self):
+        from AntEye.Loggers import logger
+        from AntEye.Monitors import monitor
+
+        self.assertEqual(monitor.get_class("http").monitor_type, "http")
+        self.assertEqual(logger.get_class("logfile").logger_type, "logfile")
+        self.assertIn("http", monitor.all_types())
+        with self.assertRaises(KeyError):
+            monitor.get_class("not-a-monitor")
+
+    def test_package_exports(self):
+        self._run(
+            "import sys\n"
+            "import AntEye.Monitors\n"
+            "assert 'AntEye.Monitors.network' not in sys.modules\n"
+            "from AntEye.Monitors import MonitorHTTP\n"
+            "from AntEye.Loggers import Listener\n"
+            "assert MonitorHTTP.__module__ == 'AntEye.Monitors.network'\n"
+            "assert Listener.__module__ == 'AntEye.Loggers.network'\n"
+            "try:\n"
+            "    from AntEye.Monitors import MonitorNothing\n"
+            "except ImportError:\n"
+            "    pass\n"
+            "else:\n"
+            "    assert False\n"
+        )